@@ -1,8 +1,13 @@
 """ Make REST API requests """
-from typing import Any, Dict, Iterable, Optional, Protocol
+import asyncio
+import weakref
+from typing import (Any, AsyncIterator, Awaitable, Callable, Dict, Iterable,
+                    Optional, Protocol, Tuple)
+from urllib import parse
 
 import aiohttp
 
+from gcpdiag import config
 from gcpdiag.queries import apis_utils
 
 
@@ -24,33 +29,130 @@ class RetryStrategy(Protocol):
     pass
 
 
-class API:
-  """ Class abstracting aspects of REST API requests """
+class RateLimiter(Protocol):
+
+  async def acquire(self, url: str) -> None:
+    pass
+
 
-  def __init__(self, creds: Creds, retry_strategy: RetryStrategy,
-               sleeper: Sleeper) -> None:
+class API:
+  """ Class abstracting aspects of REST API requests
+
+  All requests of an event loop share a pooled aiohttp.ClientSession (with
+  keep-alive, DNS caching and a per-host connection limit), and the number of
+  concurrent requests is limited by a semaphore. The session is bound to the
+  event loop, so a new one is created when the API is used in another event
+  loop, and it should be closed with close() before the event loop ends.
+  """
+
+  _session: Optional[aiohttp.ClientSession]
+  _semaphore: Optional[asyncio.Semaphore]
+  _loop: Optional[asyncio.AbstractEventLoop]
+
+  def __init__(self,
+               creds: Creds,
+               retry_strategy: RetryStrategy,
+               sleeper: Sleeper,
+               rate_limiter: Optional[RateLimiter] = None) -> None:
     self._creds = creds
     self._retry_strategy = retry_strategy
     self._sleeper = sleeper
+    self._rate_limiter = rate_limiter
+    self._session = None
+    self._semaphore = None
+    self._loop = None
+    _apis.add(self)
 
   async def call(self,
                  method: str,
                  url: str,
                  json: Optional[Any] = None) -> Any:
+    session, semaphore = self._get_session()
     for timeout in self._retry_strategy.get_sleep_intervals():
-      async with aiohttp.request(method,
-                                 url,
-                                 headers=self._get_headers(),
-                                 json=json) as resp:
-        if resp.status == 200:
-          return await resp.json()
-        if not apis_utils.should_retry(resp.status):
-          raise RuntimeError(
-              f'http status {resp.status} calling {method} {url}')
+      if self._rate_limiter is not None:
+        await self._rate_limiter.acquire(url)
+      async with semaphore:
+        async with session.request(method,
+                                   url,
+                                   headers=self._get_headers(),
+                                   json=json) as resp:
+          if resp.status == 200:
+            return await resp.json()
+          if not apis_utils.should_retry(resp.status):
+            raise RuntimeError(
+                f'http status {resp.status} calling {method} {url}')
       await self._sleeper.sleep(timeout)
     raise RuntimeError('failed to get an API response')
 
+  def paginate(self,
+               method: str,
+               url: str,
+               json: Optional[Any] = None) -> AsyncIterator[Any]:
+    """Call a list method and yield every page of the response."""
+    return iter_pages(self.call, method, url, json)
+
+  async def close(self) -> None:
+    if self._session is not None:
+      await self._session.close()
+    self._session = None
+    self._semaphore = None
+    self._loop = None
+
+  def _get_session(self) -> Tuple[aiohttp.ClientSession, asyncio.Semaphore]:
+    loop = asyncio.get_running_loop()
+    if self._session is None or self._session.closed or self._loop is not loop:
+      connector = aiohttp.TCPConnector(
+          limit=config.ASYNC_API_MAX_CONCURRENT_REQUESTS,
+          limit_per_host=config.ASYNC_API_MAX_CONNECTIONS_PER_HOST,
+          ttl_dns_cache=config.ASYNC_API_DNS_CACHE_SECONDS)
+      self._session = aiohttp.ClientSession(connector=connector)
+      self._semaphore = asyncio.Semaphore(
+          config.ASYNC_API_MAX_CONCURRENT_REQUESTS)
+      self._loop = loop
+    assert self._semaphore is not None
+    return self._session, self._semaphore
+
   def _get_headers(self) -> Dict[str, str]:
     headers: Dict[str, str] = {}
     self._creds.update_headers(headers)
     return headers
+
+
+async def iter_pages(call: Callable[..., Awaitable[Any]],
+                     method: str,
+                     url: str,
+                     json: Optional[Any] = None) -> AsyncIterator[Any]:
+  """Yield the pages of a list method, following nextPageToken.
+
+  The pageToken is passed in the query string for GET requests and in the
+  request body otherwise."""
+  while True:
+    page = await call(method=method, url=url, json=json)
+    yield page
+    page_token = page.get('nextPageToken') if isinstance(page, dict) else None
+    if not page_token:
+      return
+    if method == 'GET':
+      url = _set_query_param(url, 'pageToken', page_token)
+    else:
+      json = dict(json or {}, pageToken=page_token)
+
+
+# All API instances, so that their sessions can be closed with close_sessions().
+_apis: 'weakref.WeakSet[API]' = weakref.WeakSet()
+
+
+async def close_sessions() -> None:
+  """Close the sessions of all API instances opened in the current event loop."""
+  loop = asyncio.get_running_loop()
+  for api in list(_apis):
+    # pylint: disable=protected-access
+    if api._loop is loop:
+      await api.close()
+
+
+def _set_query_param(url: str, name: str, value: str) -> str:
+  parts = parse.urlsplit(url)
+  query = [(k, v) for k, v in parse.parse_qsl(parts.query) if k != name]
+  query.append((name, value))
+  return parse.urlunsplit(parts._replace(query=parse.urlencode(query)))
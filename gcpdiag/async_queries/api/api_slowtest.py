@@ -49,6 +49,7 @@ class TestAPI(unittest.IsolatedAsyncioTestCase):
     await self._server.start()
 
   async def asyncTearDown(self) -> None:
+    await self._api.close()
     await self._server.stop()
 
   async def test_get_response(self) -> None:
@@ -101,3 +102,36 @@ class TestAPI(unittest.IsolatedAsyncioTestCase):
       await self._api.call(method='GET',
                            url=f'http://localhost:{self._port}/test')
     self.assertListEqual(self._sleeper.slept, [])
+
+  async def test_session_reused(self) -> None:
+    self._server.responses = [
+        test_webserver.Success({'hello': 'world'}),
+        test_webserver.Success({'hello': 'again'})
+    ]
+    await self._api.call(method='GET',
+                         url=f'http://localhost:{self._port}/test')
+    # pylint: disable=protected-access
+    session = self._api._session
+    await self._api.call(method='GET',
+                         url=f'http://localhost:{self._port}/test')
+    self.assertIs(self._api._session, session)
+
+  async def test_paginate(self) -> None:
+    self._server.responses = [
+        test_webserver.Success({
+            'items': [1, 2],
+            'nextPageToken': 'page2'
+        }),
+        test_webserver.Success({'items': [3]})
+    ]
+    pages = [
+        page async for page in self._api.paginate(
+            method='GET', url=f'http://localhost:{self._port}/test?a=b')
+    ]
+    self.assertListEqual([p['items'] for p in pages], [[1, 2], [3]])
+    self.assertListEqual(self._server.queries, [{
+        'a': 'b'
+    }, {
+        'a': 'b',
+        'pageToken': 'page2'
+    }])
@@ -2,7 +2,8 @@
 from gcpdiag import config
 from gcpdiag.async_queries.api import (api, default_random,
                                        exponential_random_retry_strategy,
-                                       gcpdiag_creds, sleeper)
+                                       gcpdiag_creds, sleeper,
+                                       token_bucket_rate_limiter)
 
 
 def pick_creds_implementation() -> api.Creds:
@@ -25,4 +26,9 @@ def get_api() -> api.API:
                      random_pct=config.API_RETRY_SLEEP_RANDOMNESS_PCT,
                      multiplier=config.API_RETRY_SLEEP_MULTIPLIER,
                      random=default_random.Random()),
-                 sleeper=sleeper.Sleeper())
+                 sleeper=sleeper.Sleeper(),
+                 rate_limiter=token_bucket_rate_limiter.TokenBucketRateLimiter(
+                     requests_per_second=config.
+                     ASYNC_API_RATELIMIT_REQUESTS_PER_SECOND,
+                     burst=config.ASYNC_API_RATELIMIT_BURST,
+                     sleeper=sleeper.Sleeper()))
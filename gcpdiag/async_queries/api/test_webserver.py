@@ -1,5 +1,5 @@
 """ Simple web server used for testing """
-from typing import Any, List, Protocol
+from typing import Any, Dict, List, Protocol
 
 from aiohttp import web
 
@@ -51,6 +51,7 @@ class WebServer:
   def __init__(self, port: int, expected_auth_token: str) -> None:
     self.port = port
     self.responses = []
+    self.queries: List[Dict[str, str]] = []
     self.expected_auth_token = expected_auth_token
 
   async def start(self) -> None:
@@ -62,6 +63,7 @@ class WebServer:
       assert len(self.responses) > 0
       assert request.headers[
           'test_auth'] == f'test_auth {self.expected_auth_token}'
+      self.queries.append(dict(request.query))
       return self.responses.pop(0).get_response()
 
     app = web.Application()
@@ -0,0 +1,70 @@
+""" Rate limiting of API requests with a token bucket per service """
+import time
+from typing import Callable, Dict, Protocol
+from urllib import parse
+
+
+class Sleeper(Protocol):
+
+  async def sleep(self, seconds: float) -> None:
+    pass
+
+
+class TokenBucket:
+  """
+    Token bucket refilled with `rate` tokens per second, up to `capacity`
+  """
+
+  _rate: float
+  _capacity: float
+  _tokens: float
+  _last_refill: float
+
+  def __init__(self, rate: float, capacity: float, sleeper: Sleeper,
+               clock: Callable[[], float]) -> None:
+    self._rate = rate
+    self._capacity = capacity
+    self._sleeper = sleeper
+    self._clock = clock
+    self._tokens = capacity
+    self._last_refill = clock()
+
+  async def acquire(self) -> None:
+    while True:
+      now = self._clock()
+      self._tokens = min(self._capacity,
+                         self._tokens + (now - self._last_refill) * self._rate)
+      self._last_refill = now
+      if self._tokens >= 1:
+        self._tokens -= 1
+        return
+      await self._sleeper.sleep((1 - self._tokens) / self._rate)
+
+
+class TokenBucketRateLimiter:
+  """
+    Rate limiter with a separate token bucket for every service (API host),
+    so that a busy service doesn't slow down the requests to other services
+  """
+
+  _buckets: Dict[str, TokenBucket]
+
+  def __init__(self,
+               requests_per_second: float,
+               burst: float,
+               sleeper: Sleeper,
+               clock: Callable[[], float] = time.monotonic) -> None:
+    self._requests_per_second = requests_per_second
+    self._burst = burst
+    self._sleeper = sleeper
+    self._clock = clock
+    self._buckets = {}
+
+  async def acquire(self, url: str) -> None:
+    service = parse.urlsplit(url).netloc
+    if service not in self._buckets:
+      self._buckets[service] = TokenBucket(rate=self._requests_per_second,
+                                           capacity=self._burst,
+                                           sleeper=self._sleeper,
+                                           clock=self._clock)
+    await self._buckets[service].acquire()
@@ -0,0 +1,60 @@
+""" Tests for TokenBucketRateLimiter """
+
+import unittest
+from typing import List
+
+from gcpdiag.async_queries.api import token_bucket_rate_limiter
+
+
+class FakeClock:
+  """ Test double for the clock, advanced by FakeSleeper """
+  now: float
+
+  def __init__(self) -> None:
+    self.now = 0.0
+
+  def __call__(self) -> float:
+    return self.now
+
+
+class FakeSleeper:
+  slept: List[float]
+
+  def __init__(self, clock: FakeClock) -> None:
+    self.clock = clock
+    self.slept = []
+
+  async def sleep(self, seconds: float) -> None:
+    self.clock.now += seconds
+    self.slept.append(seconds)
+
+
+class TestTokenBucketRateLimiter(unittest.IsolatedAsyncioTestCase):
+  """ Tests for TokenBucketRateLimiter """
+
+  def setUp(self) -> None:
+    self.clock = FakeClock()
+    self.sleeper = FakeSleeper(self.clock)
+    self.limiter = token_bucket_rate_limiter.TokenBucketRateLimiter(
+        requests_per_second=2, burst=3, sleeper=self.sleeper, clock=self.clock)
+
+  async def test_burst(self) -> None:
+    for _ in range(3):
+      await self.limiter.acquire('https://dataproc.googleapis.com/v1/x')
+    self.assertListEqual(self.sleeper.slept, [])
+    await self.limiter.acquire('https://dataproc.googleapis.com/v1/x')
+    self.assertListEqual(self.sleeper.slept, [0.5])
+
+  async def test_refill(self) -> None:
+    for _ in range(3):
+      await self.limiter.acquire('https://dataproc.googleapis.com/v1/x')
+    self.clock.now += 1
+    for _ in range(2):
+      await self.limiter.acquire('https://dataproc.googleapis.com/v1/x')
+    self.assertListEqual(self.sleeper.slept, [])
+
+  async def test_services_limited_separately(self) -> None:
+    for _ in range(3):
+      await self.limiter.acquire('https://dataproc.googleapis.com/v1/x')
+    await self.limiter.acquire('https://compute.googleapis.com/compute/v1/x')
+    self.assertListEqual(self.sleeper.slept, [])
@@ -22,11 +22,14 @@ class Region:
 
   async def load(self) -> None:
     assert self._data is None
-    self._data = await self._api.call(
+    clusters = []
+    async for page in self._api.paginate(
         method='GET',
         url=
         'https://dataproc.googleapis.com/v1/projects/{project_id}/regions/{region}/clusters'
-        .format(project_id=self._project_id, region=self._region))
+        .format(project_id=self._project_id, region=self._region)):
+      clusters.extend(page.get('clusters', []))
+    self._data = {'clusters': clusters}
 
   @functools.cached_property
   def clusters(self) -> List[dataproc.Cluster]:
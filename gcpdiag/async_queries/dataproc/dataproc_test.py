@@ -71,3 +71,25 @@ class TestProjectRegions(unittest.IsolatedAsyncioTestCase):
     await asyncio.gather(self.dataproc.get_cluster_by_name('westeros1'),
                          self.dataproc.get_cluster_by_name('westeros1'))
     self.assertEqual(1, self.api.count_calls(self.westeros_list_call))
+
+  async def test_pagination(self) -> None:
+    essos_page2_call = fake_api.APICall(
+        'GET',
+        'https://dataproc.googleapis.com/v1/projects/test-project/regions/essos-east2/clusters?pageToken=page2'
+    )
+    self.api.responses = [
+        (self.westeros_list_call, {}),
+        (self.essos_list_call, {
+            'clusters': [{
+                'clusterName': 'essos1'
+            }],
+            'nextPageToken': 'page2'
+        }),
+        (essos_page2_call, {
+            'clusters': [{
+                'clusterName': 'essos2'
+            }]
+        }),
+    ]
+    clusters = await self.dataproc.list_clusters()
+    self.assertListEqual(['essos1', 'essos2'], clusters)
@@ -1,6 +1,8 @@
 'Testing double for gcpdiag.async_queries.api.API'
 from asyncio import sleep
-from typing import Any, List, Optional, Tuple
+from typing import Any, AsyncIterator, List, Optional, Tuple
+
+from gcpdiag.async_queries.api import api
 
 
 class APICall:
@@ -40,6 +42,12 @@ class FakeAPI:
     self.calls.append(call)
     return self.get_response(call)
 
+  def paginate(self,
+               method: str,
+               url: str,
+               json: Optional[Any] = None) -> AsyncIterator[Any]:
+    return api.iter_pages(self.call, method, url, json)
+
   def get_response(self, call: APICall) -> Any:
     for c, r in self.responses:
       if c == call:
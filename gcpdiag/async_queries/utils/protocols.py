@@ -1,6 +1,6 @@
 """ Common protocols used by async queries """
 
-from typing import Any, Iterable, Optional, Protocol
+from typing import Any, AsyncIterator, Iterable, Optional, Protocol
 
 
 class API(Protocol):
@@ -11,6 +11,12 @@ class API(Protocol):
                  json: Optional[Any] = None) -> Any:
     pass
 
+  def paginate(self,
+               method: str,
+               url: str,
+               json: Optional[Any] = None) -> AsyncIterator[Any]:
+    pass
+
 
 class ProjectRegions(Protocol):
 
@@ -20,17 +20,21 @@ import collections
 import contextlib
 import functools
 import hashlib
+import json
 import logging
 import pickle
 import shutil
+import sys
 import tempfile
 import threading
-from typing import List
+import time
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
 
 import diskcache
 import googleapiclient.http
 
 from gcpdiag import config
+from gcpdiag.queries import rate_limiter
 
 _cache = None
 _bypass_cache = False
@@ -54,6 +58,11 @@ def _get_bypass_cache():
   return getattr(threading.current_thread(), '_bypass_cache', False)
 
 
+def is_cache_bypassed() -> bool:
+  """Whether the cache is bypassed in the current thread (see bypass_cache)."""
+  return _get_bypass_cache()
+
+
 def configure_global_cache(enabled: bool):
   """ Used to enable or disable the use of caching in the application."""
   global _use_cache
@@ -78,8 +87,11 @@ def _clean_cache():
   """Remove all cached items with tag 'tmp'.
 
   We use 'tmp' to store data that should be cached only during a single
-  execution of the script.
+  execution of the script. The memory cache is cleared as well, so that it
+  doesn't return results that were removed from the disk cache.
   """
+  if _memory_cache:
+    _memory_cache.clear()
   if _cache:
     count = _cache.evict('tmp')
     count += _cache.expire()
@@ -129,6 +141,248 @@ def get_tmp_deque(prefix='tmp-deque-') -> diskcache.Deque:
   return deque
 
 
+class PagedDeque:
+  """Temporary storage for items that are fetched by pages (like logs).
+
+  Every page of items is stored as a single element of a diskcache.Deque, so
+  that adding a page is one SQLite transaction and one pickle, instead of one
+  per item. Reading the items unpickles one page at a time.
+
+  The items are added with extendleft() and are returned in the same order as
+  if they had been added one by one with diskcache.Deque.appendleft().
+  """
+
+  def __init__(self, deque: diskcache.Deque):
+    self._pages = deque
+    self._len = 0
+
+  def extendleft(self, items: Iterable[Any]):
+    page = list(items)
+    if not page:
+      return
+    page.reverse()
+    self._pages.appendleft(page)
+    self._len += len(page)
+
+  def appendleft(self, item: Any):
+    self.extendleft([item])
+
+  def iter_pages(self) -> Iterator[List[Any]]:
+    """Iterate over the stored pages, from front to back."""
+    return iter(self._pages)
+
+  def __iter__(self) -> Iterator[Any]:
+    for page in self._pages:
+      yield from page
+
+  def __reversed__(self) -> Iterator[Any]:
+    for page in reversed(self._pages):
+      yield from reversed(page)
+
+  def __len__(self) -> int:
+    return self._len
+
+  def __getitem__(self, index: int) -> Any:
+    if index < 0:
+      index += self._len
+    if not 0 <= index < self._len:
+      raise IndexError('PagedDeque index out of range')
+    for page in self._pages:
+      if index < len(page):
+        return page[index]
+      index -= len(page)
+    raise IndexError('PagedDeque index out of range')
+
+
+def get_tmp_paged_deque(prefix='tmp-deque-') -> PagedDeque:
+  """Get a PagedDeque object useful to temporarily store paged data (like logs).
+
+  arguments:
+    prefix: prefix to be added to the temporary directory (default: tmp-deque)
+  """
+  return PagedDeque(get_tmp_deque(prefix))
+
+
+# Upper bounds (in seconds) of the buckets of the latency histograms.
+_HISTOGRAM_BUCKETS = (0.001, 0.01, 0.1, 1, 10, 60)
+
+
+class _Histogram:
+  """Latency histogram with fixed buckets (see _HISTOGRAM_BUCKETS)."""
+
+  def __init__(self):
+    self.counts = [0] * (len(_HISTOGRAM_BUCKETS) + 1)
+    self.total_seconds = 0.0
+
+  def record(self, seconds: float):
+    self.total_seconds += seconds
+    for i, upper_bound in enumerate(_HISTOGRAM_BUCKETS):
+      if seconds <= upper_bound:
+        self.counts[i] += 1
+        return
+    self.counts[-1] += 1
+
+  def as_dict(self) -> Dict[str, Any]:
+    buckets = {
+        f'<={upper_bound}s': count
+        for upper_bound, count in zip(_HISTOGRAM_BUCKETS, self.counts)
+    }
+    buckets[f'>{_HISTOGRAM_BUCKETS[-1]}s'] = self.counts[-1]
+    return {'total_seconds': round(self.total_seconds, 6), 'buckets': buckets}
+
+
+class _CacheStats:
+  """Instrumentation of a function decorated with cached_api_call.
+
+  - calls: number of calls of the decorated function
+  - misses: number of calls of the underlying function (i.e. not answered from
+    the cache), with their latency in miss_latency
+  - hits: calls - misses
+  - memory_hits, memory_misses, evictions: memory cache counters
+  - lock_wait: time spent waiting for the per-key lock, recorded for every
+    call that uses the cache (none when caching is disabled)
+  """
+
+  def __init__(self):
+    self._lock = threading.Lock()
+    self.calls = 0
+    self.misses = 0
+    self.memory_hits = 0
+    self.memory_misses = 0
+    self.evictions = 0
+    self.lock_wait = _Histogram()
+    self.miss_latency = _Histogram()
+
+  def incr(self, counter: str):
+    with self._lock:
+      setattr(self, counter, getattr(self, counter) + 1)
+
+  def record_lock_wait(self, seconds: float):
+    with self._lock:
+      self.lock_wait.record(seconds)
+
+  def record_miss(self, seconds: float):
+    with self._lock:
+      self.misses += 1
+      self.miss_latency.record(seconds)
+
+  def as_dict(self) -> Dict[str, Any]:
+    with self._lock:
+      return {
+          'calls': self.calls,
+          'hits': self.calls - self.misses,
+          'misses': self.misses,
+          'memory_hits': self.memory_hits,
+          'memory_misses': self.memory_misses,
+          'evictions': self.evictions,
+          'lock_wait': self.lock_wait.as_dict(),
+          'miss_latency': self.miss_latency.as_dict(),
+      }
+
+
+# statistics by decorated function name (module.function)
+_cache_stats: Dict[str, _CacheStats] = collections.defaultdict(_CacheStats)
+
+
+def get_cache_stats() -> Dict[str, Dict[str, Any]]:
+  """Return the statistics of every function decorated with cached_api_call
+  that was called at least once."""
+  return {
+      name: stats.as_dict()
+      for name, stats in sorted(_cache_stats.items())
+      if stats.calls
+  }
+
+
+def dump_cache_stats(path: str = '-'):
+  """Write the cache statistics as JSON to `path` (or stderr if it is '-').
+
+  The statistics of the API rate limiting (current rate and queueing delay of
+  every API and project) are included as well."""
+  summary: Dict[str, Any] = {'functions': get_cache_stats()}
+  if _memory_cache:
+    summary['memory_cache'] = {
+        'size_bytes': _memory_cache.size,
+        'max_bytes': _memory_cache.max_bytes,
+    }
+  summary['rate_limits'] = rate_limiter.get_rate_limiter().stats()
+  if path == '-':
+    print(json.dumps(summary, indent=2), file=sys.stderr)
+  else:
+    with open(path, 'w', encoding='utf-8') as f:
+      json.dump(summary, f, indent=2)
+
+
+class _MemoryCache:
+  """In-process LRU cache, bounded by the total size of the stored values.
+
+  This is used in front of the disk cache, so that the results of functions
+  that are called very often don't need to be fetched from SQLite at every
+  call. Only the SQLite read is avoided: values are stored pickled and
+  unpickled at every hit, so a hit still pays the deserialization cost.
+  Like with the disk cache, every caller gets its own copy of the result and
+  can modify it. Some callers rely on this (e.g. lint rules deleting items
+  from the returned mappings), so the values are not kept as live objects:
+  use in_memory=True for results that are shared without copy.
+  """
+
+  # entries: key -> (pickled value, expire_time, owner)
+  _entries: 'collections.OrderedDict[bytes, Tuple[bytes, Optional[float], str]]'
+
+  def __init__(self, max_bytes: int):
+    self.max_bytes = max_bytes
+    self.size = 0
+    self._lock = threading.Lock()
+    self._entries = collections.OrderedDict()
+
+  def get(self, key: bytes, default: Any = None) -> Any:
+    with self._lock:
+      entry = self._entries.get(key)
+      if entry is None:
+        return default
+      data, expire_time, _ = entry
+      if expire_time is not None and expire_time < time.time():
+        del self._entries[key]
+        self.size -= len(data)
+        return default
+      self._entries.move_to_end(key)
+    return pickle.loads(data)
+
+  def set(self, key: bytes, value: Any, expire_time: Optional[float],
+          owner: str):
+    try:
+      data = pickle.dumps(value)
+    except (pickle.PicklingError, TypeError, AttributeError):
+      return
+    with self._lock:
+      old_entry = self._entries.pop(key, None)
+      if old_entry:
+        self.size -= len(old_entry[0])
+      if len(data) > self.max_bytes:
+        return
+      self._entries[key] = (data, expire_time, owner)
+      self.size += len(data)
+      while self.size > self.max_bytes:
+        _, (evicted_data, _, evicted_owner) = self._entries.popitem(last=False)
+        self.size -= len(evicted_data)
+        _cache_stats[evicted_owner].incr('evictions')
+
+  def clear(self):
+    with self._lock:
+      self._entries.clear()
+      self.size = 0
+
+
+_memory_cache: Optional[_MemoryCache] = None
+
+
+def _get_memory_cache() -> _MemoryCache:
+  global _memory_cache
+  if _memory_cache is None:
+    _memory_cache = _MemoryCache(config.get('cache_memory_max_bytes'))
+  return _memory_cache
+
+
 # Write our own implementation instead of using private function
 # functtools._make_key, so that there is no breakage if that
 # private function changes with a newer Python version.
@@ -169,6 +423,13 @@ def cached_api_call(expire=None, in_memory=False):
     simultaneously, only one API call will be done and the other will wait until
     the result is available in the cache.
 
+  Results stored in the disk cache are also kept pickled in a size-bounded
+  memory cache (see `cache_memory_max_bytes`), so that frequently used results
+  don't need to be read from the disk cache again. They are still unpickled
+  at every call. Call, cache and latency statistics
+  are available with the cache_stats() method of the decorated function and
+  with get_cache_stats().
+
   Parameters:
   - expire: number of seconds until the key expires (default: expire when the
     process ends)
@@ -178,17 +439,31 @@ def cached_api_call(expire=None, in_memory=False):
 
   def _cached_api_call_decorator(func):
     lockdict = collections.defaultdict(threading.Lock)
+    func_name = func.__module__ + '.' + func.__name__
+    stats = _cache_stats[func_name]
     if in_memory:
-      lru_cached_func = functools.lru_cache()(func)
+
+      @functools.wraps(func)
+      def _timed_func(*args, **kwargs):
+        call_start = time.monotonic()
+        try:
+          return func(*args, **kwargs)
+        finally:
+          stats.record_miss(time.monotonic() - call_start)
+
+      lru_cached_func = functools.lru_cache()(_timed_func)
 
     @functools.wraps(func)
     def _cached_api_call_wrapper(*args, **kwargs):
       key = None
+      stats.incr('calls')
       if _use_cache:
         logging.debug('looking up cache for %s', func.__name__)
         key = _make_key(func, args, kwargs)
         lock = lockdict[key]
+        lock_wait_start = time.monotonic()
         with _acquire_timeout(lock, config.CACHE_LOCK_TIMEOUT, func.__name__):
+          stats.record_lock_wait(time.monotonic() - lock_wait_start)
           if in_memory:
             if _get_bypass_cache():
               logging.debug('bypassing cache for %s, fetching fresh data.',
@@ -197,12 +472,22 @@ def cached_api_call(expire=None, in_memory=False):
             return lru_cached_func(*args, **kwargs)
           else:
             api_cache = get_disk_cache()
+            memory_cache = _get_memory_cache()
             if _get_bypass_cache():
               logging.debug('bypassing cache for %s, fetching fresh data.',
                             func.__name__)
             else:
               # We use 'no data' to be able to cache calls that returned None.
-              cached_result = api_cache.get(key, default='no data')
+              cached_result = memory_cache.get(key, default='no data')
+              if cached_result != 'no data':
+                stats.incr('memory_hits')
+              else:
+                stats.incr('memory_misses')
+                cached_result, expire_time = api_cache.get(key,
+                                                           default='no data',
+                                                           expire_time=True)
+                if cached_result != 'no data':
+                  memory_cache.set(key, cached_result, expire_time, func_name)
               if cached_result != 'no data':
                 logging.debug('returning cached result for %s', func.__name__)
                 if isinstance(cached_result, Exception):
@@ -214,6 +499,7 @@ def cached_api_call(expire=None, in_memory=False):
       logging.debug('calling function %s (expire=%s, key=%s)', func.__name__,
                     str(expire), str(key))
       result = None
+      call_start = time.monotonic()
       try:
         result = func(*args, **kwargs)
         logging.debug('DONE calling function %s (expire=%s, key=%s)',
@@ -221,15 +507,19 @@ def cached_api_call(expire=None, in_memory=False):
       except googleapiclient.errors.HttpError as err:
         # cache API errors as well
         result = err
+      stats.record_miss(time.monotonic() - call_start)
       if _use_cache:
         if expire:
           api_cache.set(key, result, expire=expire)
+          memory_cache.set(key, result, time.time() + expire, func_name)
         else:
           api_cache.set(key, result, tag='tmp')
+          memory_cache.set(key, result, None, func_name)
         if isinstance(result, Exception):
           raise result
       return result
 
+    _cached_api_call_wrapper.cache_stats = stats.as_dict  # type: ignore
     return _cached_api_call_wrapper
 
   # Decorator without parens -> called with function as first parameter
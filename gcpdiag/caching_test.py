@@ -13,12 +13,17 @@
 # limitations under the License.
 """Test code in caching.py."""
 
+import json
+import os
 import secrets
 import string
+import tempfile
 import threading
 import unittest
+import unittest.mock
 
 from gcpdiag import caching
+from gcpdiag.queries import rate_limiter
 
 
 def simple_function(mixer_arg):
@@ -32,6 +37,11 @@ cached_in_memory = caching.cached_api_call(in_memory=True)(simple_function)
 cached_on_disk = caching.cached_api_call(simple_function)
 
 
+@caching.cached_api_call
+def cached_dict_on_disk(arg):
+  return {'arg': arg}
+
+
 class CacheBypassTests(unittest.TestCase):
   """Testing cache bypass test"""
 
@@ -113,3 +123,130 @@ class UseCacheTests(unittest.TestCase):
     disk_result = cached_on_disk('same-arg-but-different-result')
     next_disk_result = cached_on_disk('same-arg-but-different-result')
     self.assertNotEqual(disk_result, next_disk_result)
+
+
+class MemoryCacheTests(unittest.TestCase):
+  """Testing the memory cache in front of the disk cache"""
+
+  def setUp(self):
+    caching.configure_global_cache(enabled=True)
+
+  def test_memory_cache_hit(self):
+    cached_on_disk('memory-cache-hit')
+    stats_before = cached_on_disk.cache_stats()
+    with unittest.mock.patch.object(caching.diskcache.Cache, 'get') as get:
+      cached_on_disk('memory-cache-hit')
+      get.assert_not_called()
+    stats_after = cached_on_disk.cache_stats()
+    self.assertEqual(stats_after['hits'], stats_before['hits'] + 1)
+
+  def test_memory_cache_eviction(self):
+    # pylint: disable=protected-access
+    memory_cache = caching._MemoryCache(max_bytes=150)
+    memory_cache.set(b'key1', 'a' * 40, None, 'test.owner')
+    memory_cache.set(b'key2', 'b' * 40, None, 'test.owner')
+    # access key1, so that key2 is the least recently used
+    self.assertEqual(memory_cache.get(b'key1'), 'a' * 40)
+    memory_cache.set(b'key3', 'c' * 40, None, 'test.owner')
+    self.assertEqual(memory_cache.get(b'key1'), 'a' * 40)
+    self.assertIsNone(memory_cache.get(b'key2'))
+    self.assertLessEqual(memory_cache.size, 150)
+    # pylint: disable=protected-access
+    self.assertEqual(caching._cache_stats['test.owner'].evictions, 1)
+    # values bigger than the whole budget are not kept
+    memory_cache.set(b'key4', 'd' * 200, None, 'test.owner')
+    self.assertIsNone(memory_cache.get(b'key4'))
+
+  def test_memory_cache_expiry(self):
+    # pylint: disable=protected-access
+    memory_cache = caching._MemoryCache(max_bytes=1000)
+    memory_cache.set(b'key1', 'value', 1.0, 'test.owner')
+    self.assertIsNone(memory_cache.get(b'key1'))
+    self.assertEqual(memory_cache.size, 0)
+
+  def test_memory_cache_returns_copies(self):
+    cached_dict_on_disk('memory-cache-copies')
+    value = cached_dict_on_disk('memory-cache-copies')
+    value['modified'] = True
+    self.assertEqual(cached_dict_on_disk('memory-cache-copies'),
+                     {'arg': 'memory-cache-copies'})
+
+  def test_clean_cache_clears_memory_cache(self):
+    cached_on_disk('clean-cache')
+    # pylint: disable=protected-access
+    self.assertGreater(caching._memory_cache.size, 0)
+    caching._clean_cache()
+    self.assertEqual(caching._memory_cache.size, 0)
+
+
+class CacheStatsTests(unittest.TestCase):
+  """Testing the cache instrumentation"""
+
+  def setUp(self):
+    caching.configure_global_cache(enabled=True)
+
+  def test_cache_stats(self):
+    before = cached_on_disk.cache_stats()
+    for _ in range(3):
+      cached_on_disk('cache-stats')
+      cached_in_memory('cache-stats')
+    for func in [cached_on_disk, cached_in_memory]:
+      stats = caching.get_cache_stats()[
+          f'{simple_function.__module__}.simple_function']
+      self.assertEqual(stats, func.cache_stats())
+    self.assertGreaterEqual(stats['calls'], 6)
+    self.assertEqual(stats['calls'], stats['hits'] + stats['misses'])
+    self.assertEqual(sum(stats['miss_latency']['buckets'].values()),
+                     stats['misses'])
+    # the stats are shared with the other tests: only this test's calls
+    # are sure to have used the cache.
+    self.assertEqual(
+        sum(stats['lock_wait']['buckets'].values()) -
+        sum(before['lock_wait']['buckets'].values()),
+        stats['calls'] - before['calls'])
+
+  def test_cache_stats_cache_disabled(self):
+    before = cached_on_disk.cache_stats()
+    caching.configure_global_cache(enabled=False)
+    try:
+      cached_on_disk('cache-stats-disabled')
+    finally:
+      caching.configure_global_cache(enabled=True)
+    stats = cached_on_disk.cache_stats()
+    self.assertEqual(stats['calls'], before['calls'] + 1)
+    # no lock wait is recorded when the cache isn't used
+    self.assertEqual(stats['lock_wait'], before['lock_wait'])
+
+  def test_dump_cache_stats(self):
+    cached_on_disk('dump-cache-stats')
+    rate_limiter.get_rate_limiter().get_bucket('compute',
+                                               'dump-cache-stats').acquire()
+    with tempfile.TemporaryDirectory() as tmpdir:
+      path = os.path.join(tmpdir, 'stats.json')
+      caching.dump_cache_stats(path)
+      with open(path, encoding='utf-8') as f:
+        summary = json.load(f)
+    self.assertIn(f'{simple_function.__module__}.simple_function',
+                  summary['functions'])
+    self.assertEqual(
+        summary['rate_limits']['compute/dump-cache-stats']['requests'], 1)
+
+
+class PagedDequeTests(unittest.TestCase):
+  """Testing the temporary storage of paged data"""
+
+  def test_same_order_as_deque(self):
+    deque = caching.get_tmp_deque()
+    paged_deque = caching.get_tmp_paged_deque()
+    for page in [[1, 2, 3], [], [4], [5, 6]]:
+      for item in page:
+        deque.appendleft(item)
+      paged_deque.extendleft(page)
+    self.assertEqual(list(paged_deque), list(deque))
+    self.assertEqual(list(reversed(paged_deque)), list(reversed(deque)))
+    self.assertEqual(len(paged_deque), len(deque))
+    self.assertEqual([paged_deque[i] for i in range(-6, 6)],
+                     [deque[i] for i in range(-6, 6)])
+    self.assertEqual(list(paged_deque.iter_pages()), [[6, 5], [4], [3, 2, 1]])
+    with self.assertRaises(IndexError):
+      paged_deque[6]  # pylint: disable=pointless-statement
@@ -15,9 +15,10 @@
 # Lint as: python3
 """Globals that will be potentially user-configurable in future."""
 
+import contextvars
 import os
 import sys
-from typing import Any, Dict
+from typing import Any, Dict, Optional
 
 import appdirs
 import yaml
@@ -66,6 +67,22 @@ API_RETRIES = 3
 API_RETRY_SLEEP_MULTIPLIER = 1.4
 API_RETRY_SLEEP_RANDOMNESS_PCT = 0.2
 
+# Limits of the async API client (gcpdiag.async_queries.api).
+ASYNC_API_MAX_CONCURRENT_REQUESTS = 100
+ASYNC_API_MAX_CONNECTIONS_PER_HOST = 20
+ASYNC_API_DNS_CACHE_SECONDS = 300
+# Requests per second (and burst size) allowed for every API service.
+ASYNC_API_RATELIMIT_REQUESTS_PER_SECOND = 20
+ASYNC_API_RATELIMIT_BURST = 40
+
+# Requests per second (and burst size) allowed by default for every API and
+# project (see queries/rate_limiter.py). The rate is reduced temporarily when
+# an API returns quota errors, down to API_RATELIMIT_MIN_REQUESTS_PER_SECOND.
+# The Cloud Logging API is limited with logging_ratelimit_requests instead.
+API_RATELIMIT_REQUESTS_PER_SECOND = 100
+API_RATELIMIT_BURST = 100
+API_RATELIMIT_MIN_REQUESTS_PER_SECOND = 0.2
+
 _cache_dir = appdirs.user_cache_dir('gcpdiag')
 
 
@@ -87,12 +104,28 @@ CACHE_LOCK_TIMEOUT = 120
 # How long to cache documents that rarely change (e.g. predefined IAM roles).
 STATIC_DOCUMENTS_EXPIRY_SECONDS = 3600 * 24
 
+# Results of monitoring queries with a time window relative to the current
+# time (i.e. without a date literal, see monitoring.period_aligned_now()) are
+# reused for queries done within the same period of this many seconds.
+MONITORING_QUERY_CACHE_SECONDS = 300
+
+# Number of log entries matching a logs.query() predicate that are kept in
+# memory, before moving them to temporary storage on disk.
+LOGGING_DEMUX_SPILL_ENTRIES = 1000
+
 # Prefetch worker threads
 MAX_WORKERS = 10
 
+# Worker threads for CPU-bound tasks
+MAX_CPU_WORKERS = min(os.cpu_count() or 1, MAX_WORKERS)
+
 _args: Dict[str, Any] = {}
 _config: Dict[str, Any] = {}
 _project_id: str = ''
+# Project id set for the current context only, when several projects are
+# inspected concurrently (gcpdiag lint --projects).
+_context_project_id: contextvars.ContextVar[
+    Optional[str]] = contextvars.ContextVar('project_id', default=None)
 
 _defaults: Dict[str, Any] = {
     'auth_adc': False,
@@ -111,13 +144,21 @@ _defaults: Dict[str, Any] = {
     'logging_ratelimit_period_seconds': 60,
     'logging_page_size': 500,
     'logging_fetch_max_entries': 10000,
+    'logging_fetch_max_entries_per_filter': None,
     'logging_fetch_max_time_seconds': 120,
     'enable_gce_serial_buffer': False,
     'auto': False,
     'report_dir': '/tmp',
     'interface': 'cli',
     'universe_domain': 'googleapis.com',
-    'reason': None
+    'discovery_cache_ttl_seconds': STATIC_DOCUMENTS_EXPIRY_SECONDS,
+    'cache_memory_max_bytes': 256 * 1024 * 1024,
+    'reason': None,
+    'max_concurrent_projects': 4,
+    'max_concurrent_runbooks': 1,
+    'record': None,
+    'replay': None,
+    'api_endpoint': None,
 }
 
 #
@@ -165,8 +206,19 @@ def set_project_id(project_id):
   _project_id = project_id
 
 
+def set_context_project_id(project_id):
+  """Configure the project id in the current context only.
+
+  Tasks submitted to the gcpdiag executors inherit the context, so this is
+  used to inspect several projects concurrently, each one in its own thread."""
+  _context_project_id.set(project_id)
+
+
 def get_project_id():
   """Session project-id."""
+  context_project_id = _context_project_id.get()
+  if context_project_id is not None:
+    return context_project_id
   return _project_id
 
 
@@ -184,10 +236,11 @@ def get(key):
   Returns:
       Any: return value for provided key
   """
-  if _project_id and _project_id in _config.get('projects', {}).keys():
-    if key in _config['projects'][_project_id].keys():
+  project_id = get_project_id()
+  if project_id and project_id in _config.get('projects', {}).keys():
+    if key in _config['projects'][project_id].keys():
       # return property from configuration per project if provided
-      return _config['projects'][_project_id][key]
+      return _config['projects'][project_id][key]
   if key in _config:
     # return property from global configuration if provided
     return _config[key]
@@ -13,6 +13,7 @@
 # limitations under the License.
 """Test code in config.py."""
 
+import contextvars
 from tempfile import NamedTemporaryFile
 
 import pytest
@@ -178,3 +179,21 @@ class Test:
       assert config.get('verbose') == 3
       assert config.get('logging_fetch_max_time_seconds') == 300
       assert config.get('within_days') == 5
+
+  def test_context_project_config(self):
+    with NamedTemporaryFile() as fp:
+      fp.write(PER_PROJECT_CONFIG.encode())
+      fp.seek(0)
+
+      config.init({'config': fp.name})
+
+      def get_billing_project(project_id):
+        config.set_context_project_id(project_id)
+        return config.get('billing_project')
+
+      assert contextvars.copy_context().run(get_billing_project,
+                                            'myproject') == 'perproject'
+      assert contextvars.copy_context().run(get_billing_project,
+                                            'otherproject') is None
+      # the project id is only set in the context
+      assert config.get_project_id() == ''
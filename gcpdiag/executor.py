@@ -11,19 +11,88 @@
 # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 # See the License for the specific language governing permissions and
 # limitations under the License.
-"""ThreadPoolExecutor instance that can be used to run tasks in parallel"""
+"""ThreadPoolExecutor instances that can be used to run tasks in parallel.
+
+There are two executors: get_executor() for tasks that mostly wait for I/O
+(API calls), and get_cpu_executor() for CPU-bound tasks, each with its own
+limit of worker threads.
+
+Tasks that are submitted from a worker thread of the same executor (e.g. a
+prefetch function calling get_executor().map()) are executed inline in the
+calling thread: otherwise all workers could be blocked waiting for sub-tasks
+that can never be scheduled. Tasks submitted to the other executor (e.g. an
+I/O task parsing its results with get_cpu_executor()) are scheduled normally.
+Submitted tasks inherit the context variables of the caller.
+"""
 
 import concurrent.futures
+import contextvars
+import threading
 from typing import Optional
 
 from gcpdiag import config
 
 _executor: Optional[concurrent.futures.Executor] = None
+_cpu_executor: Optional[concurrent.futures.Executor] = None
+_executor_lock = threading.Lock()
+
+_worker_state = threading.local()
+
+
+def in_worker_thread() -> bool:
+  """Return True if called from a worker thread of the gcpdiag executors."""
+  return getattr(_worker_state, 'executor', None) is not None
+
+
+class NestedSafeExecutor(concurrent.futures.ThreadPoolExecutor):
+  """ThreadPoolExecutor that runs nested tasks inline.
+
+  Tasks submitted from a worker thread of this executor are executed
+  immediately in that thread, and a completed future is returned."""
+
+  def __init__(self, max_workers: int, thread_name_prefix: str = ''):
+    super().__init__(max_workers=max_workers,
+                     thread_name_prefix=thread_name_prefix,
+                     initializer=self._init_worker)
+
+  def _init_worker(self):
+    _worker_state.executor = self
+
+  def in_worker_thread(self) -> bool:
+    """Return True if called from a worker thread of this executor."""
+    return getattr(_worker_state, 'executor', None) is self
+
+  def submit(self, fn, /, *args, **kwargs):
+    if not self.in_worker_thread():
+      # run the task in a copy of the caller's context, so that context
+      # variables (e.g. the project id in config) are inherited.
+      context = contextvars.copy_context()
+      return super().submit(context.run, fn, *args, **kwargs)
+    future: concurrent.futures.Future = concurrent.futures.Future()
+    try:
+      result = fn(*args, **kwargs)
+    except BaseException as err:  # pylint: disable=broad-except
+      future.set_exception(err)
+    else:
+      future.set_result(result)
+    return future
 
 
 def get_executor() -> concurrent.futures.Executor:
+  """Executor for tasks that mostly wait for I/O."""
   global _executor
-  if _executor is None:
-    _executor = concurrent.futures.ThreadPoolExecutor(
-        max_workers=config.MAX_WORKERS)
+  with _executor_lock:
+    if _executor is None:
+      _executor = NestedSafeExecutor(max_workers=config.MAX_WORKERS,
+                                     thread_name_prefix='gcpdiag-io')
   return _executor
+
+
+def get_cpu_executor() -> concurrent.futures.Executor:
+  """Executor for CPU-bound tasks."""
+  global _cpu_executor
+  with _executor_lock:
+    if _cpu_executor is None:
+      _cpu_executor = NestedSafeExecutor(max_workers=config.MAX_CPU_WORKERS,
+                                         thread_name_prefix='gcpdiag-cpu')
+  return _cpu_executor
@@ -0,0 +1,88 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Test code in executor.py."""
+
+import concurrent.futures
+import contextvars
+from unittest import mock
+
+import pytest
+
+from gcpdiag import caching, config, executor, models
+from gcpdiag.queries import apis_stub, dataflow
+
+DUMMY_PROJECT_NAME = 'gcpdiag-dataflow1-aaaa'
+
+
+@mock.patch('gcpdiag.queries.apis.get_api', new=apis_stub.get_api_stub)
+@mock.patch('gcpdiag.config.MAX_WORKERS', 2)
+class TestExecutor:
+  """Test executor.py functions."""
+
+  @pytest.fixture(autouse=True)
+  def new_executors(self):
+    """Every test gets new executors, which are shut down after the test."""
+    # pylint: disable=protected-access
+    with mock.patch.object(executor, '_executor', None), \
+        mock.patch.object(executor, '_cpu_executor', None):
+      yield
+      for pool in [executor._executor, executor._cpu_executor]:
+        if pool:
+          pool.shutdown(wait=True)
+
+  def test_nested_map_does_not_starve(self):
+    """Verify that tasks calling get_executor().map() can use all workers."""
+    context = models.Context(project_id=DUMMY_PROJECT_NAME)
+    pool = executor.get_executor()
+    with caching.bypass_cache():
+      futures = [
+          pool.submit(dataflow.get_all_dataflow_jobs, context)
+          for _ in range(4)
+      ]
+      done, _ = concurrent.futures.wait(futures, timeout=30)
+    assert len(done) == len(futures)
+    for future in futures:
+      assert future.result()
+
+  def test_nested_submit_is_inline(self):
+    pool = executor.get_executor()
+    assert not executor.in_worker_thread()
+    outer = pool.submit(lambda: pool.submit(executor.in_worker_thread))
+    inner = outer.result(timeout=10)
+    assert inner.done()
+    assert inner.result()
+
+  def test_submit_to_other_executor_is_scheduled(self):
+    pool = executor.get_executor()
+    cpu_pool = executor.get_cpu_executor()
+
+    def submit_cpu_task():
+      return cpu_pool.submit(lambda: (pool.in_worker_thread(),
+                                      cpu_pool.in_worker_thread()))
+
+    inner = pool.submit(submit_cpu_task).result(timeout=10)
+    # executed by a worker of the CPU executor, not inline
+    assert inner.result(timeout=10) == (False, True)
+
+  def test_submit_inherits_context(self):
+    pool = executor.get_executor()
+
+    def submit_in_project_context(project_id):
+      config.set_context_project_id(project_id)
+      return pool.submit(config.get_project_id).result(timeout=10)
+
+    for project_id in ['project-a', 'project-b']:
+      context = contextvars.copy_context()
+      assert context.run(submit_in_project_context, project_id) == project_id
+    assert config.get_project_id() == ''
@@ -71,7 +71,6 @@ class LintRule:
   async_run_rule_f: Optional[Callable] = None
   prepare_rule_f: Optional[Callable] = None
   prefetch_rule_f: Optional[Callable] = None
-  prefetch_rule_future: Optional[concurrent.futures.Future] = None
 
   def __hash__(self):
     return str(self.product + self.rule_class.value + self.rule_id).__hash__()
@@ -371,13 +370,15 @@ class PythonModulesGateway(Protocol):
     pass
 
 
-def pick_default_execution_strategy(run_async: bool) -> ExecutionStrategy:
+def pick_default_execution_strategy(
+    run_async: bool, run_parallel: bool = False) -> ExecutionStrategy:
   if run_async:
-    return SequentialExecutionStrategy(
-        strategies=[SyncExecutionStrategy(),
-                    AsyncExecutionStrategy()])
+    return SequentialExecutionStrategy(strategies=[
+        SyncExecutionStrategy(parallel=run_parallel),
+        AsyncExecutionStrategy()
+    ])
   else:
-    return SyncExecutionStrategy()
+    return SyncExecutionStrategy(parallel=run_parallel)
 
 
 class LintRuleRepository:
@@ -390,16 +391,21 @@ class LintRuleRepository:
   def __init__(self,
                load_extended: bool = False,
                run_async: bool = False,
+               run_parallel: bool = False,
                execution_strategy: ExecutionStrategy = None,
                modules_gateway: Optional[PythonModulesGateway] = None,
                include: Iterable[LintRulesPattern] = None,
-               exclude: Iterable[LintRulesPattern] = None) -> None:
+               exclude: Iterable[LintRulesPattern] = None,
+               manifest: Optional[Dict[str, Dict[str, Any]]] = None) -> None:
     self._exclude = exclude
     self._include = include
+    # Rule modules from gcpdiag.lint.manifest, used to skip importing the rules
+    # that are not included.
+    self._manifest = manifest
     self._loaded_rules = []
     self.load_extended = load_extended
     self.execution_strategy = execution_strategy or pick_default_execution_strategy(
-        run_async)
+        run_async, run_parallel)
     self.modules_gateway = modules_gateway or DefaultPythonModulesGateway()
     self.result = LintResults()
 
@@ -409,16 +415,32 @@ class LintRuleRepository:
     return self.execution_strategy.filter_runnable_rules(rules_filtered)
 
   def _rules_filtered(self) -> Iterator[LintRule]:
-    exclude = self._exclude
-    include = self._include
-    for rule in self._loaded_rules:
-      if include:
-        if not any(x.match_rule(rule) for x in include):
-          continue
-      if exclude:
-        if any(x.match_rule(rule) for x in exclude):
-          continue
-      yield rule
+    # Make sure the rules are sorted alphabetically
+    for rule in sorted(self._loaded_rules, key=str):
+      if self._is_rule_selected(rule):
+        yield rule
+
+  def _is_rule_selected(self, rule: LintRule) -> bool:
+    if self._include:
+      if not any(x.match_rule(rule) for x in self._include):
+        return False
+    if self._exclude:
+      if any(x.match_rule(rule) for x in self._exclude):
+        return False
+    return True
+
+  def _is_module_selected(self, name: str) -> bool:
+    """Use the manifest to check if a rule module needs to be imported."""
+    if self._manifest is None or name not in self._manifest:
+      return True
+    entry = self._manifest[name]
+    rule = LintRule(product=entry['product'],
+                    rule_class=LintRuleClass(entry['rule_class']),
+                    rule_id=entry['rule_id'],
+                    short_desc=entry['short_desc'],
+                    long_desc=entry['long_desc'],
+                    keywords=entry['keywords'])
+    return self._is_rule_selected(rule)
 
   def get_rule_by_module_name(self, name: str) -> LintRule:
     # Skip code tests
@@ -496,6 +518,8 @@ class LintRuleRepository:
       try:
         if '_ext_' in name and not self.load_extended:
           continue
+        if not self._is_module_selected(name):
+          continue
         rule = self.get_rule_by_module_name(name)
       except NotLintRule:
         continue
@@ -505,11 +529,17 @@ class LintRuleRepository:
   def _register_rule(self, rule: LintRule):
     self._loaded_rules.append(rule)
 
-  def run_rules(self, context: models.Context) -> None:
-    # Make sure the rules are sorted alphabetically
-    self._loaded_rules.sort(key=str)
+  def run_rules(self,
+                context: models.Context,
+                result: Optional[LintResults] = None) -> None:
+    """Run the rules in the context of a project.
+
+    The results are added to `result`, or to self.result by default. The same
+    repository can be used to run the rules for several projects concurrently,
+    each with its own LintResults."""
     rules_to_run = self.rules_to_run
-    self.execution_strategy.run_rules(context, self.result, rules_to_run)
+    self.execution_strategy.run_rules(context, result or self.result,
+                                      rules_to_run)
 
 
 class AsyncRunner:
@@ -525,8 +555,15 @@ class AsyncRunner:
     asyncio.run(self._run_all())
 
   async def _run_all(self) -> None:
+    # pylint: disable=import-outside-toplevel
+    from gcpdiag.async_queries.api import api as async_api
+
     awaitables = [self._run_async_rule(r) for r in self._rules]
-    await asyncio.gather(*awaitables)
+    try:
+      await asyncio.gather(*awaitables)
+    finally:
+      # the API sessions are bound to this event loop
+      await async_api.close_sessions()
 
   async def _run_async_rule(self, rule: LintRule) -> None:
     rule_report = self._result.create_rule_report(rule)
@@ -555,7 +592,17 @@ def wrap_prefetch_rule_f(rule_name, prefetch_rule_f, context):
 
 
 class SyncExecutionStrategy:
-  """ Execute rules using thread pool """
+  """ Execute rules using thread pool
+
+  By default the run_rule functions are executed one after the other in the
+  main thread. In parallel mode, every run_rule function is executed in the
+  thread pool as soon as its own prefetch_rule function completed, and the
+  rule reports are still finished in the order of the rules.
+  """
+
+  def __init__(self, parallel: bool = False) -> None:
+    self.parallel = parallel
+    self._last_threads_dump = time.time()
 
   def filter_runnable_rules(self, rules: Iterable[LintRule]) -> List[LintRule]:
     return [r for r in rules if r.run_rule_f]
@@ -583,50 +630,118 @@ class SyncExecutionStrategy:
       gce_mod.execute_fetch_serial_port_outputs(executor)
 
     # Run the "prefetch_rule" functions with multiple worker threads to speed up
-    # execution of the "run_rule" executions later.
+    # execution of the "run_rule" executions later. The futures are kept per
+    # run_rules() call, because the same rules can be run concurrently for
+    # several projects.
+    prefetch_futures: Dict[LintRule, concurrent.futures.Future] = {}
     for rule in rules_to_run:
       if rule.prefetch_rule_f:
-        rule.prefetch_rule_future = executor.submit(wrap_prefetch_rule_f,
-                                                    str(rule),
-                                                    rule.prefetch_rule_f,
-                                                    context)
+        prefetch_futures[rule] = executor.submit(wrap_prefetch_rule_f,
+                                                 str(rule),
+                                                 rule.prefetch_rule_f, context)
+
+    if self.parallel:
+      self._run_rules_parallel(context, result, rules_to_run, executor,
+                               prefetch_futures)
+      return
 
     # While the prefetch_rule functions are still being executed in multiple
     # threads, start executing the rules, but block and wait in case the
     # prefetch for a specific rule is still running.
-    last_threads_dump = time.time()
     for rule in rules_to_run:
       rule_report = result.create_rule_report(rule)
+      self._run_rule(context, rule, rule_report, prefetch_futures.get(rule))
+      rule_report.finish()
 
-      # make sure prefetch_rule_f completed
+  def _run_rules_parallel(
+      self, context: models.Context, result: LintResults,
+      rules_to_run: List[LintRule], executor: concurrent.futures.Executor,
+      prefetch_futures: Dict[LintRule, concurrent.futures.Future]) -> None:
+    rule_reports = {
+        rule: result.create_rule_report(rule) for rule in rules_to_run
+    }
+    rule_futures: Dict[LintRule, concurrent.futures.Future] = {}
+
+    def submit_rule(rule: LintRule):
+      rule_futures[rule] = executor.submit(self._run_rule_in_thread, context,
+                                           rule, rule_reports[rule],
+                                           prefetch_futures.get(rule))
+
+    # Submit the rules without prefetch_rule function first, and then every
+    # other rule as soon as its prefetch_rule function completed. The rules
+    # are submitted from this thread, so that they are scheduled as separate
+    # tasks of the thread pool and any exception is set on their future.
+    for rule in rules_to_run:
+      if rule not in prefetch_futures:
+        submit_rule(rule)
+    pending_prefetches = {
+        future: rule for rule, future in prefetch_futures.items()
+    }
+
+    # Reorder buffer: finish the rule reports in the order of the rules, so
+    # that the output is the same as when the rules are executed serially.
+    # While waiting for the next rule, the rules whose prefetch completed are
+    # submitted, so that a slow prefetch only holds back the output of the
+    # rules that come after it.
+    for rule in rules_to_run:
+      while pending_prefetches:
+        rule_future = rule_futures.get(rule)
+        if rule_future and rule_future.done():
+          break
+        done, _ = concurrent.futures.wait(
+            list(pending_prefetches) + ([rule_future] if rule_future else []),
+            return_when=concurrent.futures.FIRST_COMPLETED)
+        for future in done:
+          if future in pending_prefetches:
+            submit_rule(pending_prefetches.pop(future))
+      self._wait_for_future(rule_futures[rule], rule)
+      rule_reports[rule].finish()
+
+  def _run_rule_in_thread(
+      self, context: models.Context, rule: LintRule,
+      rule_report: LintReportRuleInterface,
+      prefetch_future: Optional[concurrent.futures.Future]) -> None:
+    thread = threading.current_thread()
+    thread.name = f'run_rule_f:{rule}'
+    self._run_rule(context, rule, rule_report, prefetch_future)
+
+  def _wait_for_future(self, future: concurrent.futures.Future,
+                       rule: LintRule) -> None:
+    if not future.done():
+      logging.info('waiting for query results (%s)', rule)
+    while True:
       try:
-        if rule.prefetch_rule_future:
-          if rule.prefetch_rule_future.running():
-            logging.info('waiting for query results (%s)', rule)
-          while True:
-            try:
-              rule.prefetch_rule_future.result(10)
-              break
-            except concurrent.futures.TimeoutError:
-              pass
-            if config.get('verbose') >= 2:
-              now = time.time()
-              if now - last_threads_dump > 10:
-                logging.debug(
-                    'THREADS: %s',
-                    ', '.join([t.name for t in threading.enumerate()]))
-                last_threads_dump = now
-        # run the rule
-        assert rule.run_rule_f is not None
-        rule.run_rule_f(context, rule_report)
-      except (utils.GcpApiError, googleapiclient.errors.HttpError) as err:
-        if isinstance(err, googleapiclient.errors.HttpError):
-          err = utils.GcpApiError(err)
-        logging.warning('%s: %s while processing rule: %s',
-                        type(err).__name__, err, rule)
-        rule_report.add_skipped(None, f'API error: {err}', None)
-      except (RuntimeError, ValueError, KeyError, TypeError) as err:
-        logging.warning('%s: %s while processing rule: %s',
-                        type(err).__name__, err, rule)
-        rule_report.add_skipped(None, f'Error: {err}', None)
-      rule_report.finish()
+        future.result(10)
+        break
+      except concurrent.futures.TimeoutError:
+        pass
+      if config.get('verbose') >= 2:
+        now = time.time()
+        if now - self._last_threads_dump > 10:
+          logging.debug('THREADS: %s',
+                        ', '.join([t.name for t in threading.enumerate()]))
+          self._last_threads_dump = now
+
+  def _run_rule(
+      self,
+      context: models.Context,
+      rule: LintRule,
+      rule_report: LintReportRuleInterface,
+      prefetch_future: Optional[concurrent.futures.Future] = None) -> None:
+    # make sure prefetch_rule_f completed
+    try:
+      if prefetch_future:
+        self._wait_for_future(prefetch_future, rule)
+      # run the rule
+      assert rule.run_rule_f is not None
+      rule.run_rule_f(context, rule_report)
+    except (utils.GcpApiError, googleapiclient.errors.HttpError) as err:
+      if isinstance(err, googleapiclient.errors.HttpError):
+        err = utils.GcpApiError(err)
+      logging.warning('%s: %s while processing rule: %s',
+                      type(err).__name__, err, rule)
+      rule_report.add_skipped(None, f'API error: {err}', None)
+    except (RuntimeError, ValueError, KeyError, TypeError) as err:
+      logging.warning('%s: %s while processing rule: %s',
+                      type(err).__name__, err, rule)
+      rule_report.add_skipped(None, f'Error: {err}', None)
@@ -33,12 +33,18 @@ MISSING_DRIVE_SCOPE = [
 logs_by_project = {}
 
 
+def _is_relevant(log_entry) -> bool:
+  return MATCH_STR in get_path(
+      log_entry, ('protoPayload', 'status', 'message'), default='')
+
+
 def prepare_rule(context: models.Context):
   logs_by_project[context.project_id] = logs.query(
       project_id=context.project_id,
       resource_type='bigquery_resource',
       log_name='log_id("cloudaudit.googleapis.com/data_access")',
-      filter_str=' AND '.join(MISSING_DRIVE_SCOPE))
+      filter_str=' AND '.join(MISSING_DRIVE_SCOPE),
+      predicate=_is_relevant)
 
 
 def run_rule(context: models.Context, report: lint.LintReportRuleInterface):
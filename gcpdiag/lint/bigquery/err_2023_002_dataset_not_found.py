@@ -39,12 +39,18 @@ logs_by_project = {}
 
 
 #Get the logs for the error
+def _is_relevant(log_entry) -> bool:
+  return MATCH_STR in get_path(
+      log_entry, ('protoPayload', 'status', 'message'), default='')
+
+
 def prepare_rule(context: models.Context):
   logs_by_project[context.project_id] = logs.query(
       project_id=context.project_id,
       resource_type='bigquery_resource',
       log_name='log_id("cloudaudit.googleapis.com%2Fdata_access")',
-      filter_str=' AND '.join(DS_NOT_FOUND))
+      filter_str=' AND '.join(DS_NOT_FOUND),
+      predicate=_is_relevant)
 
 
 def run_rule(context: models.Context, report: lint.LintReportRuleInterface):
@@ -38,12 +38,18 @@ QUERY_COMPLEX = [
 logs_by_project = {}
 
 
+def _is_relevant(log_entry) -> bool:
+  return MATCH_STR in get_path(
+      log_entry, ('protoPayload', 'status', 'message'), default='')
+
+
 def prepare_rule(context: models.Context):
   logs_by_project[context.project_id] = logs.query(
       project_id=context.project_id,
       resource_type='bigquery_resource',
       log_name='log_id("cloudaudit.googleapis.com/data_access")',
       filter_str=' AND '.join(QUERY_COMPLEX),
+      predicate=_is_relevant,
   )
 
 
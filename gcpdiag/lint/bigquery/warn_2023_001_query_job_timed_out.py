@@ -35,12 +35,18 @@ OPERATION_TIMED_OUT_FILTER = [
 logs_by_project = {}
 
 
+def _is_relevant(log_entry) -> bool:
+  return log_entry.get('severity') == 'ERROR' and MATCH_STR in get_path(
+      log_entry, ('protoPayload', 'status', 'message'), default='')
+
+
 def prepare_rule(context: models.Context):
   logs_by_project[context.project_id] = logs.query(
       project_id=context.project_id,
       resource_type='bigquery_resource',
       log_name='log_id("cloudaudit.googleapis.com/data_access")',
       filter_str=' AND '.join(OPERATION_TIMED_OUT_FILTER),
+      predicate=_is_relevant,
   )
 
 
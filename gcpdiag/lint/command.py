@@ -16,16 +16,21 @@
 """gcpdiag lint command."""
 
 import argparse
+import atexit
+import concurrent.futures
+import contextvars
 import importlib
+import io
 import logging
 import pkgutil
 import re
 import sys
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, List, Optional, TextIO
 
 from google.auth import exceptions
 
-from gcpdiag import config, hooks, lint, models, utils
+from gcpdiag import caching, config, hooks, lint, models, utils
+from gcpdiag.lint import manifest
 from gcpdiag.lint.output import (api_output, csv_output, json_output,
                                  terminal_output)
 from gcpdiag.queries import apis, crm, gce, kubectl
@@ -85,9 +90,34 @@ def _init_args_parser():
 
   parser.add_argument('--project',
                       metavar='P',
-                      required=True,
                       help='Project ID of project to inspect')
 
+  parser.add_argument(
+      '--projects',
+      metavar='P',
+      action='append',
+      help=('Inspect several projects (comma separated, or with multiple '
+            'arguments)'))
+
+  parser.add_argument(
+      '--projects-file',
+      metavar='FILE',
+      help='Inspect the projects listed in FILE (one project ID per line)')
+
+  parser.add_argument(
+      '--projects-parent',
+      metavar='PARENT',
+      help=('Inspect the projects directly under a folder or organization '
+            '(e.g.: folders/123, organizations/456)'))
+
+  parser.add_argument(
+      '--max-concurrent-projects',
+      metavar='N',
+      type=int,
+      help=('How many projects are inspected at the same time when inspecting'
+            f" several projects (default: {config.get('max_concurrent_projects')})"
+           ))
+
   parser.add_argument(
       '--name',
       nargs='+',
@@ -166,6 +196,13 @@ def _init_args_parser():
                       default=config.get('experimental_enable_async_rules'),
                       action='store_true')
 
+  parser.add_argument(
+      '--experimental-parallel-rules',
+      help=('Run rules in parallel worker threads as soon as their data is '
+            'fetched (default: False)'),
+      default=config.get('experimental_parallel_rules'),
+      action='store_true')
+
   parser.add_argument('-v',
                       '--verbose',
                       action='count',
@@ -210,6 +247,13 @@ def _init_args_parser():
       help=('Configure max entries to fetch by logging queries (default:'
             f" {config.get('logging_fetch_max_entries')})"))
 
+  parser.add_argument(
+      '--logging-fetch-max-entries-per-filter',
+      metavar='E',
+      type=int,
+      help=('Stop fetching log entries for a logging query filter once E '
+            'matching entries were fetched (default: disabled)'))
+
   parser.add_argument(
       '--logging-fetch-max-time-seconds',
       metavar='S',
@@ -235,6 +279,30 @@ def _init_args_parser():
                       type=str,
                       default=config.get('reason'),
                       help='The reason for running gcpdiag')
+
+  parser.add_argument(
+      '--cache-stats',
+      metavar='FILE',
+      nargs='?',
+      const='-',
+      help=('Print API cache and rate limiting statistics as JSON at exit, or'
+            ' write them to FILE (default: not printed)'))
+
+  parser.add_argument(
+      '--record',
+      metavar='FILE',
+      help=('Record all the API requests and responses to FILE, to be used'
+            ' later with --replay'))
+
+  parser.add_argument(
+      '--replay',
+      metavar='FILE',
+      help=('Answer the API requests with the responses recorded in FILE'
+            ' (see --record), without network access'))
+
+  parser.add_argument('--api-endpoint',
+                      metavar='URL',
+                      help=argparse.SUPPRESS)
   return parser
 
 
@@ -276,11 +344,12 @@ def _get_output_constructor(output_parameter_value, interface):
     return terminal_output.TerminalOutput
 
 
-def _initialize_output(output_order):
+def _initialize_output(output_order, file: TextIO = sys.stdout):
   """Initialize output formatter."""
   constructor = _get_output_constructor(config.get('output'),
                                         config.get('interface'))
   kwargs = {
+      'file': file,
       'log_info_for_progress_only': config.get('verbose') == 0,
       'show_ok': not config.get('hide_ok'),
       'show_skipped': config.get('show_skipped'),
@@ -292,20 +361,20 @@ def _initialize_output(output_order):
   return output
 
 
-def _parse_args_run_repo(
-    argv: Optional[List[str]] = None,
-    credentials: Optional[str] = None) -> lint.LintRuleRepository:
-  """Parse the sys.argv command line arguments and execute the lint rules.
-
-  Args: argv: [str]   argument list sys.argv
-        credentials: str json repr of ADC credentials
-
-  Returns: lint.LintRuleRepository with repo results
-  """
-  # Initialize argument parser
+def _parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
   parser = _init_args_parser()
   args = parser.parse_args(args=argv)
+  if not (args.project or _is_multi_project(args)):
+    parser.error('one of the arguments --project, --projects, --projects-file '
+                 'or --projects-parent is required')
+  return args
+
 
+def _is_multi_project(args: argparse.Namespace) -> bool:
+  return bool(args.projects or args.projects_file or args.projects_parent)
+
+
+def _init_config(args: argparse.Namespace, credentials: Optional[str] = None):
   if credentials:
     apis.set_credentials(credentials)
 
@@ -314,22 +383,11 @@ def _parse_args_run_repo(
     hooks.set_lint_args_hook(args)
   # Initialize configuration
   config.init(vars(args), terminal_output.is_cloud_shell())
-  try:
-    # Users to use either project Number or project id
-    # fetch project details
-    project = crm.get_project(args.project)
-  except utils.GcpApiError as e:
-    raise e
-  else:
-    # set the project id in config and context as
-    # remaining code will mainly use project ID
-    config.set_project_id(project.id)
-    # Initialize Context.
-    context = models.Context(project_id=project.id,
-                             locations=args.location,
-                             resources=args.name,
-                             labels=args.label)
+  if args.interface == 'cli' and config.get('cache_stats'):
+    atexit.register(caching.dump_cache_stats, config.get('cache_stats'))
+
 
+def _init_repository() -> lint.LintRuleRepository:
   # Rules name patterns that shall be included or excluded
   include_patterns = _parse_rule_patterns(config.get('include'))
   exclude_patterns = _parse_rule_patterns(config.get('exclude'))
@@ -338,19 +396,18 @@ def _parse_args_run_repo(
   repo = lint.LintRuleRepository(
       load_extended=config.get('include_extended'),
       run_async=config.get('experimental_enable_async_rules'),
+      run_parallel=config.get('experimental_parallel_rules'),
       exclude=exclude_patterns,
-      include=include_patterns)
+      include=include_patterns,
+      manifest=manifest.load_manifest())
   _load_repository_rules(repo)
 
   # ^^^ If you add rules directory, update also
   # pyinstaller/hook-gcpdiag.lint.py and bin/precommit-required-files
+  return repo
 
-  # Initialize proper output formatter
-  output_order = sorted(str(r) for r in repo.rules_to_run)
-  output = _initialize_output(output_order=output_order)
-  repo.result.add_result_handler(output.result_handler)
 
-  # Logging setup.
+def _init_logging(output) -> logging.Logger:
   logging_handler = output.get_logging_handler()
   logger = logging.getLogger()
   # Make sure we are only using our own handler
@@ -371,6 +428,70 @@ def _parse_args_run_repo(
         'The oauth authentication has been deprecated and does not work'
         ' anymore. Consider using other authentication methods.')
     raise ValueError('oauth authentication is no longer supported')
+  return logger
+
+
+def _make_context(args: argparse.Namespace, project_id: str) -> models.Context:
+  # Users to use either project Number or project id
+  # fetch project details
+  project = crm.get_project(project_id)
+  return models.Context(project_id=project.id,
+                        locations=args.location,
+                        resources=args.name,
+                        labels=args.label)
+
+
+def _warn_serial_logging_disabled(context: models.Context):
+  # Warn end user to fallback on serial logs buffer if project isn't storing in
+  # cloud logging
+  if not gce.is_project_serial_port_logging_enabled(context.project_id) and \
+    not config.get('enable_gce_serial_buffer'):
+    # Only print the warning if GCE is enabled in the first place
+    if apis.is_enabled(context.project_id, 'compute'):
+      logging.warning(
+          '''Serial output to cloud logging maybe disabled for certain GCE instances.
+          Fallback on serial output buffers by using flag --enable-gce-serial-buffer \n'''
+      )
+
+
+def _parse_args_run_repo(
+    argv: Optional[List[str]] = None,
+    credentials: Optional[str] = None) -> lint.LintRuleRepository:
+  """Parse the sys.argv command line arguments and execute the lint rules.
+
+  Args: argv: [str]   argument list sys.argv
+        credentials: str json repr of ADC credentials
+
+  Returns: lint.LintRuleRepository with repo results
+  """
+  args = _parse_args(argv)
+  if _is_multi_project(args):
+    raise ValueError('several projects can only be inspected with run()')
+  return _run_repo(args, credentials)
+
+
+def _run_repo(args: argparse.Namespace,
+              credentials: Optional[str] = None) -> lint.LintRuleRepository:
+  """Execute the lint rules in the project of the --project argument."""
+  _init_config(args, credentials)
+  try:
+    context = _make_context(args, args.project)
+  except utils.GcpApiError as e:
+    raise e
+  else:
+    # set the project id in config and context as
+    # remaining code will mainly use project ID
+    config.set_project_id(context.project_id)
+
+  repo = _init_repository()
+
+  # Initialize proper output formatter
+  output_order = sorted(str(r) for r in repo.rules_to_run)
+  output = _initialize_output(output_order=output_order)
+  repo.result.add_result_handler(output.result_handler)
+
+  # Logging setup.
+  logger = _init_logging(output)
 
   # Start the reporting
   if args.interface == 'cli':
@@ -398,21 +519,14 @@ def _parse_args_run_repo(
     else:
       raise err
 
-  # Warn end user to fallback on serial logs buffer if project isn't storing in
-  # cloud logging
   if args.interface == 'cli':
-    if not gce.is_project_serial_port_logging_enabled(context.project_id) and \
-      not config.get('enable_gce_serial_buffer'):
-      # Only print the warning if GCE is enabled in the first place
-      if apis.is_enabled(context.project_id, 'compute'):
-        logger.warning(
-            '''Serial output to cloud logging maybe disabled for certain GCE instances.
-            Fallback on serial output buffers by using flag --enable-gce-serial-buffer \n'''
-        )
+    _warn_serial_logging_disabled(context)
 
   # Run the tests.
   repo.run_rules(context)
   if args.interface == 'cli':
+    if config.get('verbose'):
+      apis.log_http_connection_stats()
     output.display_footer(repo.result)
     hooks.post_lint_hook(repo.result.get_rule_statuses())
     if credentials:
@@ -423,20 +537,154 @@ def _parse_args_run_repo(
   return repo
 
 
+def _get_project_ids(args: argparse.Namespace) -> List[str]:
+  """Return the projects to inspect, without duplicates."""
+  project_ids = []
+  if args.project:
+    project_ids.append(args.project)
+  if args.projects:
+    project_ids.extend(p for p in _flatten_multi_arg(args.projects) if p)
+  if args.projects_file:
+    with open(args.projects_file, encoding='utf-8') as f:
+      for line in f:
+        line = line.split('#', 1)[0].strip()
+        if line:
+          project_ids.append(line)
+  if args.projects_parent:
+    project_ids.extend(crm.get_project_ids_in_parent(args.projects_parent))
+  return list(dict.fromkeys(project_ids))
+
+
+class _ProjectsRunner:
+  """Run the lint rules in several projects, in a single process.
+
+  The rules are loaded once, and every project runs them with its own
+  LintResults and output, so that the API clients, caches and executors are
+  shared by all projects. Up to max_concurrent_projects projects are inspected
+  at the same time, each one in its own thread with the project id set in
+  the config context. The output of every project is buffered and printed
+  once the project is finished, so that the reports don't get mixed.
+
+  Note that the rule selection (include, exclude, include_extended) is the
+  same for all projects.
+  """
+
+  def __init__(self, args: argparse.Namespace, repo: lint.LintRuleRepository,
+               output_order: List[str], main_output) -> None:
+    self.args = args
+    self.repo = repo
+    self.output_order = output_order
+    self.main_output = main_output
+    self.max_concurrent_projects = max(
+        1, config.get('max_concurrent_projects'))
+    self.results: Dict[str, Optional[lint.LintResults]] = {}
+
+  def run(self, project_ids: List[str]) -> None:
+    if self.max_concurrent_projects == 1:
+      for project_id in project_ids:
+        self._run_project(project_id)
+      return
+    with concurrent.futures.ThreadPoolExecutor(
+        max_workers=self.max_concurrent_projects,
+        thread_name_prefix='gcpdiag-project') as executor:
+      futures = [
+          executor.submit(contextvars.copy_context().run, self._run_project,
+                          project_id) for project_id in project_ids
+      ]
+      for future in futures:
+        future.result()
+
+  def _run_project(self, project_id: str) -> None:
+    buffered = self.max_concurrent_projects > 1
+    file = io.StringIO() if buffered else sys.stdout
+    output = _initialize_output(output_order=self.output_order, file=file)
+    result = lint.LintResults()
+    result.add_result_handler(output.result_handler)
+    self.results[project_id] = None
+    try:
+      context = _make_context(self.args, project_id)
+      if buffered:
+        config.set_context_project_id(context.project_id)
+      else:
+        config.set_project_id(context.project_id)
+      output.display_header(context)
+      apis.verify_access(context.project_id)
+      if self.args.interface == 'cli':
+        _warn_serial_logging_disabled(context)
+      self.repo.run_rules(context, result)
+    except (utils.GcpApiError, exceptions.GoogleAuthError, ValueError) as err:
+      logging.error('can\'t inspect project %s: %s', project_id, err)
+      return
+    output.display_footer(result)
+    hooks.post_lint_hook(result.get_rule_statuses())
+    self.results[project_id] = result
+    if buffered:
+      with self.main_output.lock:
+        if isinstance(self.main_output, terminal_output.TerminalOutput):
+          self.main_output.terminal_erase_line()
+        sys.stdout.write(file.getvalue())
+        sys.stdout.flush()
+
+  @property
+  def any_failed(self) -> bool:
+    return any(r is None or r.any_failed for r in self.results.values())
+
+  def display_summary(self) -> None:
+    failed = [
+        p for p, r in self.results.items() if r is not None and r.any_failed
+    ]
+    errors = [p for p, r in self.results.items() if r is None]
+    print(f'Projects summary: {len(self.results)} inspected, '
+          f'{len(failed)} with failed rules, {len(errors)} not accessible',
+          file=sys.stderr)
+    if errors:
+      print(f"Not accessible: {', '.join(errors)}", file=sys.stderr)
+
+
+def _run_projects(args: argparse.Namespace) -> bool:
+  """Execute the lint rules in several projects.
+
+  Returns: True if any rule failed, or if any project couldn't be inspected.
+  """
+  _init_config(args)
+  repo = _init_repository()
+  output_order = sorted(str(r) for r in repo.rules_to_run)
+  main_output = _initialize_output(output_order=output_order)
+  _init_logging(main_output)
+  if args.interface == 'cli':
+    main_output.display_banner()
+
+  project_ids = _get_project_ids(args)
+  runner = _ProjectsRunner(args, repo, output_order, main_output)
+  runner.run(project_ids)
+
+  if args.interface == 'cli':
+    if config.get('verbose'):
+      apis.log_http_connection_stats()
+    runner.display_summary()
+    # Clean up the kubeconfig file generated for gcpdiag
+    kubectl.clean_up()
+  return runner.any_failed
+
+
 def run(argv) -> int:
   """Run the overall command line gcpdiag lint command.
   Parsing the sys.argv and sys.exit on error for failed."""
   del argv
 
   try:
-    repo = _parse_args_run_repo()
+    args = _parse_args()
+    if _is_multi_project(args):
+      any_failed = _run_projects(args)
+    else:
+      any_failed = _run_repo(args).result.any_failed
   except (utils.GcpApiError, exceptions.GoogleAuthError) as e:
     # fail hard as the user typically doesn't have permission
     # to retrieve details of the project under inspection.
     print(f'[ERROR]:{e}. exiting program', file=sys.stderr)
     sys.exit(2)
   else:
-    sys.exit(2 if repo.result.any_failed else 0)
+    sys.exit(2 if any_failed else 0)
 
 
 def run_and_get_results(
@@ -14,8 +14,12 @@
 """Test code in command.py."""
 
 import sys
+import tempfile
+import threading
 from unittest import TestCase, mock
 
+import pytest
+
 from gcpdiag import config, lint, utils
 from gcpdiag.lint import command
 from gcpdiag.queries import apis, apis_stub
@@ -78,6 +82,72 @@ class TestCommand(TestCase):
               'version': config.VERSION
           })
 
+  def test_run_projects(self, mock_email, mock_api):
+    # pylint: disable=W0613
+    sys.argv = [
+        'gcpdiag lint',
+        '--projects',
+        '12340001,gcpdiag-gke1-aaaa',
+        '--max-concurrent-projects',
+        '2',
+        '--include',
+        'dataproc/BP/2021_001',
+    ]
+    command.run([])
+    # the APIs required by gcpdiag are not enabled in the test projects
+    sys.exit.assert_called_once_with(2)  # pylint: disable=no-member
+
+  # pylint: disable=protected-access
+  @mock.patch.object(apis, 'verify_access')
+  def test_projects_runner(self, mock_verify_access, mock_email, mock_api):
+    # pylint: disable=W0613
+    args = command._parse_args([
+        '--projects', '12340001,gcpdiag-gke1-aaaa', '--max-concurrent-projects',
+        '2', '--include', 'dataproc/BP/2021_001'
+    ])
+    command._init_config(args)
+    repo = command._init_repository()
+    output_order = sorted(str(r) for r in repo.rules_to_run)
+    main_output = command._initialize_output(output_order=output_order)
+    runner = command._ProjectsRunner(args, repo, output_order, main_output)
+    runner.run(command._get_project_ids(args))
+    assert set(runner.results) == {'12340001', 'gcpdiag-gke1-aaaa'}
+    for result in runner.results.values():
+      assert result.get_rule_statuses() == {'dataproc/BP/2021_001': 'skipped'}
+    assert not runner.any_failed
+
+  # pylint: disable=protected-access
+  @mock.patch.object(apis, 'verify_access')
+  def test_projects_runner_rule_state(self, mock_verify_access, mock_email,
+                                      mock_api):
+    # pylint: disable=W0613
+    # rules that keep the state of prepare_rule between prepare_rule and
+    # run_rule must not report the resources of the other projects.
+    project_ids = ['gcpdiag-gce1-aaaa', 'gcpdiag-gce3-aaaa']
+    args = command._parse_args([
+        '--projects', ','.join(project_ids), '--max-concurrent-projects', '2',
+        '--include', 'gce/ERR/2024_002', '--include', 'gce/ERR/2024_003'
+    ])
+    command._init_config(args)
+    repo = command._init_repository()
+    output_order = sorted(str(r) for r in repo.rules_to_run)
+    main_output = command._initialize_output(output_order=output_order)
+    runner = command._ProjectsRunner(args, repo, output_order, main_output)
+    barrier = threading.Barrier(len(project_ids), timeout=10)
+    mock_verify_access.side_effect = lambda project_id: barrier.wait()
+    runner.run(project_ids)
+    assert set(runner.results) == set(project_ids)
+    for project_id, result in runner.results.items():
+      assert result is not None
+      resources = [
+          r.resource
+          for rule_report in result.get_rule_reports()
+          for r in rule_report.results
+          if r.resource is not None
+      ]
+      assert resources
+      assert {r.project_id for r in resources} == {project_id}
+
 
 class Test:
   """Unit tests for command."""
@@ -112,9 +182,12 @@ class Test:
     assert args.logging_ratelimit_period_seconds is None
     assert args.logging_page_size is None
     assert args.logging_fetch_max_entries is None
+    assert args.logging_fetch_max_entries_per_filter is None
     assert args.logging_fetch_max_time_seconds is None
     assert args.output == 'terminal'
     assert args.enable_gce_serial_buffer is False
+    assert args.projects is None
+    assert args.max_concurrent_projects is None
 
   # pylint: disable=protected-access
   def test_provided_init_args_parser(self):
@@ -129,6 +202,27 @@ class Test:
         ['--project', 'myproject', '--config', '/path/to/file'])
     assert args.config == '/path/to/file'
 
+  # pylint: disable=protected-access
+  def test_project_required(self):
+    with pytest.raises(SystemExit):
+      command._parse_args([])
+    args = command._parse_args(['--projects-parent', 'folders/123'])
+    assert args.project is None
+    assert args.projects_parent == 'folders/123'
+
+  # pylint: disable=protected-access
+  def test_get_project_ids(self):
+    with tempfile.NamedTemporaryFile('w', suffix='.txt') as f:
+      f.write('# projects\nproject-c\n\nproject-a  # duplicate\n')
+      f.flush()
+      args = command._parse_args([
+          '--project', 'project-a', '--projects', 'project-b, project-c',
+          '--projects-file', f.name
+      ])
+      assert command._get_project_ids(args) == [
+          'project-a', 'project-b', 'project-c'
+      ]
+
   # pylint: disable=protected-access
   def test_load_repository_rules(self):
     repo = lint.LintRuleRepository()
@@ -19,20 +19,18 @@ disk IOPS and Throughput applicable max limits.
 
 import json
 from datetime import datetime, timedelta, timezone
+from typing import Dict, List
 
 import googleapiclient
 
 from gcpdiag import lint, models
 from gcpdiag.queries import gce, monitoring
 
-vms = None
-project = None
-instances: list
+instances_by_project: Dict[str, List[gce.Instance]] = {}
 
 
 def prepare_rule(context: models.Context):
-  global instances
-  instances = [
+  instances_by_project[context.project_id] = [
       vms for vms in gce.get_instances(context).values()
       if not vms.is_gke_node()
   ]
@@ -40,6 +38,7 @@ def prepare_rule(context: models.Context):
 
 def run_rule(context: models.Context, report: lint.LintReportRuleInterface):
   """Calculating Instance's disk IOPS and Throughput limits"""
+  instances = instances_by_project.get(context.project_id)
   if not instances:
     report.add_skipped(None, 'no instances found')
     return
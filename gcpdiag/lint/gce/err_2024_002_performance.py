@@ -19,13 +19,12 @@ Threshold for CPU Usage, Memory Usage, Disk Usage is 95%.
 """
 
 import operator as op
+from typing import Dict, List
 
 from gcpdiag import lint, models
 from gcpdiag.lint.gce import utils
 from gcpdiag.queries import gce, monitoring
 
-vm = None
-project = None
 within_hours = 9
 within_str = 'within %dh, d\'%s\'' % (within_hours,
                                       monitoring.period_aligned_now(5))
@@ -33,9 +32,9 @@ within_str = 'within %dh, d\'%s\'' % (within_hours,
 UTILIZATION_THRESHOLD = 0.95
 IO_LATENCY_THRESHOLD = 1500
 
-mem_search = None
-disk_search = None
-instances = []
+mem_search_by_project: Dict[str, utils.SerialOutputSearch] = {}
+disk_search_by_project: Dict[str, utils.SerialOutputSearch] = {}
+instances_by_project: Dict[str, List[gce.Instance]] = {}
 
 
 def prepare_rule(context: models.Context):
@@ -61,20 +60,16 @@ def prepare_rule(context: models.Context):
   OR "A stop job is running for Security ...diting Service "
   OR "A stop job is running for Security ...Auditing Service ")'''
 
-  global mem_search
-  mem_search = utils.SerialOutputSearch(context,
-                                        search_strings=vm_oom_pattern,
-                                        custom_filter=filter_oom_str)
+  mem_search_by_project[context.project_id] = utils.SerialOutputSearch(
+      context, search_strings=vm_oom_pattern, custom_filter=filter_oom_str)
 
-  global disk_search
-  disk_search = utils.SerialOutputSearch(
+  disk_search_by_project[context.project_id] = utils.SerialOutputSearch(
       context,
       search_strings=vm_disk_space_error_pattern,
       custom_filter=filter_disk_str)
 
   # Fetching the list of instances in the project
-  global instances
-  instances = [
+  instances_by_project[context.project_id] = [
       vm for vm in gce.get_instances(context).values() if not vm.is_gke_node()
   ]
 
@@ -82,10 +77,14 @@ def prepare_rule(context: models.Context):
 def run_rule(context: models.Context, report: lint.LintReportRuleInterface):
   """Checking VM performance"""
 
+  instances = instances_by_project.get(context.project_id)
   if not instances:
     report.add_skipped(None, 'no instances found')
     return
 
+  mem_search = mem_search_by_project[context.project_id]
+  disk_search = disk_search_by_project[context.project_id]
+
   for i in sorted(instances, key=op.attrgetter('project_id', 'full_path')):
     if not i.is_running:
       report.add_skipped(i, reason=f'VM {i.name} is in {i.status} state')
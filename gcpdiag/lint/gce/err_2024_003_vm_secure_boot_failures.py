@@ -18,14 +18,16 @@ configurations or if there are Secure boot related fail events in
 cloud logging.
 """
 
+from typing import Dict
+
 from boltons.iterutils import get_path
 
 from gcpdiag import lint, models
 from gcpdiag.lint.gce import utils
 from gcpdiag.queries import gce
 
-shutdown_logs: utils.QueryCloudLogs
-boot_fail_event: utils.SerialOutputSearch
+shutdown_logs_by_project: Dict[str, utils.QueryCloudLogs] = {}
+boot_fail_event_by_project: Dict[str, utils.SerialOutputSearch] = {}
 
 
 def prepare_rule(context: models.Context):
@@ -33,18 +35,16 @@ def prepare_rule(context: models.Context):
   resource_type = 'gce_instance'
   filter_log = ['severity=ERROR']
   logid = ['compute.googleapis.com%2Fshielded_vm_integrity']
-  global shutdown_logs
-  shutdown_logs = utils.QueryCloudLogs(context.project_id, resource_type,
-                                       filter_log, logid)
+  shutdown_logs_by_project[context.project_id] = utils.QueryCloudLogs(
+      context.project_id, resource_type, filter_log, logid)
 
   boot_fail_str = [
       'Failed to start image', 'Failed to load image',
       'Verification failed: (0x1A) Security Violation', 'Binary is blacklisted'
   ]
 
-  global boot_fail_event
-  boot_fail_event = utils.SerialOutputSearch(context,
-                                             search_strings=boot_fail_str)
+  boot_fail_event_by_project[context.project_id] = utils.SerialOutputSearch(
+      context, search_strings=boot_fail_str)
 
 
 def run_rule(context: models.Context, report: lint.LintReportRuleInterface):
@@ -54,6 +54,8 @@ def run_rule(context: models.Context, report: lint.LintReportRuleInterface):
     report.add_skipped(None, 'no instances found')
     return
 
+  shutdown_logs = shutdown_logs_by_project[context.project_id]
+  boot_fail_event = boot_fail_event_by_project[context.project_id]
   for i in sorted(instances):
     if i.secure_boot_enabled():
       temp = None
@@ -18,7 +18,7 @@ model. Following protocols must be allowed: TCP, UDP, SCTP, ICMP, ESP, AH.
 """
 
 from gcpdiag import lint, models, utils
-from gcpdiag.queries import gke
+from gcpdiag.queries import gke, network
 
 # All ports must be allowed, but only verify a fixed set.
 VERIFY_PORTS = {  #
@@ -36,31 +36,37 @@ def prefetch_rule(context: models.Context):
 
 
 def _run_rule_cluster(report: lint.LintReportRuleInterface, c: gke.Cluster):
-  network = c.network
+  cluster_network = c.network
   if not c.nodepools:
     report.add_skipped(c, 'no nodepools')
     return
 
   src_net = c.pod_ipv4_cidr
 
+  # Check the connectivity to all the node pools at once.
+  queries = []
   for np in c.nodepools:
     tags = np.node_tags
     if c.is_autopilot:
       # use default tags for autopilot clusters
       tags = [f'gke-{c.name}-{c.cluster_hash}-node']
     for (proto, port) in utils.iter_dictlist(VERIFY_PORTS):
-      result = network.firewall.check_connectivity_ingress(
-          src_ip=src_net,
-          ip_protocol=proto,
-          port=port,
-          target_service_account=np.service_account,
-          target_tags=tags)
+      queries.append((np,
+                      network.FirewallCheckQuery(
+                          src_ip=src_net,
+                          ip_protocol=proto,
+                          port=port,
+                          target_service_account=np.service_account,
+                          target_tags=tags)))
+  results = cluster_network.firewall.check_connectivity_ingress_batch(
+      [query for _, query in queries])
 
-      if result.action == 'deny':
-        report.add_failed(
-            c, (f'connections from {src_net} to {proto}:{port} blocked by '
-                f'{result.matched_by_str} (node pool: {np.name})'))
-        return
+  for (np, query), result in zip(queries, results):
+    if result.action == 'deny':
+      report.add_failed(
+          c, (f'connections from {src_net} to {query.ip_protocol}:{query.port} '
+              f'blocked by {result.matched_by_str} (node pool: {np.name})'))
+      return
   report.add_ok(c)
 
 
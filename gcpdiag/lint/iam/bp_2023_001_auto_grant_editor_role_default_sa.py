@@ -17,21 +17,23 @@ Policy constraint AutomaticIamGrantsForDefaultServiceAccounts is strongly recomm
 enforced in production projects according to security best practices.
 """
 
+from typing import Dict
+
 from gcpdiag import lint, models
 from gcpdiag.queries import crm, orgpolicy
 
-constraints = None
+constraints_by_project: Dict[str, orgpolicy.PolicyConstraint] = {}
 
 
 def prefetch_rule(context: models.Context):
-  global constraints
-  constraints = orgpolicy.get_effective_org_policy(
+  constraints_by_project[context.project_id] = orgpolicy.get_effective_org_policy(
       context.project_id,
       "constraints/iam.automaticIamGrantsForDefaultServiceAccounts")
 
 
 def run_rule(context: models.Context, report: lint.LintReportRuleInterface):
   project = crm.get_project(context.project_id)
+  constraints = constraints_by_project.get(context.project_id)
   if not constraints:
     report.add_failed(project)
   elif constraints.is_enforced():
@@ -13,6 +13,7 @@
 # limitations under the License.
 """Tests for LintRuleRepository"""
 
+import threading
 from functools import cached_property
 
 import pytest
@@ -32,6 +33,7 @@ class FakeModulesGateway:
 
   def __init__(self, modules_by_name):
     self.modules_by_name = modules_by_name
+    self.imported = []
 
   def list_pkg_modules(self, pkg):
     return [
@@ -39,6 +41,7 @@ class FakeModulesGateway:
     ]
 
   def get_module(self, name):
+    self.imported.append(name)
     return self.modules_by_name[name]
 
 
@@ -80,11 +83,13 @@ class Setup:
                modules_by_name,
                load_extended=None,
                include=None,
-               exclude=None):
+               exclude=None,
+               manifest=None):
     self.modules_by_name = modules_by_name
     self.load_extended = load_extended
     self.include = include
     self.exclude = exclude
+    self.manifest = manifest
 
   @cached_property
   def repo(self):
@@ -92,7 +97,8 @@ class Setup:
                               modules_gateway=self.modules_gw,
                               execution_strategy=self.execution_strategy,
                               exclude=self.exclude,
-                              include=self.include)
+                              include=self.include,
+                              manifest=self.manifest)
 
   @cached_property
   def modules_gw(self):
@@ -157,6 +163,122 @@ def test_async_happy_path():
   assert fake_module2.get_method('async_run_rule') in executed_run_rule_fs
 
 
+def test_sync_parallel_run_rules():
+  world_done = threading.Event()
+  events = []
+
+  def hello_prefetch(context):
+    del context
+    # only completes if the other rule runs without waiting for this one
+    world_done.wait(10)
+
+  def hello_run(context, rule_report):
+    del context, rule_report
+    events.append('run hello')
+
+  def world_run(context, rule_report):
+    del context, rule_report
+    events.append('run world')
+    world_done.set()
+
+  repo = LintRuleRepository(
+      run_parallel=True,
+      modules_gateway=FakeModulesGateway({
+          'gcpdiag.lint.fakeprod.err_2022_001_hello':
+              mk_simple_rule_module(methods={
+                  'prefetch_rule': hello_prefetch,
+                  'run_rule': hello_run
+              }),
+          'gcpdiag.lint.fakeprod.err_2022_002_world':
+              mk_simple_rule_module(methods={'run_rule': world_run}),
+      }))
+
+  class Handler:
+
+    def process_rule_report(self, rule_report):
+      events.append(f'finish {rule_report.rule}')
+
+  repo.result.add_result_handler(Handler())
+  repo.load_rules(FakePyPkg('gcpdiag.lint.fakeprod', 'fake.path'))
+  repo.run_rules(context=None)
+
+  assert events == [
+      'run world', 'run hello', 'finish fakeprod/ERR/2022_001',
+      'finish fakeprod/ERR/2022_002'
+  ]
+
+
+def test_sync_parallel_run_rules_streaming():
+  hello_finished = threading.Event()
+  events = []
+
+  def hello_run(context, rule_report):
+    del context, rule_report
+    events.append('run hello')
+
+  def world_prefetch(context):
+    del context
+    # only completes early if the report of the first rule is finished
+    # without waiting for this prefetch
+    if hello_finished.wait(10):
+      events.append('prefetch world')
+
+  def world_run(context, rule_report):
+    del context, rule_report
+    events.append('run world')
+
+  repo = LintRuleRepository(
+      run_parallel=True,
+      modules_gateway=FakeModulesGateway({
+          'gcpdiag.lint.fakeprod.err_2022_001_hello':
+              mk_simple_rule_module(methods={'run_rule': hello_run}),
+          'gcpdiag.lint.fakeprod.err_2022_002_world':
+              mk_simple_rule_module(methods={
+                  'prefetch_rule': world_prefetch,
+                  'run_rule': world_run
+              }),
+      }))
+
+  class Handler:
+
+    def process_rule_report(self, rule_report):
+      events.append(f'finish {rule_report.rule}')
+      hello_finished.set()
+
+  repo.result.add_result_handler(Handler())
+  repo.load_rules(FakePyPkg('gcpdiag.lint.fakeprod', 'fake.path'))
+  repo.run_rules(context=None)
+
+  assert events == [
+      'run hello', 'finish fakeprod/ERR/2022_001', 'prefetch world',
+      'run world', 'finish fakeprod/ERR/2022_002'
+  ]
+
+
+def test_sync_parallel_run_rules_exception():
+
+  class RuleInterrupted(BaseException):
+    pass
+
+  def hello_run(context, rule_report):
+    del context, rule_report
+    raise RuleInterrupted()
+
+  repo = LintRuleRepository(
+      run_parallel=True,
+      modules_gateway=FakeModulesGateway({
+          'gcpdiag.lint.fakeprod.err_2022_001_hello':
+              mk_simple_rule_module(methods={
+                  'prefetch_rule': lambda context: None,
+                  'run_rule': hello_run
+              }),
+      }))
+  repo.load_rules(FakePyPkg('gcpdiag.lint.fakeprod', 'fake.path'))
+  # the exception is raised in the main thread instead of waiting forever
+  with pytest.raises(RuleInterrupted):
+    repo.run_rules(context=None)
+
+
 def test_no_entrypoint_raises():
   fake_module1 = mk_simple_rule_module(methods={'dummy': lambda: None})
 
@@ -425,3 +547,41 @@ def test_exclude_product():
   assert fake_module1.get_method('run_rule') not in executed_run_rule_fs
   assert fake_module2.get_method('run_rule') not in executed_run_rule_fs
   assert fake_module3.get_method('run_rule') in executed_run_rule_fs
+
+
+def test_manifest_skips_excluded_modules():
+
+  def manifest_entry(rule_class, rule_id):
+    return {
+        'product': 'fakeprod',
+        'rule_class': rule_class,
+        'rule_id': rule_id,
+        'short_desc': 'hello world, fake module',
+        'long_desc': '',
+        'keywords': [],
+    }
+
+  setup = Setup(
+      modules_by_name={
+          'gcpdiag.lint.fakeprod.err_2022_001_hello': mk_simple_rule_module(),
+          'gcpdiag.lint.fakeprod.bp_2022_001_world': mk_simple_rule_module(),
+          'gcpdiag.lint.fakeprod.warn_2022_001_new': mk_simple_rule_module(),
+      },
+      include=[LintRulesPattern('fakeprod/ERR/*')],
+      manifest={
+          'gcpdiag.lint.fakeprod.err_2022_001_hello':
+              manifest_entry('ERR', '2022_001'),
+          'gcpdiag.lint.fakeprod.bp_2022_001_world':
+              manifest_entry('BP', '2022_001'),
+      })
+
+  setup.repo.load_rules(FakePyPkg('gcpdiag.lint.fakeprod', 'fake.path'))
+  setup.repo.run_rules(context=None)
+
+  assert [str(r) for r in setup.execution_strategy.executed_rules
+         ] == ['fakeprod/ERR/2022_001']
+  # modules that are not in the manifest are still imported
+  assert setup.modules_gw.imported == [
+      'gcpdiag.lint.fakeprod.err_2022_001_hello',
+      'gcpdiag.lint.fakeprod.warn_2022_001_new'
+  ]
@@ -0,0 +1,120 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Lint as: python3
+"""Manifest of the lint rule modules.
+
+The manifest is an index of all lint rule modules (product, class, id,
+docstring and keywords), generated at build time with:
+
+  python -m gcpdiag.lint.manifest
+
+It allows LintRuleRepository to resolve the include/exclude patterns without
+importing every rule module, so that only the rules that will run are
+imported. The modification times of the rule modules are recorded, and the
+manifest is ignored when it doesn't match the rule modules on disk anymore
+(except in frozen builds, where the modules aren't files).
+"""
+
+import ast
+import json
+import logging
+import pathlib
+import re
+import sys
+from typing import Any, Dict, Optional
+
+MANIFEST_VERSION = 1
+MANIFEST_PATH = pathlib.Path(__file__).parent / 'rules_manifest.json'
+
+_LINT_DIR = pathlib.Path(__file__).parent
+_RULE_FILE_RE = re.compile(
+    r'^(?P<class_prefix>[a-z]+(?:_ext)?)_(?P<rule_id>\d+_\d+)_.*(?<!_test)\.py$')
+
+
+def _rule_files() -> Dict[str, pathlib.Path]:
+  """Return the rule module files, by module name."""
+  files = {}
+  for path in sorted(_LINT_DIR.glob('*/*.py')):
+    if not _RULE_FILE_RE.match(path.name):
+      continue
+    files[f'{__package__}.{path.parent.name}.{path.stem}'] = path
+  return files
+
+
+def _parse_rule_module(path: pathlib.Path) -> Dict[str, Any]:
+  tree = ast.parse(path.read_text(encoding='utf-8'), filename=str(path))
+  doc = ast.get_docstring(tree) or ''
+  doc_lines = doc.splitlines()
+  keywords = []
+  for node in tree.body:
+    if isinstance(node, ast.Assign) and any(
+        isinstance(t, ast.Name) and t.id == 'keywords' for t in node.targets):
+      try:
+        keywords = list(ast.literal_eval(node.value))
+      except ValueError:
+        pass
+  m = _RULE_FILE_RE.match(path.name)
+  assert m is not None
+  return {
+      'product': path.parent.name,
+      'rule_class': m.group('class_prefix').upper(),
+      'rule_id': m.group('rule_id'),
+      'short_desc': doc_lines[0] if doc_lines else '',
+      'long_desc': '\n'.join(doc_lines[2:]),
+      'keywords': keywords,
+      'mtime': path.stat().st_mtime,
+  }
+
+
+def build_manifest() -> Dict[str, Any]:
+  return {
+      'version': MANIFEST_VERSION,
+      'modules': {
+          name: _parse_rule_module(path)
+          for name, path in _rule_files().items()
+      },
+  }
+
+
+def write_manifest(path: pathlib.Path = MANIFEST_PATH) -> None:
+  with open(path, 'w', encoding='utf-8') as f:
+    json.dump(build_manifest(), f, indent=1, sort_keys=True)
+
+
+def load_manifest(
+    path: pathlib.Path = MANIFEST_PATH) -> Optional[Dict[str, Dict[str, Any]]]:
+  """Return the rule modules of the manifest, by module name.
+
+  None is returned if there is no manifest, or if it is out of date."""
+  try:
+    with open(path, encoding='utf-8') as f:
+      manifest = json.load(f)
+  except (OSError, ValueError):
+    return None
+  if manifest.get('version') != MANIFEST_VERSION:
+    return None
+  modules = manifest.get('modules', {})
+  if not getattr(sys, 'frozen', False):
+    files = _rule_files()
+    if files.keys() != modules.keys() or any(
+        path.stat().st_mtime != modules[name]['mtime']
+        for name, path in files.items()):
+      logging.debug('lint rules manifest is out of date, ignoring it')
+      return None
+  return modules
+
+
+if __name__ == '__main__':
+  write_manifest()
@@ -0,0 +1,54 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Test code in manifest.py."""
+
+import inspect
+import json
+import pathlib
+import tempfile
+import unittest
+
+from gcpdiag.lint import manifest
+from gcpdiag.lint.gke import err_2021_001_logging_perm
+
+
+class ManifestTest(unittest.TestCase):
+  """Test the lint rules manifest."""
+
+  def test_build_manifest(self):
+    modules = manifest.build_manifest()['modules']
+    entry = modules[err_2021_001_logging_perm.__name__]
+    self.assertEqual(entry['product'], 'gke')
+    self.assertEqual(entry['rule_class'], 'ERR')
+    self.assertEqual(entry['rule_id'], '2021_001')
+    doc_lines = inspect.getdoc(err_2021_001_logging_perm).splitlines()
+    self.assertEqual(entry['short_desc'], doc_lines[0])
+    self.assertEqual(entry['long_desc'], '\n'.join(doc_lines[2:]))
+    self.assertFalse(any(name.endswith('_test') for name in modules))
+
+  def test_load_manifest(self):
+    with tempfile.TemporaryDirectory() as tmpdir:
+      path = pathlib.Path(tmpdir) / 'rules_manifest.json'
+      self.assertIsNone(manifest.load_manifest(path))
+      manifest.write_manifest(path)
+      modules = manifest.load_manifest(path)
+      self.assertIn(err_2021_001_logging_perm.__name__, modules)
+
+      # a modified rule module makes the manifest out of date
+      with open(path, encoding='utf-8') as f:
+        data = json.load(f)
+      data['modules'][err_2021_001_logging_perm.__name__]['mtime'] -= 1
+      with open(path, 'w', encoding='utf-8') as f:
+        json.dump(data, f)
+      self.assertIsNone(manifest.load_manifest(path))
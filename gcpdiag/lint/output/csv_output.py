@@ -32,7 +32,7 @@ class CSVOutput(base_output.BaseOutput):
                show_ok: bool = True,
                show_skipped: bool = False):
     super().__init__(file, log_info_for_progress_only, show_ok, show_skipped)
-    self.writer = csv.DictWriter(sys.stdout, fieldnames=self.columns)
+    self.writer = csv.DictWriter(self.file, fieldnames=self.columns)
 
   @property
   def result_handler(self) -> 'lint.LintResultsHandler':
@@ -17,9 +17,13 @@
 
 import abc
 import dataclasses
+import functools
 import re
+import threading
+import weakref
 from types import MappingProxyType
-from typing import Any, Generic, Iterable, List, Mapping, Optional, TypeVar
+from typing import (Any, Generic, Iterable, List, Mapping, Optional, Tuple,
+                    TypeVar, cast)
 
 from gcpdiag import utils
 
@@ -224,27 +228,39 @@ class Context:
 
 
 class Resource(abc.ABC):
-  """Represents a single resource in GCP."""
+  """Represents a single resource in GCP.
+
+  Resources are immutable: their full_path is computed once and used as
+  identity for hashing, comparisons and sorting (see _identity).
+  """
   _project_id: str
 
   def __init__(self, project_id):
     self._project_id = project_id
 
   def __str__(self):
-    return self.full_path
+    return self._identity
 
   def __hash__(self):
-    return self.full_path.__hash__()
+    return self._identity.__hash__()
 
   def __lt__(self, other):
-    return self.full_path < other.full_path
+    return self._identity < other._identity
 
   def __eq__(self, other):
     if self.__class__ == other.__class__:
-      return self.full_path == other.full_path
+      return self is other or self._identity == other._identity
     else:
       return False
 
+  @functools.cached_property
+  def _identity(self) -> str:
+    """full_path of the resource, computed once.
+
+    full_path often parses the selfLink with a regular expression, and
+    resources are used as dict keys, set members and sort keys."""
+    return self.full_path
+
   @property
   def project_id(self) -> str:
     """Project id (not project number)."""
@@ -268,3 +284,35 @@ class Resource(abc.ABC):
     Example: 'gke1'
     """
     return self.full_path
+
+
+ResourceT = TypeVar('ResourceT', bound=Resource)
+
+# Resources by class and full_path, see intern_resource().
+_interned_resources: 'weakref.WeakValueDictionary[Tuple[type, str], Resource]' \
+    = weakref.WeakValueDictionary()
+_interned_resources_lock = threading.Lock()
+
+
+def intern_resource(resource: ResourceT) -> ResourceT:
+  """Returns the resource equal to `resource` that was interned before, if it
+  has the same resource data, otherwise interns `resource` and returns it.
+
+  This is used so that the same resource fetched through different queries
+  (e.g. instances listed for several contexts) shares one object. Resources
+  without _resource_data are returned as is. Resources are kept in the table
+  as long as they are referenced elsewhere.
+  """
+  resource_data = getattr(resource, '_resource_data', None)
+  if resource_data is None:
+    return resource
+  # pylint: disable=protected-access
+  key = (resource.__class__, resource._identity)
+  with _interned_resources_lock:
+    interned = _interned_resources.get(key)
+    if interned is not None and getattr(interned, '_resource_data',
+                                        None) == resource_data:
+      return cast(ResourceT, interned)
+    # first fetch, or the resource changed since it was interned
+    _interned_resources[key] = resource
+  return resource
@@ -151,3 +151,41 @@ def test_setdefault_non_existing_key():
   param = models.Parameter()
   param.setdefault('new_key', '300')
   assert param['new_key'] == '300'
+
+
+class CountingResource(models.Resource):
+  """Resource counting the calls of full_path."""
+
+  def __init__(self, project_id, resource_data):
+    super().__init__(project_id)
+    self._resource_data = resource_data
+    self.full_path_calls = 0
+
+  @property
+  def full_path(self):
+    self.full_path_calls += 1
+    return f'projects/{self.project_id}/things/{self._resource_data["name"]}'
+
+
+def test_resource_identity_memoized():
+  r1 = CountingResource('p', {'name': 'a'})
+  r2 = CountingResource('p', {'name': 'a'})
+  r3 = CountingResource('p', {'name': 'b'})
+  assert r1 == r2
+  assert r1 != r3
+  assert len({r1, r2, r3}) == 2
+  assert sorted([r3, r1]) == [r1, r3]
+  assert str(r1) == 'projects/p/things/a'
+  assert r1.full_path_calls == 1
+
+
+def test_intern_resource():
+  r1 = models.intern_resource(CountingResource('p', {'name': 'a'}))
+  assert models.intern_resource(CountingResource('p', {'name': 'a'})) is r1
+  # changed data (e.g. fetched again with the cache bypassed)
+  r2 = models.intern_resource(CountingResource('p', {'name': 'a', 'x': 1}))
+  assert r2 is not r1
+  assert models.intern_resource(CountingResource('p', {
+      'name': 'a',
+      'x': 1
+  })) is r2
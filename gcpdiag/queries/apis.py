@@ -15,21 +15,25 @@
 # Lint as: python3
 """Build and cache GCP APIs + handle authentication."""
 
+import collections
 import json
 import logging
 import os
-from typing import Dict, Optional, Set
+import threading
+from typing import Dict, List, Optional, Set
 
 import google.auth
 import google_auth_httplib2
 import googleapiclient.http
 import httplib2
 from google.api_core.client_options import ClientOptions
+from google.auth import credentials as auth_credentials
 from google.auth import exceptions
 from google.oauth2 import credentials as oauth2_credentials
-from googleapiclient import discovery
+from googleapiclient import discovery, discovery_cache
 
 from gcpdiag import caching, config, hooks, utils
+from gcpdiag.queries import apis_transport
 
 _credentials = None
 
@@ -40,6 +44,85 @@ AUTH_SCOPES = [
 ]
 
 
+class _HttpConnectionPool:
+  """Checkout/return pool of httplib2.Http objects keyed by endpoint.
+
+  httplib2.Http keeps persistent (keep-alive) connections, but it isn't
+  thread-safe. Every request checks out an idle Http object for the
+  endpoint it talks to (or creates a new one), and returns it once the
+  response has been read, so that the next request to the same endpoint can
+  reuse the open connection without two threads ever sharing one.
+
+  The object implements the request() method of httplib2.Http, so that it can
+  be wrapped by google_auth_httplib2.AuthorizedHttp.
+  """
+
+  def __init__(self):
+    self._lock = threading.Lock()
+    self._idle: Dict[str, List[httplib2.Http]] = collections.defaultdict(list)
+    self.connections_opened = 0
+    self.connections_reused = 0
+
+  def _checkout(self, conn_key: str) -> httplib2.Http:
+    with self._lock:
+      idle = self._idle[conn_key]
+      http = idle.pop() if idle else httplib2.Http()
+      conn = http.connections.get(conn_key)
+      if conn is not None and conn.sock is not None:
+        self.connections_reused += 1
+      else:
+        self.connections_opened += 1
+      return http
+
+  def _return(self, conn_key: str, http: httplib2.Http):
+    with self._lock:
+      self._idle[conn_key].append(http)
+
+  def request(self, uri, *args, **kwargs):
+    scheme, authority, _, _ = httplib2.urlnorm(uri)
+    conn_key = f'{scheme}:{authority}'
+    http = self._checkout(conn_key)
+    try:
+      result = http.request(uri, *args, **kwargs)
+    except Exception:
+      # don't reuse connections that might be in an undefined state
+      http.close()
+      raise
+    self._return(conn_key, http)
+    return result
+
+  def close(self):
+    with self._lock:
+      for idle in self._idle.values():
+        for http in idle:
+          http.close()
+      self._idle.clear()
+
+  def get_stats(self) -> Dict[str, int]:
+    with self._lock:
+      return {
+          'opened': self.connections_opened,
+          'reused': self.connections_reused,
+      }
+
+
+_http_pool = _HttpConnectionPool()
+
+
+def get_http_connection_stats() -> Dict[str, int]:
+  """Return the number of HTTP connections opened and reused by API calls."""
+  return _http_pool.get_stats()
+
+
+def log_http_connection_stats():
+  stats = get_http_connection_stats()
+  total = stats['opened'] + stats['reused']
+  if total:
+    logging.info('HTTP connections: %d opened, %d reused (%.0f%% reuse rate)',
+                 stats['opened'], stats['reused'],
+                 100 * stats['reused'] / total)
+
+
 def _auth_method():
   """Calculate proper authentication method based on provided configuration
 
@@ -89,6 +172,9 @@ def set_credentials(cred_json):
 
 
 def get_credentials():
+  if apis_transport.is_offline():
+    # requests are answered from a cassette or by a stand-in server
+    return auth_credentials.AnonymousCredentials()
   if _auth_method() == 'adc':
     return _get_credentials_adc()
   elif _auth_method() == 'key':
@@ -115,9 +201,12 @@ def login():
 def get_user_email() -> str:
   if config.get('universe_domain') != 'googleapis.com':
     return 'TPC user'
-  credentials = get_credentials().with_quota_project(None)
+  credentials = get_credentials()
+  if not isinstance(credentials, auth_credentials.AnonymousCredentials):
+    credentials = credentials.with_quota_project(None)
 
-  http = google_auth_httplib2.AuthorizedHttp(credentials, http=httplib2.Http())
+  http = google_auth_httplib2.AuthorizedHttp(
+      credentials, http=apis_transport.wrap_http(httplib2.Http()))
   resp, content = http.request('https://www.googleapis.com/userinfo/v2/me')
   if resp['status'] != '200':
     raise RuntimeError(f"can't determine user email. status={resp['status']}")
@@ -126,6 +215,62 @@ def get_user_email() -> str:
   return data['email']
 
 
+def _download_discovery_document(service_name: str, version: str,
+                                 universe_domain: str) -> str:
+  """Download the discovery document of an API that isn't bundled with
+  googleapiclient."""
+  logging.debug('downloading discovery document for %s %s', service_name,
+                version)
+  uris = [
+      f'https://{service_name}.{universe_domain}/$discovery/rest?version={version}'
+  ]
+  if universe_domain == 'googleapis.com':
+    uris.append(
+        discovery.DISCOVERY_URI.format(api=service_name, apiVersion=version))
+  http = google_auth_httplib2.AuthorizedHttp(
+      get_credentials(), http=apis_transport.wrap_http(_http_pool))
+  for uri in uris:
+    resp, content = http.request(uri)
+    if resp.status < 400:
+      return content.decode('utf-8')
+  raise discovery.UnknownApiNameOrVersion(
+      f'name: {service_name}  version: {version}')
+
+
+def _load_discovery_document(service_name: str, version: str,
+                             universe_domain: str) -> str:
+  """Return the discovery document of an API as JSON string.
+
+  Documents bundled with googleapiclient are read from its installation
+  directory, and the others are stored in the disk cache (in
+  config.get_cache_dir()) for `discovery_cache_ttl_seconds`, so that they
+  don't need to be downloaded at every execution."""
+  content = discovery_cache.get_static_doc(service_name, version)
+  if content:
+    return content
+  disk_cache = caching.get_disk_cache()
+  key = f'discovery-document:{universe_domain}:{service_name}:{version}'
+  if disk_cache is not None:
+    content = disk_cache.get(key)
+    if content:
+      logging.debug('using cached discovery document for %s %s', service_name,
+                    version)
+      return content
+  content = _download_discovery_document(service_name, version,
+                                         universe_domain)
+  if disk_cache is not None:
+    disk_cache.set(key,
+                   content,
+                   expire=config.get('discovery_cache_ttl_seconds'))
+  return content
+
+
+@caching.cached_api_call(in_memory=True)
+def _get_discovery_document(service_name: str, version: str,
+                            universe_domain: str) -> str:
+  return _load_discovery_document(service_name, version, universe_domain)
+
+
 @caching.cached_api_call(in_memory=True)
 def get_api(service_name: str,
             version: str,
@@ -153,8 +298,12 @@ def get_api(service_name: str,
 
     # thread safety: create a new AuthorizedHttp object for every request
     # https://github.com/googleapis/google-api-python-client/blob/master/docs/thread_safety.md
-    new_http = google_auth_httplib2.AuthorizedHttp(credentials,
-                                                   http=httplib2.Http())
+    # The underlying httplib2.Http objects are checked out from a pool, so
+    # that connections are reused, but never used by two threads at once.
+    # The requests can also be recorded, replayed or redirected (see
+    # apis_transport).
+    new_http = google_auth_httplib2.AuthorizedHttp(
+        credentials, http=apis_transport.wrap_http(_http_pool))
     return googleapiclient.http.HttpRequest(new_http, *args, **kwargs)
 
   universe_domain = config.get('universe_domain')
@@ -171,12 +320,13 @@ def get_api(service_name: str,
     client_options.api_endpoint = f'https://{service_name}.{universe_domain}'
   if service_name in ['compute']:
     client_options.api_endpoint += f'/{service_name}/{version}'
-  api = discovery.build(service_name,
-                        version,
-                        cache_discovery=False,
-                        credentials=credentials,
-                        requestBuilder=_request_builder,
-                        client_options=client_options)
+  # the document is kept as JSON string, because build_from_document()
+  # modifies the parsed document.
+  document = _get_discovery_document(service_name, version, universe_domain)
+  api = discovery.build_from_document(document,
+                                      credentials=credentials,
+                                      requestBuilder=_request_builder,
+                                      client_options=client_options)
   return api
 
 
@@ -0,0 +1,340 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Stand-in HTTP server of the Google APIs, serving the test-data fixtures.
+
+The fixtures in test-data/*/json-dumps are created by the Makefile of every
+test project with curl. The server finds the REST path of every fixture by
+running `make -n` (dry run, nothing is executed) with the fake project ids,
+and serves the fixtures over the same paths, including paging (pageToken) and
+batch requests, so that the real googleapiclient code paths can be used
+without a live project, e.g. to benchmark gcpdiag offline:
+
+  python -m gcpdiag.queries.apis_stand_in --port 8080 --latency-ms 80
+  gcpdiag lint --project gcpdiag-gke1-aaaa --api-endpoint http://localhost:8080
+
+See apis_transport.py for the way requests are sent to the server: the host
+name of the API is the first component of the path. Requests for which there
+is no fixture get a 404 (Not Found) error response.
+"""
+
+import argparse
+import dataclasses
+import email.parser
+import http.server
+import json
+import logging
+import pathlib
+import random
+import re
+import subprocess
+import threading
+import time
+import urllib.parse
+from typing import Dict, Iterable, List, Optional, Tuple
+
+TEST_DATA_DIR = pathlib.Path(__file__).parents[2] / 'test-data'
+
+# Query parameters that don't change the returned data.
+IGNORED_PARAMS = frozenset(['alt', 'prettyPrint', 'fields', 'key'])
+# Query parameters that must be equal for a fixture to be returned.
+EXACT_PARAMS = frozenset(['pageToken'])
+
+_URL_RE = re.compile(r"""['"]?(https://[^'"\s]+)['"]?""")
+_OUTPUT_RE = re.compile(r'>\s*(\S+\.json)\s*$')
+_METHOD_RE = re.compile(r'(?:-X|--request)\s*(\w+)')
+_DATA_RE = re.compile(r'\s(?:-d|--data(?:-\w+)?)\s')
+
+
+@dataclasses.dataclass(frozen=True)
+class Route:
+  method: str
+  host: str
+  path: str
+  params: Tuple[Tuple[str, str], ...]
+  file: pathlib.Path
+
+
+def _parse_params(query: str) -> Dict[str, str]:
+  return {
+      k: v[-1]
+      for k, v in urllib.parse.parse_qs(query).items()
+      if k not in IGNORED_PARAMS
+  }
+
+
+def _project_id(project_dir: pathlib.Path) -> str:
+  """Return the (fake) project id of the fixtures of a test project."""
+  # pylint: disable=import-outside-toplevel
+  from gcpdiag.queries import apis_stub
+  for project_id, json_dir in apis_stub.JSON_PROJECT_DIR.items():
+    if pathlib.Path(json_dir).parent == project_dir and not project_id.isdigit():
+      return project_id
+  return f'gcpdiag-{project_dir.name}-aaaa'
+
+
+def _make_commands(project_dir: pathlib.Path) -> Iterable[str]:
+  """Return the shell commands that would create the fixtures, as printed by
+  `make -n`, with continuation lines joined."""
+  result = subprocess.run(
+      [
+          'make', '-s', '-n', '-B', '-C',
+          str(project_dir), f'PROJECT_ID={_project_id(project_dir)}',
+          'PROJECT_ID_SUFFIX=$(FAKE_PROJECT_ID_SUFFIX)',
+          'PROJECT_NR=$(FAKE_PROJECT_NR)', 'ORG_ID=$(FAKE_ORG_ID)',
+          'FOLDER_ID_1=$(FAKE_FOLDER_ID_1)', 'FOLDER_ID_2=$(FAKE_FOLDER_ID_2)',
+          'ACCESS_TOKEN='
+      ],
+      stdout=subprocess.PIPE,
+      stderr=subprocess.DEVNULL,
+      text=True,
+      check=False)
+  return result.stdout.replace('\\\n', ' ').splitlines()
+
+
+def parse_routes(project_dir: pathlib.Path) -> List[Route]:
+  """Return the routes of the fixtures of a test project."""
+  routes = []
+  for command in _make_commands(project_dir):
+    url_match = _URL_RE.search(command)
+    output_match = _OUTPUT_RE.search(command)
+    if not url_match or not output_match or '$' in url_match.group(1):
+      continue
+    file = project_dir / output_match.group(1)
+    if not file.exists():
+      continue
+    method_match = _METHOD_RE.search(command)
+    if method_match:
+      method = method_match.group(1).upper()
+    elif _DATA_RE.search(command):
+      method = 'POST'
+    else:
+      method = 'GET'
+    url = urllib.parse.urlsplit(url_match.group(1))
+    routes.append(
+        Route(method=method,
+              host=url.netloc,
+              path=url.path,
+              params=tuple(sorted(_parse_params(url.query).items())),
+              file=file))
+  return routes
+
+
+class Routes:
+  """Routes of all the test projects, indexed by method, host and path."""
+
+  def __init__(self, routes: Iterable[Route] = ()):
+    self._routes: Dict[Tuple[str, str, str], List[Route]] = {}
+    for route in routes:
+      self.add(route)
+
+  def add(self, route: Route):
+    self._routes.setdefault((route.method, route.host, route.path),
+                            []).append(route)
+
+  def __len__(self) -> int:
+    return sum(len(routes) for routes in self._routes.values())
+
+  def find(self, method: str, host: str, path: str,
+           params: Dict[str, str]) -> Optional[Route]:
+    """Return the route of a request: the one matching most of the query
+    parameters, and all the EXACT_PARAMS."""
+    best = None
+    best_score = None
+    for route in self._routes.get((method, host, path), []):
+      route_params = dict(route.params)
+      if any(
+          route_params.get(p) != params.get(p) for p in EXACT_PARAMS):
+        continue
+      matched = sum(1 for k, v in route_params.items() if params.get(k) == v)
+      score = (matched, -len(route_params))
+      if best_score is None or score > best_score:
+        best, best_score = route, score
+    return best
+
+
+def load_routes(project_dirs: Optional[Iterable[pathlib.Path]] = None) -> Routes:
+  if project_dirs is None:
+    project_dirs = sorted(
+        p for p in TEST_DATA_DIR.iterdir() if (p / 'Makefile').exists())
+  routes = Routes()
+  for project_dir in project_dirs:
+    for route in parse_routes(project_dir):
+      routes.add(route)
+  return routes
+
+
+def _error(code: int, status: str, message: str) -> bytes:
+  return json.dumps({
+      'error': {
+          'code': code,
+          'message': message,
+          'status': status
+      }
+  }).encode('utf-8')
+
+
+class StandInServer(http.server.ThreadingHTTPServer):
+  """HTTP server answering the API requests with the fixtures.
+
+  Every request is delayed by `latency` seconds, plus a uniformly
+  distributed random delay between 0 and `jitter` seconds, to simulate the
+  latency of the real APIs.
+  """
+
+  daemon_threads = True
+
+  def __init__(self,
+               address: Tuple[str, int],
+               routes: Routes,
+               latency: float = 0.0,
+               jitter: float = 0.0):
+    super().__init__(address, _RequestHandler)
+    self.routes = routes
+    self.latency = latency
+    self.jitter = jitter
+    self._lock = threading.Lock()
+    self.requests = 0
+    self.not_found = 0
+
+  @property
+  def endpoint(self) -> str:
+    host, port = self.server_address[:2]
+    return f'http://{host}:{port}'
+
+  def respond(self, method: str, host: str, target: str) -> Tuple[int, bytes]:
+    """Return the status and content of the response to a (non-batch)
+    request."""
+    url = urllib.parse.urlsplit(target)
+    route = self.routes.find(method, host, url.path, _parse_params(url.query))
+    with self._lock:
+      self.requests += 1
+      if not route:
+        self.not_found += 1
+    if not route:
+      logging.debug('stand-in: no fixture for %s %s%s', method, host, target)
+      return 404, _error(404, 'NOT_FOUND',
+                         f'no fixture for {method} {host}{url.path}')
+    return 200, route.file.read_bytes()
+
+  def respond_batch(self, host: str, content_type: str,
+                    body: bytes) -> Tuple[str, bytes]:
+    """Answer a batch request (multipart/mixed of HTTP requests). Returns the
+    content type and content of the response."""
+    message = email.parser.BytesParser().parsebytes(
+        f'Content-Type: {content_type}\r\n\r\n'.encode('utf-8') + body)
+    boundary = f'batch_{random.getrandbits(64):016x}'
+    parts = []
+    for part in message.get_payload():
+      request = part.get_payload()
+      request_line = request.split('\n', 1)[0].strip()
+      method, target = request_line.split(' ')[:2]
+      status, content = self.respond(method, host, target)
+      content_id = part['Content-ID'] or ''
+      content_id = content_id.strip('<>')
+      parts.append(
+          f'--{boundary}\r\n'
+          'Content-Type: application/http\r\n'
+          f'Content-ID: <response-{content_id}>\r\n\r\n'
+          f'HTTP/1.1 {status} {http.HTTPStatus(status).phrase}\r\n'
+          'Content-Type: application/json; charset=UTF-8\r\n\r\n' +
+          content.decode('utf-8') + '\r\n')
+    return (f'multipart/mixed; boundary={boundary}',
+            (''.join(parts) + f'--{boundary}--\r\n').encode('utf-8'))
+
+
+class _RequestHandler(http.server.BaseHTTPRequestHandler):
+  """Request handler of the StandInServer, with the API host name as first
+  component of the path."""
+
+  protocol_version = 'HTTP/1.1'
+  server: StandInServer
+
+  def _handle(self, method: str):
+    length = int(self.headers.get('Content-Length') or 0)
+    body = self.rfile.read(length) if length else b''
+    delay = self.server.latency + random.uniform(0, self.server.jitter)
+    if delay > 0:
+      time.sleep(delay)
+    # /HOST/PATH?QUERY
+    _, host, target = (self.path + '/').split('/', 2)
+    target = '/' + target[:-1]
+    content_type = 'application/json; charset=UTF-8'
+    if urllib.parse.urlsplit(target).path.startswith('/batch'):
+      content_type, content = self.server.respond_batch(
+          host, self.headers.get('Content-Type', ''), body)
+      status = 200
+    else:
+      status, content = self.server.respond(method, host, target)
+    self.send_response(status)
+    self.send_header('Content-Type', content_type)
+    self.send_header('Content-Length', str(len(content)))
+    self.end_headers()
+    self.wfile.write(content)
+
+  def do_GET(self):  # pylint: disable=invalid-name
+    self._handle('GET')
+
+  def do_POST(self):  # pylint: disable=invalid-name
+    self._handle('POST')
+
+  def do_PATCH(self):  # pylint: disable=invalid-name
+    self._handle('PATCH')
+
+  def do_DELETE(self):  # pylint: disable=invalid-name
+    self._handle('DELETE')
+
+  def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+    logging.debug('stand-in: ' + format, *args)
+
+
+def main():
+  parser = argparse.ArgumentParser(
+      description='Serve the test-data fixtures over the Google APIs paths.')
+  parser.add_argument('--host', default='localhost')
+  parser.add_argument('--port', type=int, default=8080)
+  parser.add_argument('--latency-ms',
+                      type=float,
+                      default=0,
+                      help='Delay of every response (default: 0)')
+  parser.add_argument(
+      '--jitter-ms',
+      type=float,
+      default=0,
+      help='Maximum random delay added to the latency (default: 0)')
+  parser.add_argument('project_dirs',
+                      metavar='DIR',
+                      nargs='*',
+                      type=pathlib.Path,
+                      help='Test projects to serve (default: all in test-data)')
+  args = parser.parse_args()
+  logging.basicConfig(level=logging.INFO)
+
+  routes = load_routes(args.project_dirs or None)
+  server = StandInServer((args.host, args.port),
+                         routes,
+                         latency=args.latency_ms / 1000,
+                         jitter=args.jitter_ms / 1000)
+  logging.info('serving %d fixtures on %s', len(routes), server.endpoint)
+  try:
+    server.serve_forever()
+  except KeyboardInterrupt:
+    pass
+  finally:
+    server.server_close()
+    logging.info('%d requests, %d without fixture', server.requests,
+                 server.not_found)
+
+
+if __name__ == '__main__':
+  main()
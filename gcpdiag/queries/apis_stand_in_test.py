@@ -0,0 +1,107 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Test code in apis_stand_in.py."""
+
+import json
+import threading
+
+import googleapiclient.errors
+import pytest
+
+from gcpdiag import config
+from gcpdiag.queries import apis, apis_stand_in, apis_utils
+
+DUMMY_PROJECT_ID = 'gcpdiag-gce1-aaaa'
+GCE1_DIR = apis_stand_in.TEST_DATA_DIR / 'gce1'
+ZONE = 'europe-west1-b'
+
+
+def _load_json(name):
+  with open(GCE1_DIR / 'json-dumps' / name, encoding='utf-8') as f:
+    return json.load(f)
+
+
+@pytest.fixture(name='server', scope='module')
+def fixture_server():
+  server = apis_stand_in.StandInServer(
+      ('localhost', 0), apis_stand_in.load_routes([GCE1_DIR]))
+  thread = threading.Thread(target=server.serve_forever, daemon=True)
+  thread.start()
+  yield server
+  server.shutdown()
+  server.server_close()
+
+
+@pytest.fixture(name='compute')
+def fixture_compute(server):
+  config.init({'api_endpoint': server.endpoint})
+  return apis.get_api('compute', 'v1', DUMMY_PROJECT_ID)
+
+
+def test_parse_routes():
+  routes = apis_stand_in.load_routes([GCE1_DIR])
+  route = routes.find('GET', 'compute.googleapis.com',
+                      f'/compute/v1/projects/{DUMMY_PROJECT_ID}/zones/{ZONE}'
+                      '/instances', {})
+  assert route.file.name == f'compute-instances-{ZONE}.json'
+  assert dict(route.params) == {'maxResults': '3'}
+  route = routes.find('POST', 'monitoring.googleapis.com',
+                      f'/v3/projects/{DUMMY_PROJECT_ID}/timeSeries:query', {})
+  assert route.file.name == 'monitoring-query.json'
+
+
+def test_find_page():
+  routes = apis_stand_in.load_routes([GCE1_DIR])
+  path = f'/compute/v1/projects/{DUMMY_PROJECT_ID}/zones/{ZONE}/instances'
+  page_token = _load_json(f'compute-instances-{ZONE}.json')['nextPageToken']
+  route = routes.find('GET', 'compute.googleapis.com', path,
+                      {'pageToken': page_token})
+  assert route.file.name == f'compute-instances-{ZONE}-2.json'
+  assert not routes.find('GET', 'compute.googleapis.com', path,
+                         {'pageToken': 'unknown'})
+
+
+def test_get_api_paging(compute):
+  request = compute.instances().list(project=DUMMY_PROJECT_ID, zone=ZONE)
+  instances = list(
+      apis_utils.list_all(request, compute.instances().list_next))
+  expected = (_load_json(f'compute-instances-{ZONE}.json')['items'] +
+              _load_json(f'compute-instances-{ZONE}-2.json')['items'])
+  assert [i['name'] for i in instances] == [i['name'] for i in expected]
+
+
+def test_batch(compute):
+  requests = [
+      compute.instanceGroupManagers().list(project=DUMMY_PROJECT_ID, zone=zone)
+      for zone in ('europe-west1-b', 'europe-west4-a', 'europe-west9-z')
+  ]
+  results = list(apis_utils.batch_execute_all(compute, requests))
+  assert len(results) == 3
+  responses = {r.uri.split('/')[-2]: (resp, exc) for r, resp, exc in results}
+  assert responses['europe-west1-b'][0] == _load_json(
+      'compute-migs-europe-west1-b.json')
+  assert responses['europe-west4-a'][0] == _load_json(
+      'compute-migs-europe-west4-a.json')
+  assert responses['europe-west9-z'][0] is None
+  assert responses['europe-west9-z'][1].status == 404
+
+
+def test_not_found(compute, server):
+  not_found = server.not_found
+  with pytest.raises(googleapiclient.errors.HttpError) as excinfo:
+    compute.instances().get(project=DUMMY_PROJECT_ID,
+                            zone=ZONE,
+                            instance='unknown').execute()
+  assert excinfo.value.status_code == 404
+  assert server.not_found == not_found + 1
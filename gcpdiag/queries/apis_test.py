@@ -15,7 +15,7 @@
 
 from unittest import TestCase, mock
 
-from gcpdiag import config
+from gcpdiag import caching, config
 from gcpdiag.queries import apis, apis_stub
 
 DUMMY_PROJECT_NAME = 'gcpdiag-gke1-aaaa'
@@ -61,7 +61,7 @@ class TestTPC(TestCase):
   """testing for TPC universe domain settings."""
 
   @mock.patch('gcpdiag.queries.apis.get_credentials')
-  @mock.patch('googleapiclient.discovery.build')
+  @mock.patch('googleapiclient.discovery.build_from_document')
   def test_tpc_endpoint(self, mock_build, mock_cred):
     mock_cred.return_value.universe_domain = 'test_domain.goog'
     config.init({'universe_domain': 'test_domain.goog'}, 'x')
@@ -70,7 +70,7 @@ class TestTPC(TestCase):
     assert endpoint.endswith('test_domain.goog')
 
   @mock.patch('gcpdiag.queries.apis.get_credentials')
-  @mock.patch('googleapiclient.discovery.build')
+  @mock.patch('googleapiclient.discovery.build_from_document')
   def test_not_tpc_endpoint(self, mock_build, mock_cred):
     mock_cred.return_value.universe_domain = 'googleapis.com'
     config.init({'universe_domain': ''}, 'x')
@@ -79,10 +79,75 @@ class TestTPC(TestCase):
     assert endpoint == 'https://composer.googleapis.com'
 
   @mock.patch('gcpdiag.queries.apis._get_credentials_adc')
-  @mock.patch('googleapiclient.discovery.build')
+  @mock.patch('googleapiclient.discovery.build_from_document')
   def test_universe_mismatch(self, mock_build, mock_cred):
     del mock_build
     mock_cred.return_value.universe_domain = 'googleapis.com.not'
     config.init({'universe_domain': 'a_mismatching_universe'}, 'x')
     with self.assertRaises(ValueError):
       _ = apis.get_api('composer', 'v1', 'test_project')
+
+
+class TestHttpConnectionPool(TestCase):
+  """Test the pooled transport used by get_api()."""
+
+  @mock.patch('httplib2.Http')
+  def test_connection_reuse(self, mock_http_class):
+    mock_http = mock_http_class.return_value
+    mock_http.connections = {}
+
+    def _request(uri, *args, **kwargs):
+      del args, kwargs
+      mock_http.connections['https:compute.googleapis.com'] = mock.Mock()
+      return ({'status': '200'}, uri)
+
+    mock_http.request.side_effect = _request
+    # pylint:disable=protected-access
+    pool = apis._HttpConnectionPool()
+    # pylint:enable=protected-access
+    pool.request('https://compute.googleapis.com/compute/v1/projects/p1')
+    pool.request('https://compute.googleapis.com/compute/v1/projects/p2')
+    assert mock_http_class.call_count == 1
+    assert pool.get_stats() == {'opened': 1, 'reused': 1}
+
+  @mock.patch('httplib2.Http')
+  def test_concurrent_requests_use_separate_http(self, mock_http_class):
+    mock_http_class.return_value.connections = {}
+    # pylint:disable=protected-access
+    pool = apis._HttpConnectionPool()
+    http1 = pool._checkout('https:compute.googleapis.com')
+    http2 = pool._checkout('https:compute.googleapis.com')
+    assert mock_http_class.call_count == 2
+    pool._return('https:compute.googleapis.com', http1)
+    pool._return('https:compute.googleapis.com', http2)
+    # pylint:enable=protected-access
+    assert pool.get_stats() == {'opened': 2, 'reused': 0}
+
+
+class TestDiscoveryDocumentCache(TestCase):
+  """Test the discovery document cache used by get_api()."""
+
+  def test_static_document(self):
+    with mock.patch('gcpdiag.queries.apis._download_discovery_document'
+                   ) as mock_download:
+      # pylint:disable=protected-access
+      document = apis._load_discovery_document('compute', 'v1',
+                                               'googleapis.com')
+      # pylint:enable=protected-access
+    assert '"name": "compute"' in document
+    mock_download.assert_not_called()
+
+  @mock.patch('googleapiclient.discovery_cache.get_static_doc')
+  @mock.patch('gcpdiag.queries.apis._download_discovery_document')
+  def test_downloaded_document_is_cached(self, mock_download, mock_static):
+    mock_static.return_value = None
+    mock_download.return_value = '{"name": "gcpdiagtest"}'
+    # pylint:disable=protected-access
+    caching.get_disk_cache().delete(
+        'discovery-document:googleapis.com:gcpdiagtest:v1')
+    for _ in range(2):
+      document = apis._load_discovery_document('gcpdiagtest', 'v1',
+                                               'googleapis.com')
+      assert document == '{"name": "gcpdiagtest"}'
+    # pylint:enable=protected-access
+    assert mock_download.call_count == 1
@@ -0,0 +1,323 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""HTTP transport modes of the API requests: record, replay and redirect.
+
+The transport mode is selected with the configuration:
+
+- `record`: file where all the HTTP interactions (request and response) are
+  saved at exit ("cassette"). The requests of the credentials (e.g. token
+  refreshes) are not recorded, so that no secret is written to the file.
+- `replay`: cassette to be used to answer the requests, without any access
+  to the network and without authentication.
+- `api_endpoint`: base URL of a server to which the requests are sent instead
+  of the Google APIs, e.g. `http://localhost:8080`, where
+  `https://compute.googleapis.com/compute/v1/...` is sent to
+  `http://localhost:8080/compute.googleapis.com/compute/v1/...`. This is meant
+  to be used with the stand-in server (see apis_stand_in.py).
+
+The objects implement the request() method of httplib2.Http, so that they can
+be wrapped by google_auth_httplib2.AuthorizedHttp.
+"""
+
+import atexit
+import base64
+import collections
+import json
+import logging
+import os
+import re
+import tempfile
+import threading
+import time
+import urllib.parse
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+import httplib2
+
+from gcpdiag import config
+
+CASSETTE_VERSION = 1
+
+# Boundary of multipart (batch) requests, as set in the Content-Type header.
+_BOUNDARY_RE = re.compile(r'boundary="?([^";]+)"?')
+# googleapiclient uses '<uuid4+request_id>' as Content-ID of batched requests.
+_BATCH_CONTENT_ID_RE = re.compile(
+    r'<[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}\s*\+')
+# Hosts of the requests made by google-auth to get or refresh credentials
+# (OAuth2 token endpoints, workload identity federation, service account
+# impersonation and the GCE metadata server).
+_CREDENTIALS_HOSTS = frozenset([
+    'oauth2.googleapis.com',
+    'accounts.google.com',
+    'sts.googleapis.com',
+    'iamcredentials.googleapis.com',
+    'metadata.google.internal',
+    'metadata',
+    '169.254.169.254',
+])
+
+
+def _header(headers: Optional[Dict[str, str]], name: str) -> str:
+  for key, value in (headers or {}).items():
+    if key.lower() == name:
+      return value
+  return ''
+
+
+def _normalize_body(body: Any, headers: Optional[Dict[str, str]]) -> str:
+  """Return the body of a request without the parts that change at every
+  execution (boundary and Content-ID of batch requests)."""
+  if body is None:
+    return ''
+  if isinstance(body, bytes):
+    body = body.decode('utf-8', errors='replace')
+  content_type = _header(headers, 'content-type')
+  if content_type.startswith('multipart/'):
+    match = _BOUNDARY_RE.search(content_type)
+    if match:
+      body = body.replace(match.group(1), 'BOUNDARY')
+    body = _BATCH_CONTENT_ID_RE.sub('<ID+', body)
+  return body
+
+
+def _encode_content(content: bytes) -> Dict[str, str]:
+  try:
+    return {'text': content.decode('utf-8')}
+  except UnicodeDecodeError:
+    return {'base64': base64.b64encode(content).decode('ascii')}
+
+
+def _decode_content(content: Dict[str, str]) -> bytes:
+  if 'base64' in content:
+    return base64.b64decode(content['base64'])
+  return content.get('text', '').encode('utf-8')
+
+
+class Cassette:
+  """Recorded HTTP interactions, stored as JSON file.
+
+  Identical requests can be recorded several times (e.g. when an API is polled
+  until an operation is done): they are replayed in the recorded order, and
+  the last response is repeated after that. Requests whose body doesn't match
+  any recorded request (e.g. monitoring or logging queries containing the
+  current time) are answered with a response recorded for the same method and
+  URI, if there is one.
+  """
+
+  def __init__(self, path: str):
+    self.path = path
+    self._lock = threading.Lock()
+    self._interactions: List[Dict[str, Any]] = []
+    self._by_request: Dict[Tuple[str, str, str],
+                           Deque[Dict[str, Any]]] = collections.defaultdict(
+                               collections.deque)
+    self._by_uri: Dict[Tuple[str, str],
+                       Deque[Dict[str, Any]]] = collections.defaultdict(
+                           collections.deque)
+
+  def load(self):
+    with open(self.path, encoding='utf-8') as f:
+      data = json.load(f)
+    if data.get('version') != CASSETTE_VERSION:
+      raise ValueError(f'{self.path}: unsupported cassette version '
+                       f"{data.get('version')}")
+    with self._lock:
+      for interaction in data['interactions']:
+        self._add(interaction)
+
+  def save(self):
+    """Write the cassette atomically, so that it is never left incomplete."""
+    with self._lock:
+      data = {'version': CASSETTE_VERSION, 'interactions': self._interactions}
+    dirname = os.path.dirname(os.path.abspath(self.path))
+    with tempfile.NamedTemporaryFile('w',
+                                     encoding='utf-8',
+                                     dir=dirname,
+                                     delete=False) as f:
+      json.dump(data, f, indent=1)
+    os.replace(f.name, self.path)
+
+  def __len__(self) -> int:
+    with self._lock:
+      return len(self._interactions)
+
+  def _add(self, interaction: Dict[str, Any]):
+    request = interaction['request']
+    self._interactions.append(interaction)
+    self._by_request[(request['method'], request['uri'],
+                      request['body'])].append(interaction)
+    self._by_uri[(request['method'], request['uri'])].append(interaction)
+
+  def record(self, method: str, uri: str, body: Any,
+             headers: Optional[Dict[str, str]], response: httplib2.Response,
+             content: bytes):
+    interaction = {
+        'request': {
+            'method': method,
+            'uri': uri,
+            'body': _normalize_body(body, headers),
+        },
+        'response': {
+            'headers': dict(response),
+            'content': _encode_content(content),
+        },
+    }
+    with self._lock:
+      self._add(interaction)
+
+  def find(self, method: str, uri: str, body: Any,
+           headers: Optional[Dict[str, str]]) -> Optional[Dict[str, Any]]:
+    """Return the recorded response of a request, if any."""
+    with self._lock:
+      queue = self._by_request.get((method, uri, _normalize_body(body,
+                                                                 headers)))
+      if not queue:
+        queue = self._by_uri.get((method, uri))
+      if not queue:
+        return None
+      if len(queue) > 1:
+        return queue.popleft()['response']
+      return queue[0]['response']
+
+
+def _is_credentials_request(uri: str) -> bool:
+  parsed = urllib.parse.urlsplit(uri)
+  host = (parsed.hostname or '').lower()
+  return host in _CREDENTIALS_HOSTS or (host == 'www.googleapis.com' and
+                                        parsed.path.startswith('/oauth2/'))
+
+
+class RecordingHttp:
+  """Execute the requests with an underlying http object and record them.
+
+  google_auth_httplib2.AuthorizedHttp refreshes the credentials through the
+  http object that it wraps: these requests are executed but not recorded,
+  because they contain secrets (refresh token, client secret, access token).
+  """
+
+  def __init__(self, http, cassette: Cassette):
+    self.http = http
+    self.cassette = cassette
+
+  def request(self, uri, method='GET', body=None, headers=None, **kwargs):
+    response, content = self.http.request(uri,
+                                          method=method,
+                                          body=body,
+                                          headers=headers,
+                                          **kwargs)
+    if _is_credentials_request(uri):
+      logging.debug('record: not recording credentials request %s %s', method,
+                    uri)
+    else:
+      self.cassette.record(method, uri, body, headers, response, content)
+    return response, content
+
+  def __getattr__(self, name):
+    return getattr(self.http, name)
+
+
+class ReplayHttp:
+  """Answer the requests with the responses recorded in a cassette.
+
+  Requests that weren't recorded get a 404 (Not Found) error response.
+  """
+
+  def __init__(self, cassette: Cassette):
+    self.cassette = cassette
+
+  def request(self, uri, method='GET', body=None, headers=None, **kwargs):
+    del kwargs
+    recorded = self.cassette.find(method, uri, body, headers)
+    if not recorded:
+      logging.debug('replay: no recorded response for %s %s', method, uri)
+      error = {
+          'error': {
+              'code': 404,
+              'message': f'no recorded response for {method} {uri}',
+              'status': 'NOT_FOUND',
+          }
+      }
+      return (httplib2.Response({
+          'status': '404',
+          'content-type': 'application/json; charset=UTF-8'
+      }), json.dumps(error).encode('utf-8'))
+    return (httplib2.Response(recorded['headers']),
+            _decode_content(recorded['content']))
+
+
+class RedirectHttp:
+  """Send the requests to another server, with the original host name as
+  first component of the path."""
+
+  def __init__(self, http, endpoint: str):
+    self.http = http
+    self.endpoint = endpoint.rstrip('/')
+
+  def redirect_uri(self, uri: str) -> str:
+    parsed = urllib.parse.urlsplit(uri)
+    return urllib.parse.urlunsplit(
+        parsed._replace(scheme='', netloc='',
+                        path=f'/{parsed.netloc}{parsed.path}'))
+
+  def request(self, uri, *args, **kwargs):
+    return self.http.request(self.endpoint + self.redirect_uri(uri), *args,
+                             **kwargs)
+
+  def __getattr__(self, name):
+    return getattr(self.http, name)
+
+
+_cassettes: Dict[str, Cassette] = {}
+_cassettes_lock = threading.Lock()
+
+
+def _get_cassette(path: str, record: bool) -> Cassette:
+  with _cassettes_lock:
+    cassette = _cassettes.get(path)
+    if not cassette:
+      cassette = Cassette(path)
+      if record:
+        atexit.register(_save_cassette, cassette)
+      else:
+        start = time.monotonic()
+        cassette.load()
+        logging.debug('replay: loaded %d interactions from %s in %.2fs',
+                      len(cassette), path,
+                      time.monotonic() - start)
+      _cassettes[path] = cassette
+    return cassette
+
+
+def _save_cassette(cassette: Cassette):
+  cassette.save()
+  logging.debug('record: saved %d interactions to %s', len(cassette),
+                cassette.path)
+
+
+def is_offline() -> bool:
+  """Whether the requests are answered without Google credentials."""
+  return bool(config.get('replay') or config.get('api_endpoint'))
+
+
+def wrap_http(http):
+  """Return an object executing the requests according to the configured
+  transport mode, by default `http` itself."""
+  if config.get('replay'):
+    return ReplayHttp(_get_cassette(config.get('replay'), record=False))
+  if config.get('api_endpoint'):
+    http = RedirectHttp(http, config.get('api_endpoint'))
+  if config.get('record'):
+    http = RecordingHttp(http, _get_cassette(config.get('record'),
+                                             record=True))
+  return http
@@ -0,0 +1,184 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Test code in apis_transport.py."""
+
+import json
+import threading
+
+import google_auth_httplib2
+import httplib2
+from google.auth import credentials as auth_credentials
+from google.oauth2 import credentials as oauth2_credentials
+
+from gcpdiag import config
+from gcpdiag.queries import apis, apis_stand_in, apis_transport, apis_utils
+
+DUMMY_PROJECT_ID = 'gcpdiag-gce1-aaaa'
+TOKEN_URI = 'https://oauth2.googleapis.com/token'
+ZONES = ['europe-west1-b', 'europe-west4-a']
+
+
+class HttpMock:
+  """Return a response with the request uri and a counter."""
+
+  def __init__(self):
+    self.count = 0
+    self.uris = []
+
+  def request(self, uri, method='GET', body=None, headers=None, **kwargs):
+    del method, body, headers, kwargs
+    self.count += 1
+    self.uris.append(uri)
+    return (httplib2.Response({'status': '200'}),
+            json.dumps({
+                'uri': uri,
+                'count': self.count
+            }).encode('utf-8'))
+
+
+class TokenHttpMock(HttpMock):
+  """Also answer the OAuth2 token requests with an access token."""
+
+  def request(self, uri, method='GET', body=None, headers=None, **kwargs):
+    if uri == TOKEN_URI:
+      self.uris.append(uri)
+      return (httplib2.Response({'status': '200'}),
+              json.dumps({
+                  'access_token': 'secret-access-token',
+                  'expires_in': 3600
+              }).encode('utf-8'))
+    return super().request(uri, method, body, headers, **kwargs)
+
+
+def _content(result):
+  return json.loads(result[1])
+
+
+def test_normalize_batch_body():
+  body = ('--===1234==\nContent-Type: application/http\n'
+          'Content-ID: <f5e0a1c2-8b7d-4e6f-9a3b-2c1d0e9f8a7b + 0>\n\n'
+          'GET /compute/v1/projects/p/zones HTTP/1.1\n\n--===1234==--')
+  headers = {'content-type': 'multipart/mixed; boundary="===1234=="'}
+  assert apis_transport._normalize_body(body, headers) == (
+      '--BOUNDARY\nContent-Type: application/http\n'
+      'Content-ID: <ID+ 0>\n\n'
+      'GET /compute/v1/projects/p/zones HTTP/1.1\n\n--BOUNDARY--')
+
+
+def test_record_replay(tmp_path):
+  path = str(tmp_path / 'cassette.json')
+  cassette = apis_transport.Cassette(path)
+  http = apis_transport.RecordingHttp(HttpMock(), cassette)
+  http.request('https://example.com/a')
+  http.request('https://example.com/a')
+  http.request('https://example.com/b', 'POST', body='x')
+  cassette.save()
+
+  cassette = apis_transport.Cassette(path)
+  cassette.load()
+  http = apis_transport.ReplayHttp(cassette)
+  # identical requests are replayed in order, and the last one is repeated
+  assert _content(http.request('https://example.com/a'))['count'] == 1
+  assert _content(http.request('https://example.com/a'))['count'] == 2
+  assert _content(http.request('https://example.com/a'))['count'] == 2
+  assert _content(http.request('https://example.com/b', 'POST',
+                               body='x'))['count'] == 3
+  # fallback on the method and uri
+  assert _content(http.request('https://example.com/b', 'POST',
+                               body='y'))['count'] == 3
+  response, content = http.request('https://example.com/c')
+  assert response.status == 404
+  assert json.loads(content)['error']['code'] == 404
+
+
+def test_record_credentials_refresh(tmp_path):
+  path = str(tmp_path / 'cassette.json')
+  cassette = apis_transport.Cassette(path)
+  http_mock = TokenHttpMock()
+  credentials = oauth2_credentials.Credentials(
+      token=None,
+      refresh_token='secret-refresh-token',
+      client_id='client-id',
+      client_secret='secret-client-secret',
+      token_uri=TOKEN_URI)
+  http = google_auth_httplib2.AuthorizedHttp(
+      credentials, http=apis_transport.RecordingHttp(http_mock, cassette))
+  http.request('https://compute.googleapis.com/compute/v1/projects/p')
+  cassette.save()
+  # the credentials were refreshed through the recording http object
+  assert http_mock.uris[0] == TOKEN_URI
+  assert len(cassette) == 1
+  with open(path, encoding='utf-8') as f:
+    recorded = f.read()
+  assert 'compute.googleapis.com' in recorded
+  assert 'oauth2.googleapis.com' not in recorded
+  assert 'secret' not in recorded
+
+
+def test_redirect():
+  http_mock = HttpMock()
+  http = apis_transport.RedirectHttp(http_mock, 'http://localhost:8080/')
+  http.request('https://compute.googleapis.com/compute/v1/projects/p?alt=json')
+  assert http_mock.uris == [
+      'http://localhost:8080/compute.googleapis.com/compute/v1/projects/p'
+      '?alt=json'
+  ]
+
+
+def test_offline_credentials(tmp_path):
+  config.init({'replay': str(tmp_path / 'cassette.json')})
+  assert isinstance(apis.get_credentials(),
+                    auth_credentials.AnonymousCredentials)
+
+
+def _list_instances(compute):
+  instances = []
+  for zone in ZONES:
+    request = compute.instances().list(project=DUMMY_PROJECT_ID, zone=zone)
+    instances += apis_utils.list_all(request, compute.instances().list_next)
+  requests = [
+      compute.instanceGroupManagers().list(project=DUMMY_PROJECT_ID, zone=zone)
+      for zone in ZONES
+  ]
+  migs = sorted((r.uri, response)
+                for r, response, _ in apis_utils.batch_execute_all(
+                    compute, requests))
+  return instances, migs
+
+
+def test_get_api_record_replay(tmp_path):
+  """Record the requests to the stand-in server, and replay them without
+  server."""
+  path = str(tmp_path / 'cassette.json')
+  server = apis_stand_in.StandInServer(
+      ('localhost', 0),
+      apis_stand_in.load_routes([apis_stand_in.TEST_DATA_DIR / 'gce1']))
+  thread = threading.Thread(target=server.serve_forever, daemon=True)
+  thread.start()
+  try:
+    config.init({'api_endpoint': server.endpoint, 'record': path})
+    compute = apis.get_api('compute', 'v1', DUMMY_PROJECT_ID)
+    recorded = _list_instances(compute)
+    # pylint: disable=protected-access
+    cassette = apis_transport._cassettes[path]
+    cassette.save()
+  finally:
+    server.shutdown()
+    server.server_close()
+  # 2 pages of instances in 2 zones, and 2 batched requests
+  assert server.requests == 6
+  assert len(cassette) == 5
+
+  config.init({'replay': path})
+  assert _list_instances(compute) == recorded
@@ -15,13 +15,80 @@
 
 import logging
 import random
+import re
 import time
 from typing import Any, Callable, Iterator, List, Optional, Tuple
+from urllib import parse
 
 import googleapiclient.errors
 import httplib2
 
 from gcpdiag import config, utils
+from gcpdiag.queries import rate_limiter
+
+
+def _request_service_and_project(request) -> Tuple[str, str]:
+  """Return the API (e.g. 'compute') and project of a request, from its URI."""
+  uri = parse.urlsplit(getattr(request, 'uri', '') or '')
+  m = re.search(r'/projects/([^/]+)', uri.path)
+  return uri.netloc.split('.', 1)[0], m.group(1) if m else ''
+
+
+def _is_quota_error(err: googleapiclient.errors.HttpError) -> bool:
+  if err.status_code == 429:
+    return True
+  # some APIs return 403 for rate limits
+  return err.status_code == 403 and any(
+      reason in str(err.content)
+      for reason in ['rateLimitExceeded', 'RATE_LIMIT_EXCEEDED'])
+
+
+def _retry_after(err: googleapiclient.errors.HttpError) -> Optional[float]:
+  try:
+    return float(err.resp.get('retry-after'))
+  except (AttributeError, TypeError, ValueError):
+    return None
+
+
+def execute(request,
+            service: Optional[str] = None,
+            project_id: Optional[str] = None):
+  """Execute GCP API `request` with rate limiting (see rate_limiter.py).
+
+  The request is limited with the token bucket of the API and project, which
+  are determined from the request URI if not specified. Quota errors slow down
+  the bucket and are retried, like server and connection errors, up to
+  config.API_RETRIES times. Other errors are raised as HttpError.
+  """
+  uri_service, uri_project_id = _request_service_and_project(request)
+  bucket = rate_limiter.get_rate_limiter().get_bucket(
+      service or uri_service, project_id or uri_project_id)
+  retry_count = 0
+  while True:
+    bucket.acquire()
+    try:
+      response = request.execute(num_retries=0)
+    except googleapiclient.errors.HttpError as err:
+      if retry_count >= config.API_RETRIES:
+        raise
+      if _is_quota_error(err):
+        bucket.on_throttled(_retry_after(err))
+        logging.debug(
+            'received HTTP error status code %d from API, retrying at %.2f '
+            'requests/s', err.status_code, bucket.rate)
+      elif should_retry(err.status_code):
+        _sleep_before_retry(retry_count)
+      else:
+        raise
+    except (httplib2.HttpLib2Error, OSError) as err:
+      if retry_count >= config.API_RETRIES:
+        raise
+      logging.debug('received exception from API: %s, retrying', err)
+      _sleep_before_retry(retry_count)
+    else:
+      bucket.on_success()
+      return response
+    retry_count += 1
 
 
 def list_all(request,
@@ -33,7 +100,7 @@ def list_all(request,
 
   while True:
     try:
-      response = request.execute(num_retries=config.API_RETRIES)
+      response = execute(request)
     except googleapiclient.errors.HttpError as err:
       raise utils.GcpApiError(err) from err
 
@@ -55,6 +122,39 @@ def multi_list_all(
     yield from list_all(req, next_function)
 
 
+def aggregated_list_all(request,
+                        next_function: Callable,
+                        response_keyword: str,
+                        scope_prefix: str = '') -> Iterator[Any]:
+  """Like list_all, but for Compute Engine aggregatedList methods.
+
+  The results of aggregatedList are grouped by scope (e.g. 'zones/us-east1-b'),
+  and only the scopes starting with `scope_prefix` are returned. Requests should
+  be made with returnPartialSuccess=True, so that a single unreachable scope
+  doesn't make the whole request fail: unreachable scopes are logged instead."""
+
+  while True:
+    try:
+      response = execute(request)
+    except googleapiclient.errors.HttpError as err:
+      raise utils.GcpApiError(err) from err
+
+    for scope, scoped_list in response.get('items', {}).items():
+      if not scope.startswith(scope_prefix):
+        continue
+      # Empty lists are omitted in GCP API responses
+      if response_keyword in scoped_list:
+        yield from scoped_list[response_keyword]
+    for unreachable in response.get('unreachables', []):
+      logging.warning('%s: results could not be fetched for %s',
+                      response_keyword, unreachable)
+
+    request = next_function(previous_request=request,
+                            previous_response=response)
+    if request is None:
+      break
+
+
 def batch_list_all(api,
                    requests: list,
                    next_function: Callable,
@@ -120,14 +220,29 @@ def get_nth_exponential_random_retry(n, random_pct, mutiplier, random_fn=None):
   return (1 - random_fn() * random_pct) * mutiplier**n
 
 
+def _sleep_before_retry(retry_count: int):
+  # for example: retry delay: 20% is random, progression: 1, 1.4, 2.0, 2.7, ... 28.9 (10 retries)
+  sleep_time = get_nth_exponential_random_retry(
+      n=retry_count,
+      random_pct=config.API_RETRY_SLEEP_RANDOMNESS_PCT,
+      mutiplier=config.API_RETRY_SLEEP_MULTIPLIER)
+  logging.debug('sleeping %.2f seconds before retry #%d', sleep_time,
+                retry_count + 1)
+  time.sleep(sleep_time)
+
+
 def batch_execute_all(api, requests: list):
   """Execute all `requests` using the batch API and yield (request,response,exception)
   tuples."""
+  if not requests:
+    return
   # results: (request, result, exception) tuples
   results: List[Tuple[Any, Optional[Any], Optional[Exception]]] = []
   requests_todo = requests
   requests_in_flight: List = []
   retry_count = 0
+  bucket = rate_limiter.get_rate_limiter().get_bucket(
+      *_request_service_and_project(requests[0]))
 
   def fetch_all_cb(request_id, response, exception):
     try:
@@ -139,6 +254,9 @@ def batch_execute_all(api, requests: list):
       return
 
     if exception:
+      if isinstance(exception, googleapiclient.errors.HttpError) and \
+          _is_quota_error(exception):
+        bucket.on_throttled(_retry_after(exception))
       if isinstance(exception, googleapiclient.errors.HttpError) and \
         should_retry(exception.status_code) and \
         retry_count < config.API_RETRIES:
@@ -152,6 +270,7 @@ def batch_execute_all(api, requests: list):
     if not response:
       return
 
+    bucket.on_success()
     results.append((request, response, None))
 
   while True:
@@ -159,6 +278,10 @@ def batch_execute_all(api, requests: list):
     requests_todo = []
     results = []
 
+    # The requests of the batch are rate limited together, with one wait. All
+    # of them are charged against the rate of the API.
+    bucket.acquire(len(requests_in_flight))
+
     # Do the batch API request
     try:
       batch = api.new_batch_http_request()
@@ -167,6 +290,8 @@ def batch_execute_all(api, requests: list):
       batch.execute()
     except (googleapiclient.errors.HttpError, httplib2.HttpLib2Error) as err:
       if isinstance(err, googleapiclient.errors.HttpError):
+        if _is_quota_error(err):
+          bucket.on_throttled(_retry_after(err))
         error_msg = f'received HTTP error status code {err.status_code} from Batch API, retrying'
       else:
         error_msg = f'received exception from Batch API: {err}, retrying'
@@ -186,12 +311,5 @@ def batch_execute_all(api, requests: list):
     if not requests_todo:
       break
 
-    # for example: retry delay: 20% is random, progression: 1, 1.4, 2.0, 2.7, ... 28.9 (10 retries)
-    sleep_time = get_nth_exponential_random_retry(
-        n=retry_count,
-        random_pct=config.API_RETRY_SLEEP_RANDOMNESS_PCT,
-        mutiplier=config.API_RETRY_SLEEP_MULTIPLIER)
-    logging.debug('sleeping %.2f seconds before retry #%d', sleep_time,
-                  retry_count + 1)
-    time.sleep(sleep_time)
+    _sleep_before_retry(retry_count)
     retry_count += 1
@@ -15,8 +15,11 @@
 
 from unittest import mock
 
+import googleapiclient.errors
+import pytest
+
 from gcpdiag import config, utils
-from gcpdiag.queries import apis_stub, apis_utils
+from gcpdiag.queries import apis_stub, apis_utils, rate_limiter
 
 
 class RequestMock(apis_stub.ApiStub):
@@ -73,6 +76,44 @@ class Test:
                                   next_function=next_function_mock))
     assert (results == ['a', 'b', 'c', 'd', 'e'])
 
+  def test_aggregated_list_all(self):
+
+    class AggregatedRequestMock(RequestMock):
+
+      def execute(self, num_retries: int = 0):
+        del num_retries
+        if self.n == 1:
+          return {
+              'items': {
+                  'zones/z1': {
+                      'instances': ['a', 'b']
+                  },
+                  'zones/z2': {
+                      'warning': {
+                          'code': 'NO_RESULTS_ON_PAGE'
+                      }
+                  },
+                  'regions/r1': {
+                      'instances': ['c']
+                  },
+              },
+              'unreachables': ['zones/z3'],
+          }
+        return {'items': {'zones/z4': {'instances': ['d']}}}
+
+    def aggregated_next_mock(previous_request, previous_response):
+      del previous_response
+      if previous_request.n == 1:
+        return AggregatedRequestMock(2)
+      return None
+
+    results = list(
+        apis_utils.aggregated_list_all(AggregatedRequestMock(1),
+                                       next_function=aggregated_next_mock,
+                                       response_keyword='instances',
+                                       scope_prefix='zones/'))
+    assert results == ['a', 'b', 'd']
+
   def test_batch_list_all(self):
     api = apis_stub.get_api_stub('compute', 'v1')
     results = list(
@@ -85,6 +126,28 @@ class Test:
     # second step any further required pages.
     assert (results == ['a', 'b', 'e', 'c', 'd'])
 
+  def test_execute_quota_error(self):
+    limiter = rate_limiter.RateLimiter(sleep=mock_sleep)
+    with mock.patch.object(rate_limiter, '_rate_limiter', limiter):
+      response = apis_utils.execute(
+          RequestMock(1,
+                      fail_count=2,
+                      fail_status=429,
+                      uri='https://compute.googleapis.com/compute/v1/'
+                      'projects/p1/zones'))
+    assert response == {'items': ['a', 'b']}
+    stats = limiter.stats()['compute/p1']
+    assert stats['requests'] == 3
+    assert stats['throttled'] == 2
+    assert stats['rate'] < stats['max_rate']
+
+  def test_execute_error(self):
+    limiter = rate_limiter.RateLimiter(sleep=mock_sleep)
+    with mock.patch.object(rate_limiter, '_rate_limiter', limiter):
+      with pytest.raises(googleapiclient.errors.HttpError):
+        apis_utils.execute(RequestMock(1, fail_count=1, fail_status=404))
+    assert limiter.stats()['/']['requests'] == 1
+
   def test_batch_execute_all(self):
     api = apis_stub.get_api_stub('compute', 'v1')
     results = list(
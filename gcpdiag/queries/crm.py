@@ -165,3 +165,23 @@ def get_all_projects_in_parent(project_id: str) -> List[ProjectBillingInfo]:
             file=sys.stderr)
       raise error from error
   return projects
+
+
+@caching.cached_api_call
+def get_project_ids_in_parent(parent: str) -> List[str]:
+  """Get the ids of the projects directly under a folder or organization.
+
+  Args:
+    parent: the parent resource name, e.g. 'folders/123' or
+      'organizations/456'.
+  """
+  api = apis.get_api('cloudresourcemanager', 'v3')
+  try:
+    return [
+        p['projectId'] for p in apis_utils.list_all(
+            request=api.projects().list(parent=parent),
+            next_function=api.projects().list_next,
+            response_keyword='projects')
+    ]
+  except googleapiclient.errors.HttpError as err:
+    raise utils.GcpApiError(err) from err
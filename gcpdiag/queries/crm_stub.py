@@ -41,8 +41,7 @@ class CrmApiStub:
 
   # pylint: disable=redefined-builtin
   def list(self, parent=None, page_token=None, filter=None):
-    if not parent:
-      return apis_stub.RestCallStub(DUMMY_PROJECT_ID, 'projects')
+    return apis_stub.RestCallStub(DUMMY_PROJECT_ID, 'projects')
 
   def list_next(self, previous_request, previous_response):
     return None
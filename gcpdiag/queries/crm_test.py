@@ -42,5 +42,10 @@ class Test:
     assert p.name == DUMMY_PROJECT_NAME
     assert p.parent == DUMMY_PROJECT_PARENT
 
+  def test_get_project_ids_in_parent(self):
+    assert crm.get_project_ids_in_parent('folders/1234569776913') == [
+        'gcpdiag-billing1-aaaa'
+    ]
+
   # getIamPolicy is tested in iam_test.py
   # getEffectiveOrgPolicy is tested in orgpolicy_test.py
@@ -20,8 +20,10 @@ import dataclasses
 import ipaddress
 import logging
 import re
+import threading
 from datetime import datetime, timezone
-from typing import Dict, Iterable, List, Mapping, Optional, Sequence, Set
+from typing import (Dict, Iterable, Iterator, List, Mapping, Optional,
+                    Sequence, Set)
 
 import googleapiclient.errors
 
@@ -675,6 +677,33 @@ def get_gce_zones(project_id: str) -> Set[str]:
     raise utils.GcpApiError(err) from err
 
 
+def _list_zonal_resources(project_id: str, collection: str,
+                          response_keyword: str) -> Iterator[dict]:
+  """List the resources of a zonal collection (e.g. 'instances') in all zones.
+
+  aggregatedList returns the resources of all zones in a single paginated
+  stream, but it isn't available in TPC universes, where every zone is listed
+  separately instead."""
+  gce_api = apis.get_api('compute', 'v1', project_id)
+  resource = getattr(gce_api, collection)()
+  if config.get('universe_domain') == 'googleapis.com':
+    request = resource.aggregatedList(project=project_id,
+                                      returnPartialSuccess=True)
+    return apis_utils.aggregated_list_all(
+        request,
+        next_function=resource.aggregatedList_next,
+        response_keyword=response_keyword,
+        scope_prefix='zones/')
+  requests = [
+      resource.list(project=project_id, zone=zone)
+      for zone in get_gce_zones(project_id)
+  ]
+  return apis_utils.multi_list_all(
+      requests=requests,
+      next_function=resource.list_next,
+  )
+
+
 def get_gce_public_licences(project_id: str) -> List[str]:
   """Returns a list of licenses based on publicly available image project"""
   licenses = []
@@ -718,16 +747,8 @@ def get_instances(context: models.Context) -> Mapping[str, Instance]:
   instances: Dict[str, Instance] = {}
   if not apis.is_enabled(context.project_id, 'compute'):
     return instances
-  gce_api = apis.get_api('compute', 'v1', context.project_id)
-  requests = [
-      gce_api.instances().list(project=context.project_id, zone=zone)
-      for zone in get_gce_zones(context.project_id)
-  ]
   logging.info('listing gce instances of project %s', context.project_id)
-  items = apis_utils.multi_list_all(
-      requests=requests,
-      next_function=gce_api.instances().list_next,
-  )
+  items = _list_zonal_resources(context.project_id, 'instances', 'instances')
   for i in items:
     result = re.match(
         r'https://www.googleapis.com/compute/v1/projects/[^/]+/zones/([^/]+)/',
@@ -743,8 +764,8 @@ def get_instances(context: models.Context) -> Mapping[str, Instance]:
     if not context.match_project_resource(
         location=zone, labels=labels, resource=resource):
       continue
-    instances[i['id']] = Instance(project_id=context.project_id,
-                                  resource_data=i)
+    instances[i['id']] = models.intern_resource(
+        Instance(project_id=context.project_id, resource_data=i))
   return instances
 
 
@@ -754,16 +775,9 @@ def get_instance_groups(context: models.Context) -> Mapping[str, InstanceGroup]:
   groups: Dict[str, InstanceGroup] = {}
   if not apis.is_enabled(context.project_id, 'compute'):
     return groups
-  gce_api = apis.get_api('compute', 'v1', context.project_id)
-  requests = [
-      gce_api.instanceGroups().list(project=context.project_id, zone=zone)
-      for zone in get_gce_zones(context.project_id)
-  ]
   logging.info('listing gce instance groups of project %s', context.project_id)
-  items = apis_utils.multi_list_all(
-      requests=requests,
-      next_function=gce_api.instanceGroups().list_next,
-  )
+  items = _list_zonal_resources(context.project_id, 'instanceGroups',
+                                'instanceGroups')
   for i in items:
     result = re.match(
         r'https://www.googleapis.com/compute/v1/projects/[^/]+/zones/([^/]+)',
@@ -779,7 +793,8 @@ def get_instance_groups(context: models.Context) -> Mapping[str, InstanceGroup]:
     if not context.match_project_resource(
         location=zone, labels=labels, resource=resource):
       continue
-    instance_group = InstanceGroup(context.project_id, i)
+    instance_group = models.intern_resource(
+        InstanceGroup(context.project_id, i))
     groups[instance_group.full_path] = instance_group
   return groups
 
@@ -792,18 +807,10 @@ def get_managed_instance_groups(
   migs: Dict[int, ManagedInstanceGroup] = {}
   if not apis.is_enabled(context.project_id, 'compute'):
     return migs
-  gce_api = apis.get_api('compute', 'v1', context.project_id)
-  requests = [
-      gce_api.instanceGroupManagers().list(project=context.project_id,
-                                           zone=zone)
-      for zone in get_gce_zones(context.project_id)
-  ]
   logging.info('listing zonal managed instance groups of project %s',
                context.project_id)
-  items = apis_utils.multi_list_all(
-      requests=requests,
-      next_function=gce_api.instanceGroupManagers().list_next,
-  )
+  items = _list_zonal_resources(context.project_id, 'instanceGroupManagers',
+                                'instanceGroupManagers')
   for i in items:
     result = re.match(
         r'https://www.googleapis.com/compute/v1/projects/[^/]+/(?:regions|zones)/([^/]+)/',
@@ -819,8 +826,8 @@ def get_managed_instance_groups(
     if not context.match_project_resource(
         location=location, labels=labels, resource=resource):
       continue
-    migs[i['id']] = ManagedInstanceGroup(project_id=context.project_id,
-                                         resource_data=i)
+    migs[i['id']] = models.intern_resource(
+        ManagedInstanceGroup(project_id=context.project_id, resource_data=i))
   return migs
 
 
@@ -859,8 +866,8 @@ def get_region_managed_instance_groups(
     if not context.match_project_resource(
         location=location, labels=labels, resource=name):
       continue
-    migs[i['id']] = ManagedInstanceGroup(project_id=context.project_id,
-                                         resource_data=i)
+    migs[i['id']] = models.intern_resource(
+        ManagedInstanceGroup(project_id=context.project_id, resource_data=i))
   return migs
 
 
@@ -909,8 +916,8 @@ def get_instances_serial_port_output(context: models.Context):
   which matches the given context, running and is not
   exported to cloud logging.
   """
-  # Create temp storage (diskcache.Deque) for output
-  deque = caching.get_tmp_deque('tmp-gce-serial-output-')
+  # Create temp storage (caching.PagedDeque) for output
+  deque = caching.get_tmp_paged_deque('tmp-gce-serial-output-')
   if not apis.is_enabled(context.project_id, 'compute'):
     return deque
   gce_api = apis.get_api('compute', 'v1', context.project_id)
@@ -938,6 +945,8 @@ def get_instances_serial_port_output(context: models.Context):
   batch_size = 1000
   for i in range(0, len(requests), batch_size):
     batch_requests = requests[i:i + batch_size]
+    # Store the outputs of every batch request at once
+    outputs = []
     for _, response, exception in apis_utils.batch_execute_all(
         api=gce_api, requests=batch_requests):
       if exception:
@@ -958,12 +967,13 @@ def get_instances_serial_port_output(context: models.Context):
 
         project_id = result.group(1)
         instance_id = result.group(2)
-        deque.appendleft(
+        outputs.append(
             SerialPortOutput(
                 project_id=project_id,
                 instance_id=instance_id,
                 contents=response['contents'].splitlines(),
             ))
+    deque.extendleft(outputs)
   requests_end_time = datetime.now()
   logging.debug(
       'total serial logs processing time: %s, number of instances: %s',
@@ -1095,16 +1105,8 @@ def get_regions_with_instances(context: models.Context) -> Iterable[Region]:
 def get_all_disks(project_id: str) -> Iterable[Disk]:
   # Fetching only Zonal Disks(Regional disks exempted)
   try:
-    gce_api = apis.get_api('compute', 'v1', project_id)
-    requests = [
-        gce_api.disks().list(project=project_id, zone=zone)
-        for zone in get_gce_zones(project_id)
-    ]
     logging.info('listing gce disks of project %s', project_id)
-    items = apis_utils.multi_list_all(
-        requests=requests,
-        next_function=gce_api.disks().list_next,
-    )
+    items = _list_zonal_resources(project_id, 'disks', 'disks')
 
     return {Disk(project_id, item) for item in items}
 
@@ -1215,6 +1217,7 @@ class SerialOutputQuery:
 
 
 jobs_todo: Dict[models.Context, _SerialOutputJob] = {}
+_jobs_todo_lock = threading.Lock()
 
 
 def execute_fetch_serial_port_outputs(executor: concurrent.futures.Executor):
@@ -1222,15 +1225,17 @@ def execute_fetch_serial_port_outputs(executor: concurrent.futures.Executor):
   # depending on he number of instances in the project which aren't logging to cloud logging
   # currently expects only one job but implementing it so support for multiple projects is possible.
   global jobs_todo
-  jobs_executing = jobs_todo
-  jobs_todo = {}
+  with _jobs_todo_lock:
+    jobs_executing = jobs_todo
+    jobs_todo = {}
   for job in jobs_executing.values():
     job.future = executor.submit(get_instances_serial_port_output, job.context)
 
 
 def fetch_serial_port_outputs(context: models.Context) -> SerialOutputQuery:
   # Aggregate by context
-  job = jobs_todo.setdefault(context, _SerialOutputJob(context=context))
+  with _jobs_todo_lock:
+    job = jobs_todo.setdefault(context, _SerialOutputJob(context=context))
   return SerialOutputQuery(job=job)
 
 
@@ -1382,18 +1387,10 @@ def get_zonal_network_endpoint_groups(
   groups: Dict[str, NetworkEndpointGroup] = {}
   if not apis.is_enabled(context.project_id, 'compute'):
     return groups
-  gce_api = apis.get_api('compute', 'v1', context.project_id)
-  requests = [
-      gce_api.networkEndpointGroups().list(project=context.project_id,
-                                           zone=zone)
-      for zone in get_gce_zones(context.project_id)
-  ]
   logging.info('listing gce networkEndpointGroups of project %s',
                context.project_id)
-  items = apis_utils.multi_list_all(
-      requests=requests,
-      next_function=gce_api.networkEndpointGroups().list_next,
-  )
+  items = _list_zonal_resources(context.project_id, 'networkEndpointGroups',
+                                'networkEndpointGroups')
 
   for i in items:
     result = re.match(
@@ -38,6 +38,8 @@ class ComputeEngineApiStub(apis_stub.ApiStub):
   # gce_api.instanceGroups().list(project=project_id, zone=zone)
   # gce_api.disks().list(project=project_id, zone=zone)
   # gce_api.instances().get(project=project_id, zone=zone, instance=instance_name)
+  # gce_api.instances().aggregatedList(project=project_id)
+  # gce_api.instances().aggregatedList_next(request, response)
   # gce_api.instances().getSerialPortOutput(project,zone,instance,start)
 
   def __init__(self, mock_state='init', project_id=None, zone=None, page=1):
@@ -70,6 +72,12 @@ class ComputeEngineApiStub(apis_stub.ApiStub):
     else:
       raise RuntimeError(f"can't list for mock state {self.mock_state}")
 
+  def aggregatedList(self, project, returnPartialSuccess=None):
+    return AggregatedListStub(project, self.mock_state)
+
+  def aggregatedList_next(self, previous_request, previous_response):
+    return None
+
   def list_next(self, previous_request, previous_response):
     if isinstance(previous_response,
                   dict) and previous_response.get('nextPageToken'):
@@ -242,6 +250,47 @@ class InstanceGroupManagersApiStub(ComputeEngineApiStub):
                                   f'compute-migs-{zone}',
                                   default='compute-migs-empty')
 
+  def aggregatedList(self, project, returnPartialSuccess=None):
+    return AggregatedListStub(project, 'migs')
+
+
+class AggregatedListStub(apis_stub.ApiStub):
+  """Mock object to simulate aggregatedList calls.
+
+  The response is assembled from the per-zone json dumps (including all their
+  pages), so that the same test data can be used for list and aggregatedList
+  calls."""
+
+  RESPONSE_KEYWORDS = {
+      'disks': 'disks',
+      'igs': 'instanceGroups',
+      'instances': 'instances',
+      'migs': 'instanceGroupManagers',
+      'negs': 'networkEndpointGroups',
+  }
+
+  def __init__(self, project_id, mock_state):
+    self.project_id = project_id
+    self.mock_state = mock_state
+
+  def execute(self, num_retries=0):
+    self._maybe_raise_api_exception()
+    keyword = self.RESPONSE_KEYWORDS[self.mock_state]
+    zones = apis_stub.RestCallStub(self.project_id, 'compute-zones').execute()
+    items = {}
+    for zone in zones.get('items', []):
+      resources = []
+      request = apis_stub.RestCallStub(self.project_id,
+                                       f"compute-{self.mock_state}-{zone['name']}",
+                                       default={})
+      while request:
+        response = request.execute()
+        resources.extend(response.get('items', []))
+        request = ComputeEngineApiStub().list_next(request, response)
+      if resources:
+        items[f"zones/{zone['name']}"] = {keyword: resources}
+    return {'items': items}
+
 
 class RegionInstanceGroupManagersApiStub(ComputeEngineApiStub):
   """Mock object to simulate regional instance group managers api calls"""
@@ -69,6 +69,24 @@ class TestGce:
     # also verify that the instances dict uses the instance id as key
     assert instances_by_path[DUMMY_INSTANCE1_PATH].id in instances
 
+  def test_get_instances_tpc_fallback(self):
+    """Without aggregatedList, every zone is listed separately."""
+    context = models.Context(project_id=DUMMY_PROJECT_NAME)
+    aggregated = {i.full_path for i in gce.get_instances(context).values()}
+    config.init({'universe_domain': 'test_domain.goog'}, 'x')
+    try:
+      # pylint: disable=protected-access
+      per_zone = {
+          i['selfLink']
+          for i in gce._list_zonal_resources(DUMMY_PROJECT_NAME, 'instances',
+                                             'instances')
+      }
+    finally:
+      config.init({'universe_domain': 'googleapis.com'}, 'x')
+    assert len(per_zone) == len(aggregated) == 10
+    assert {re.sub(r'^.*/projects/', 'projects/', l) for l in per_zone
+           } == aggregated
+
   def test_get_instances_by_region_returns_instance(self):
     context = models.Context(project_id=DUMMY_PROJECT_NAME,
                              locations=['fake-region', DUMMY_REGION])
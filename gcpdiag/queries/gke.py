@@ -487,7 +487,8 @@ def get_clusters(context: models.Context) -> Mapping[str, Cluster]:
                                                 'resourceLabels', {}),
                                             resource=resp_c.get('name', '')):
         continue
-      c = Cluster(project_id=context.project_id, resource_data=resp_c)
+      c = models.intern_resource(
+          Cluster(project_id=context.project_id, resource_data=resp_c))
       clusters[c.full_path] = c
   except googleapiclient.errors.HttpError as err:
     raise utils.GcpApiError(err) from err
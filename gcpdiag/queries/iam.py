@@ -564,6 +564,26 @@ _service_account_cache_fetched: Dict[str, bool] = {}
 _service_account_cache_is_not_found: Dict[str, bool] = {}
 
 
+# Maximum number of requests in a single batch HTTP request.
+_BATCH_MAX_REQUESTS = 1000
+
+
+def _execute_service_account_requests(iam_api, requests: list):
+  """Execute serviceAccounts.get requests and yield (request, response,
+  exception) tuples, using the batch API except in TPC environment."""
+  if requests and 'googleapis.com' not in requests[0].uri:
+    # the api client library does not handle batch api calls for TPC yet
+    for request in requests:
+      try:
+        yield (request, request.execute(num_retries=config.API_RETRIES), None)
+      except googleapiclient.errors.HttpError as err:
+        yield (request, None, utils.GcpApiError(err))
+    return
+  for i in range(0, len(requests), _BATCH_MAX_REQUESTS):
+    yield from apis_utils.batch_execute_all(
+        iam_api, requests[i:i + _BATCH_MAX_REQUESTS])
+
+
 def _batch_fetch_service_accounts(emails: List[str], billing_project_id: str):
   """Retrieve a list of service accounts.
 
@@ -588,55 +608,55 @@ def _batch_fetch_service_accounts(emails: List[str], billing_project_id: str):
   for email in emails:
     _service_account_cache_fetched[email] = True
 
-  for request in requests:
-    try:
-      response = request.execute(num_retries=config.API_RETRIES)
+  if requests:
+    logging.debug('fetching %d service accounts', len(requests))
+  for request, response, exception in _execute_service_account_requests(
+      iam_api, requests):
+    if response:
       sa = ServiceAccount(response['projectId'], response)
       _service_account_cache[sa.email] = sa
-    except googleapiclient.errors.HttpError as err:
-      exception = utils.GcpApiError(err)
-      if exception:
-        # Extract the requested service account and its associated project ID
-        # from the URI. This is especially useful when dealing with scenarios
-        #  involving cross-project service accounts within a project.
-        m = re.search(r'/projects/([^/]+)/[^/]+/([^?]+@[^?]+)', request.uri)
-        if not m:
-          logging.warning("BUG: can't determine SA email from request URI: %s",
-                          request.uri)
-          continue
-        sa_project_id = m.group(1)
-        email = m.group(2)
-
-        # 403 or 404 is expected for Google-managed service agents.
-        if email.partition('@')[2] in SERVICE_AGENT_DOMAINS or \
-          email.partition('@')[2].startswith('gcp-sa-'):
-          # Too noisy even for debug-level
-          # logging.debug(
-          #     'ignoring error retrieving google-managed service agent %s: %s', email, exception)
-          pass
-        elif isinstance(exception,
-                        utils.GcpApiError) and exception.status == 404:
+    elif exception:
+      # Extract the requested service account and its associated project ID
+      # from the URI. This is especially useful when dealing with scenarios
+      #  involving cross-project service accounts within a project.
+      m = re.search(r'/projects/([^/]+)/[^/]+/([^?]+@[^?]+)', request.uri)
+      if not m:
+        logging.warning("BUG: can't determine SA email from request URI: %s",
+                        request.uri)
+        continue
+      sa_project_id = m.group(1)
+      email = m.group(2)
+
+      # 403 or 404 is expected for Google-managed service agents.
+      if email.partition('@')[2] in SERVICE_AGENT_DOMAINS or \
+        email.partition('@')[2].startswith('gcp-sa-'):
+        # Too noisy even for debug-level
+        # logging.debug(
+        #     'ignoring error retrieving google-managed service agent %s: %s', email, exception)
+        pass
+      elif isinstance(exception,
+                      utils.GcpApiError) and exception.status == 404:
+        _service_account_cache_is_not_found[email] = True
+      else:
+        # Determine if the failing service account belongs to a different project.
+        # Retrieving service account details may fail due to various conditions.
+        if sa_project_id != billing_project_id:
+          logging.warning(
+              "can't retrieve service account %s belonging to project %s but used in project: %s",
+              email, sa_project_id, billing_project_id)
           _service_account_cache_is_not_found[email] = True
+          continue
+
+        project_nr = crm.get_project(sa_project_id).number
+        if ((sa_project_id == billing_project_id) and re.match(rf'{project_nr}-\w+@', email) \
+            or email.endswith(f'@{billing_project_id}.iam.gserviceaccount.com')):
+          # if retrieving service accounts from the project being inspected fails,
+          # we need to fail hard because many rules won't work correctly.
+          raise exception
+
         else:
-          # Determine if the failing service account belongs to a different project.
-          # Retrieving service account details may fail due to various conditions.
-          if sa_project_id != billing_project_id:
-            logging.warning(
-                "can't retrieve service account %s belonging to project %s but used in project: %s",
-                email, sa_project_id, billing_project_id)
-            _service_account_cache_is_not_found[email] = True
-            continue
-
-          project_nr = crm.get_project(sa_project_id).number
-          if ((sa_project_id == billing_project_id) and re.match(rf'{project_nr}-\w+@', email) \
-              or email.endswith(f'@{billing_project_id}.iam.gserviceaccount.com')):
-            # if retrieving service accounts from the project being inspected fails,
-            # we need to fail hard because many rules won't work correctly.
-            raise utils.GcpApiError(err) from err
-
-          else:
-            logging.warning("can't get service account %s: %s", email,
-                            exception)
+          logging.warning("can't get service account %s: %s", email,
+                          exception)
 
 
 def _extract_project_id(email: str):
@@ -130,6 +130,25 @@ class TestProjectPolicy:
     assert not iam.is_service_account_existing('foobar@example.com',
                                                TEST_PROJECT_ID)
 
+  # start with empty service account caches: they are filled by other tests
+  @mock.patch.dict(iam._service_account_cache, clear=True)
+  @mock.patch.dict(iam._service_account_cache_fetched, clear=True)
+  @mock.patch.dict(iam._service_account_cache_is_not_found, clear=True)
+  def test_batch_fetch_service_accounts(self):
+    with mock.patch('gcpdiag.queries.apis_utils.batch_execute_all',
+                    wraps=iam.apis_utils.batch_execute_all) as batch_mock:
+      # pylint: disable=protected-access
+      iam._batch_fetch_service_accounts(
+          [TEST_SERVICE_ACCOUNT, 'batchtest-missing@example.com'],
+          TEST_PROJECT_ID)
+    # both service accounts are fetched with a single batch request
+    assert batch_mock.call_count == 1
+    assert len(batch_mock.call_args[0][1]) == 2
+    assert iam.is_service_account_existing(TEST_SERVICE_ACCOUNT,
+                                           TEST_PROJECT_ID)
+    assert not iam.is_service_account_existing(
+        'batchtest-missing@example.com', TEST_PROJECT_ID)
+
   def test_is_service_acccount_enabled(self):
     assert iam.is_service_account_enabled(TEST_SERVICE_ACCOUNT, TEST_PROJECT_ID)
 
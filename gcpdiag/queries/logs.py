@@ -32,24 +32,29 @@ follows:
    given in the "filter_str" argument to query(), you will need to filter out
    the entries in code as well when iterating over the log entries.
 
+   Alternatively, a "predicate" can be given to query(): it is evaluated once
+   for every fetched entry while the query job is executed, and the entries
+   property then only returns the entries for which the predicate is true.
+
 Side note: this module is not called 'logging' to avoid using the same name as
 the standard python library for logging.
 """
 
 import concurrent.futures
+import contextlib
+import contextvars
 import dataclasses
 import datetime
 import logging
 import threading
-from typing import (Any, Deque, Dict, List, Mapping, Optional, Sequence, Set,
-                    Tuple, Union)
+from typing import (Any, Callable, Deque, Dict, Iterable, Iterator, List,
+                    Mapping, Optional, Sequence, Set, Tuple, Union)
 
 import dateutil.parser
-import ratelimit
 from boltons.iterutils import get_path
 
 from gcpdiag import caching, config, models
-from gcpdiag.queries import apis
+from gcpdiag.queries import apis, apis_utils
 
 
 @dataclasses.dataclass
@@ -59,15 +64,57 @@ class _LogsQueryJob:
   resource_type: str
   log_name: str
   filters: Set[str]
+  # Python-side filters of the queries of this job. None is used for the
+  # queries that want all the fetched entries.
+  predicates: List[Optional[Callable[[Mapping[str, Any]], bool]]] = \
+      dataclasses.field(default_factory=list)
+  # Predicates of the queries of every filter.
+  filter_predicates: Dict[str, List[Optional[Callable[[Mapping[str, Any]],
+                                                       bool]]]] = \
+      dataclasses.field(default_factory=dict)
   future: Optional[concurrent.futures.Future] = None
 
 
+class _DemuxedEntries:
+  """Entries of a query job that matched a predicate.
+
+  Entries are kept in memory, and moved to temporary storage
+  (caching.PagedDeque) once there are more than
+  config.LOGGING_DEMUX_SPILL_ENTRIES of them. Entries are added in the order of
+  the API results (newest first) and returned oldest first."""
+
+  def __init__(self):
+    self._entries: List[Mapping[str, Any]] = []
+    self._deque: Optional[caching.PagedDeque] = None
+
+  def add(self, entry: Mapping[str, Any]):
+    self._entries.append(entry)
+
+  def end_page(self):
+    if self._deque is None:
+      if len(self._entries) <= config.LOGGING_DEMUX_SPILL_ENTRIES:
+        return
+      self._deque = caching.get_tmp_paged_deque('tmp-logs-')
+    self._deque.extendleft(self._entries)
+    self._entries = []
+
+  def result(self) -> Sequence:
+    if self._deque is not None:
+      self._deque.extendleft(self._entries)
+      self._entries = []
+      return self._deque
+    self._entries.reverse()
+    return self._entries
+
+
 class LogsQuery:
   """A log search job that was started with prefetch_logs()."""
   job: _LogsQueryJob
+  predicate: Optional[Callable[[Mapping[str, Any]], bool]]
 
-  def __init__(self, job):
+  def __init__(self, job, predicate=None):
     self.job = job
+    self.predicate = predicate
 
   @property
   def entries(self) -> Sequence:
@@ -79,10 +126,15 @@ class LogsQuery:
       logging.info(
           'waiting for logs query results (project: %s, resource type: %s)',
           self.job.project_id, self.job.resource_type)
-    return self.job.future.result()
+    result = self.job.future.result()[self.predicate]
+    if isinstance(result, Exception):
+      raise result
+    return result
 
 
 jobs_todo: Dict[Tuple[str, str, str], _LogsQueryJob] = {}
+# Protects jobs_todo, when rules are prepared for several projects concurrently.
+_jobs_todo_lock = threading.Lock()
 
 
 class LogEntryShort:
@@ -141,28 +193,74 @@ class LogExclusion(models.Resource):
     return False
 
 
-def query(project_id: str, resource_type: str, log_name: str,
-          filter_str: str) -> LogsQuery:
+def query(
+    project_id: str,
+    resource_type: str,
+    log_name: str,
+    filter_str: str,
+    predicate: Optional[Callable[[Mapping[str, Any]], bool]] = None
+) -> LogsQuery:
+  """Register a logs query, to be executed with execute_queries().
+
+  If a `predicate` is given, it is called for every entry fetched for the
+  query job and the returned LogsQuery will only contain the entries for which
+  it returned True. It should implement (at least) the same conditions as
+  `filter_str`, because the query job also fetches the entries of all other
+  queries with the same project, resource type and log name.
+  If the predicate raises an exception, the entries property of the returned
+  LogsQuery raises it, without affecting the other queries of the job.
+
+  The predicate is also used to count the entries fetched for `filter_str`:
+  when logging_fetch_max_entries_per_filter is configured, no more entries are
+  fetched for the filter once that many entries matched."""
   # Aggregate by project_id, resource_type, log_name
   job_key = (project_id, resource_type, log_name)
-  job = jobs_todo.setdefault(
-      job_key,
-      _LogsQueryJob(
-          project_id=project_id,
-          resource_type=resource_type,
-          log_name=log_name,
-          filters=set(),
-      ))
-  job.filters.add(filter_str)
-  return LogsQuery(job=job)
-
-
-@ratelimit.sleep_and_retry
-@ratelimit.limits(calls=config.get('logging_ratelimit_requests'),
-                  period=config.get('logging_ratelimit_period_seconds'))
-def _ratelimited_execute(req):
-  """Wrapper to req.execute() with rate limiting to avoid hitting quotas."""
-  return req.execute(num_retries=config.API_RETRIES)
+  with _jobs_todo_lock:
+    job = jobs_todo.setdefault(
+        job_key,
+        _LogsQueryJob(
+            project_id=project_id,
+            resource_type=resource_type,
+            log_name=log_name,
+            filters=set(),
+        ))
+    job.filters.add(filter_str)
+    if predicate not in job.predicates:
+      job.predicates.append(predicate)
+    filter_predicates = job.filter_predicates.setdefault(filter_str, [])
+    if predicate not in filter_predicates:
+      filter_predicates.append(predicate)
+  return LogsQuery(job=job, predicate=predicate)
+
+
+def _ratelimited_execute(req, project_id: str):
+  """Wrapper to req.execute() with rate limiting to avoid hitting quotas.
+
+  The requests of every project are limited to logging_ratelimit_requests
+  per logging_ratelimit_period_seconds (see apis_utils.execute())."""
+  return apis_utils.execute(req, service='logging', project_id=project_id)
+
+
+def _job_filter_str(job: _LogsQueryJob,
+                    filters: Set[str],
+                    start_time: datetime.datetime,
+                    end_timestamp: Optional[str] = None) -> str:
+  filter_lines = ['timestamp>"%s"' % start_time.isoformat(timespec='seconds')]
+  if end_timestamp:
+    filter_lines.append('timestamp<="%s"' % end_timestamp)
+  filter_lines.append('resource.type="%s"' % job.resource_type)
+  if job.log_name.startswith('log_id('):
+    # Special case: log_id(logname)
+    # https://cloud.google.com/logging/docs/view/logging-query-language#functions
+    filter_lines.append(job.log_name)
+  else:
+    filter_lines.append('logName="%s"' % job.log_name)
+  if len(filters) == 1:
+    filter_lines.append('(' + next(iter(filters)) + ')')
+  else:
+    filter_lines.append(
+        '(' + ' OR '.join(['(' + val + ')' for val in sorted(filters)]) + ')')
+  return '\n'.join(filter_lines)
 
 
 def _execute_query_job(job: _LogsQueryJob):
@@ -174,25 +272,35 @@ def _execute_query_job(job: _LogsQueryJob):
   start_time = datetime.datetime.now(
       datetime.timezone.utc) - datetime.timedelta(
           days=config.get('within_days'))
-  filter_lines = ['timestamp>"%s"' % start_time.isoformat(timespec='seconds')]
-  filter_lines.append('resource.type="%s"' % job.resource_type)
-  if job.log_name.startswith('log_id('):
-    # Special case: log_id(logname)
-    # https://cloud.google.com/logging/docs/view/logging-query-language#functions
-    filter_lines.append(job.log_name)
-  else:
-    filter_lines.append('logName="%s"' % job.log_name)
-  if len(job.filters) == 1:
-    filter_lines.append('(' + next(iter(job.filters)) + ')')
-  else:
-    filter_lines.append(
-        '(' + ' OR '.join(['(' + val + ')' for val in sorted(job.filters)]) +
-        ')')
-  filter_str = '\n'.join(filter_lines)
+  filter_str = _job_filter_str(job, job.filters, start_time)
   logging.info('searching logs in project %s (resource type: %s)',
                job.project_id, job.resource_type)
-  # Fetch all logs and put the results in temporary storage (diskcache.Deque)
-  deque = caching.get_tmp_deque('tmp-logs-')
+  # Fetch all logs and dispatch them to the entries of every predicate. The
+  # entries for the queries without predicate are all put in temporary storage
+  # (caching.PagedDeque), one page at a time.
+  results: Dict[Optional[Callable], Union[Sequence, Exception]] = {}
+  demuxed = {p: _DemuxedEntries() for p in job.predicates if p is not None}
+  deque = None
+  if None in job.predicates:
+    deque = caching.get_tmp_paged_deque('tmp-logs-')
+    results[None] = deque
+
+  # Per-filter accounting: number of entries matched by the predicates of
+  # every filter. Once a filter has matched logging_fetch_max_entries_per_filter
+  # entries, it is removed from the query for the remaining pages. Filters
+  # that are used by a query without predicate are never removed.
+  max_entries_per_filter = config.get('logging_fetch_max_entries_per_filter')
+  filter_counts = {f: 0 for f in job.filters}
+  pending_filters = set(job.filters)
+  active_predicates = set(demuxed)
+  # Predicates that raised an exception: only their queries fail, with that
+  # exception, and they aren't evaluated anymore.
+  failed_predicates: Dict[Callable, Exception] = {}
+  # Entries with the same timestamp as the last fetched entry, to skip
+  # duplicates after the query was rewritten.
+  last_timestamp = None
+  last_timestamp_ids: Set[str] = set()
+
   req = logging_api.entries().list(
       body={
           'resourceNames': [f'projects/{job.project_id}'],
@@ -205,11 +313,42 @@ def _execute_query_job(job: _LogsQueryJob):
   query_start_time = datetime.datetime.now()
   while req is not None:
     query_pages += 1
-    res = _ratelimited_execute(req)
+    res = _ratelimited_execute(req, job.project_id)
+    page_entries = []
     if 'entries' in res:
       for e in res['entries']:
+        timestamp = e.get('timestamp')
+        if timestamp == last_timestamp and \
+            e.get('insertId') in last_timestamp_ids:
+          continue
+        if timestamp != last_timestamp:
+          last_timestamp = timestamp
+          last_timestamp_ids = set()
+        last_timestamp_ids.add(e.get('insertId'))
         fetched_entries_count += 1
-        deque.appendleft(e)
+        page_entries.append(e)
+        matched = set()
+        for predicate in active_predicates:
+          try:
+            if predicate(e):
+              matched.add(predicate)
+          except Exception as err:  # pylint: disable=broad-except
+            logging.warning(
+                'log query predicate failed (project: %s, log name: %s): %r',
+                job.project_id, job.log_name, err)
+            failed_predicates[predicate] = err
+        if failed_predicates:
+          active_predicates -= failed_predicates.keys()
+        for predicate in matched:
+          demuxed[predicate].add(e)
+        if matched:
+          for f in pending_filters:
+            if matched.intersection(job.filter_predicates[f]):
+              filter_counts[f] += 1
+    if deque is not None:
+      deque.extendleft(page_entries)
+    for entries in demuxed.values():
+      entries.end_page()
 
     # Verify that we aren't above limits, exit otherwise.
     if fetched_entries_count > config.get('logging_fetch_max_entries'):
@@ -217,14 +356,45 @@ def _execute_query_job(job: _LogsQueryJob):
           'maximum number of log entries (%d) reached (project: %s, query: %s).',
           config.get('logging_fetch_max_entries'), job.project_id,
           filter_str.replace('\n', ' AND '))
-      return deque
+      break
     run_time = (datetime.datetime.now() - query_start_time).total_seconds()
     if run_time >= config.get('logging_fetch_max_time_seconds'):
       logging.warning(
           'maximum query runtime for log query reached (project: %s, query: %s).',
           job.project_id, filter_str.replace('\n', ' AND '))
-      return deque
+      break
     req = logging_api.entries().list_next(req, res)
+    satisfied_filters = set()
+    if max_entries_per_filter:
+      satisfied_filters = {
+          f for f in pending_filters
+          if filter_counts[f] >= max_entries_per_filter and
+          None not in job.filter_predicates[f]
+      }
+    if req is not None and satisfied_filters:
+      pending_filters -= satisfied_filters
+      active_predicates = {
+          p for f in pending_filters
+          for p in job.filter_predicates[f]
+          if p is not None and p not in failed_predicates
+      }
+      if not pending_filters:
+        logging.debug('all log query filters satisfied (project: %s)',
+                      job.project_id)
+        break
+      # Restart the query for the remaining pages, without the satisfied
+      # filters.
+      filter_str = _job_filter_str(job, pending_filters, start_time,
+                                   last_timestamp)
+      logging.debug('rewriting log query (project: %s, query: %s)',
+                    job.project_id, filter_str.replace('\n', ' AND '))
+      req = logging_api.entries().list(
+          body={
+              'resourceNames': [f'projects/{job.project_id}'],
+              'filter': filter_str,
+              'orderBy': 'timestamp desc',
+              'pageSize': config.get('logging_page_size')
+          })
     if req is not None:
       logging.info(
           'still fetching logs (project: %s, resource type: %s, max wait: %ds)',
@@ -235,23 +405,29 @@ def _execute_query_job(job: _LogsQueryJob):
   logging.debug('logging query run time: %s, pages: %d, query: %s',
                 query_end_time - query_start_time, query_pages,
                 filter_str.replace('\n', ' AND '))
+  if max_entries_per_filter:
+    logging.debug('log entries per filter (project: %s): %s', job.project_id,
+                  filter_counts)
 
-  return deque
-
+  for predicate, entries in demuxed.items():
+    results[predicate] = failed_predicates.get(predicate) or entries.result()
+  return results
 
-@caching.cached_api_call
-def realtime_query(project_id, filter_str, start_time, end_time):
-  """Intended for use in only runbooks. use logs.query() for lint rules."""
-  logging_api = apis.get_api('logging', 'v2', project_id)
 
+def _realtime_filter_str(filter_str: str, start_time: datetime.datetime,
+                         end_time: datetime.datetime) -> str:
   filter_lines = [filter_str]
   filter_lines.append('timestamp>"%s"' %
                       start_time.isoformat(timespec='seconds'))
   filter_lines.append('timestamp<"%s"' % end_time.isoformat(timespec='seconds'))
-  filter_str = '\n'.join(filter_lines)
-  logging.info('searching logs in project %s for logs between %s and %s',
-               project_id, str(start_time), str(end_time))
-  deque = Deque()
+  return '\n'.join(filter_lines)
+
+
+def _fetch_realtime_entries(project_id: str,
+                            filter_str: str) -> Iterator[Mapping[str, Any]]:
+  """Fetch the log entries matching a filter, newest first, within the
+  configured limits of entries and time."""
+  logging_api = apis.get_api('logging', 'v2', project_id)
   req = logging_api.entries().list(
       body={
           'resourceNames': [f'projects/{project_id}'],
@@ -264,11 +440,11 @@ def realtime_query(project_id, filter_str, start_time, end_time):
   query_start_time = datetime.datetime.now()
   while req is not None:
     query_pages += 1
-    res = _ratelimited_execute(req)
+    res = _ratelimited_execute(req, project_id)
     if 'entries' in res:
       for e in res['entries']:
         fetched_entries_count += 1
-        deque.appendleft(e)
+        yield e
 
     # Verify that we aren't above limits, exit otherwise.
     if fetched_entries_count > config.get('logging_fetch_max_entries'):
@@ -276,13 +452,13 @@ def realtime_query(project_id, filter_str, start_time, end_time):
           'maximum number of log entries (%d) reached (project: %s, query: %s).',
           config.get('logging_fetch_max_entries'), project_id,
           filter_str.replace('\n', ' AND '))
-      return deque
+      return
     run_time = (datetime.datetime.now() - query_start_time).total_seconds()
     if run_time >= config.get('logging_fetch_max_time_seconds'):
       logging.warning(
           'maximum query runtime for log query reached (project: %s, query: %s).',
           project_id, filter_str.replace('\n', ' AND '))
-      return deque
+      return
     req = logging_api.entries().list_next(req, res)
     if req is not None:
       logging.info('still fetching logs (project: %s, max wait: %ds)',
@@ -294,13 +470,308 @@ def realtime_query(project_id, filter_str, start_time, end_time):
                 query_end_time - query_start_time, query_pages,
                 filter_str.replace('\n', ' AND '))
 
+
+@caching.cached_api_call
+def realtime_query(project_id, filter_str, start_time, end_time):
+  """Intended for use in only runbooks. use logs.query() for lint rules.
+
+  If the query was registered with register_realtime_query(), the entries
+  fetched by the RealtimeQueryBatch of the runbook are returned, except when
+  the cache is bypassed (re-evaluation of a step)."""
+  batch = _realtime_query_batch.get()
+  if batch and not caching.is_cache_bypassed():
+    entries = batch.get(project_id, filter_str, start_time, end_time)
+    if entries is not None:
+      return entries
+
+  logging.info('searching logs in project %s for logs between %s and %s',
+               project_id, str(start_time), str(end_time))
+  deque = Deque()
+  for e in _fetch_realtime_entries(
+      project_id, _realtime_filter_str(filter_str, start_time, end_time)):
+    deque.appendleft(e)
   return deque
 
 
+@dataclasses.dataclass
+class _RealtimeQueryJob:
+  """A group of realtime log queries executed with a single API query."""
+  project_id: str
+  start_time: datetime.datetime
+  end_time: datetime.datetime
+  # Python-side filter of the entries of every query. None is used for a
+  # query that wants all the fetched entries, which is never grouped with
+  # other queries.
+  predicates: Dict[str, Optional[Callable[[Mapping[str, Any]], bool]]]
+  future: Optional[concurrent.futures.Future] = None
+
+
+class RealtimeQueryBatch:
+  """Realtime log queries of a runbook, executed with as few API queries as
+  possible.
+
+  The queries are registered up front (see register_realtime_query()), e.g.
+  when the diagnostic tree is built, and executed in parallel with execute().
+  Queries with the same project and time window that have a predicate are
+  combined with OR in a single API query, and the fetched entries are
+  dispatched to every query with its predicate. Every combined query keeps its
+  own logging_fetch_max_entries limit. realtime_query() then returns the
+  entries fetched by the batch instead of doing its own API query.
+  """
+
+  def __init__(self):
+    self._lock = threading.Lock()
+    self._todo: Dict[Tuple[str, str, datetime.datetime, datetime.datetime],
+                     Optional[Callable[[Mapping[str, Any]], bool]]] = {}
+    self._jobs: Dict[Tuple[str, str, datetime.datetime, datetime.datetime],
+                     _RealtimeQueryJob] = {}
+
+  def register(
+      self,
+      project_id: str,
+      filter_str: str,
+      start_time: datetime.datetime,
+      end_time: datetime.datetime,
+      predicate: Optional[Callable[[Mapping[str, Any]], bool]] = None):
+    key = (project_id, filter_str, start_time, end_time)
+    with self._lock:
+      if key not in self._jobs:
+        self._todo[key] = predicate
+
+  def _plan(self) -> List[_RealtimeQueryJob]:
+    """Group the registered queries into jobs."""
+    with self._lock:
+      todo, self._todo = self._todo, {}
+      grouped: Dict[Tuple[str, datetime.datetime, datetime.datetime],
+                    _RealtimeQueryJob] = {}
+      jobs = []
+      for key, predicate in todo.items():
+        project_id, filter_str, start_time, end_time = key
+        job = None
+        if predicate is not None:
+          job = grouped.get((project_id, start_time, end_time))
+        if not job:
+          job = _RealtimeQueryJob(project_id=project_id,
+                                  start_time=start_time,
+                                  end_time=end_time,
+                                  predicates={})
+          jobs.append(job)
+          if predicate is not None:
+            grouped[(project_id, start_time, end_time)] = job
+        job.predicates[filter_str] = predicate
+        self._jobs[key] = job
+    return jobs
+
+  def execute(self, executor: concurrent.futures.Executor) -> None:
+    """Execute the registered queries that weren't executed yet."""
+    jobs = self._plan()
+    if jobs:
+      logging.debug('executing %d realtime log queries with %d API queries',
+                    sum(len(job.predicates) for job in jobs), len(jobs))
+    for job in jobs:
+      job.future = executor.submit(_execute_realtime_query_job, job)
+
+  def get(self, project_id: str, filter_str: str,
+          start_time: datetime.datetime,
+          end_time: datetime.datetime) -> Optional[Deque]:
+    """Return the entries fetched for a query, or None if it wasn't
+    executed by the batch. Raises the exception of the predicate of the query
+    if it failed."""
+    with self._lock:
+      job = self._jobs.get((project_id, filter_str, start_time, end_time))
+    if not job or not job.future:
+      return None
+    if not job.future.done():
+      logging.info(
+          'waiting for logs query results (project: %s, %d queries)',
+          project_id, len(job.predicates))
+    result = job.future.result()[filter_str]
+    if isinstance(result, Exception):
+      raise result
+    return result
+
+
+def _realtime_job_filter_str(filters: Iterable[str],
+                             start_time: datetime.datetime,
+                             end_time: datetime.datetime,
+                             end_timestamp: Optional[str] = None) -> str:
+  filters = sorted(filters)
+  if len(filters) == 1:
+    filter_str = filters[0]
+  else:
+    filter_str = ' OR '.join(['(' + val + ')' for val in filters])
+  filter_str = _realtime_filter_str(filter_str, start_time, end_time)
+  if end_timestamp:
+    filter_str += '\ntimestamp<="%s"' % end_timestamp
+  return filter_str
+
+
+def _execute_realtime_query_job(
+    job: _RealtimeQueryJob) -> Dict[str, Union[Deque, Exception]]:
+  thread = threading.current_thread()
+  thread.name = f'realtime_log_query:{job.project_id}'
+  logging.info('searching logs in project %s for logs between %s and %s',
+               job.project_id, str(job.start_time), str(job.end_time))
+  results: Dict[str, Deque] = {f: Deque() for f in job.predicates}
+  if len(job.predicates) == 1:
+    filter_str, predicate = next(iter(job.predicates.items()))
+    for e in _fetch_realtime_entries(
+        job.project_id,
+        _realtime_filter_str(filter_str, job.start_time, job.end_time)):
+      if predicate is None or predicate(e):
+        results[filter_str].appendleft(e)
+    return results
+
+  # Every filter gets the logging_fetch_max_entries limit it would have with
+  # its own API query, so that a noisy filter can't starve the others: once a
+  # filter has matched more entries than that, it is removed from the query
+  # for the remaining pages.
+  max_entries = config.get('logging_fetch_max_entries')
+  filter_counts = {f: 0 for f in job.predicates}
+  pending_filters = set(job.predicates)
+  # Filters whose predicate raised an exception: only their queries fail, with
+  # that exception, and they are removed from the query like the satisfied
+  # filters.
+  failed_filters: Dict[str, Exception] = {}
+  # Entries with the same timestamp as the last fetched entry, to skip
+  # duplicates after the query was rewritten.
+  last_timestamp = None
+  last_timestamp_ids: Set[str] = set()
+
+  logging_api = apis.get_api('logging', 'v2', job.project_id)
+  filter_str = _realtime_job_filter_str(pending_filters, job.start_time,
+                                        job.end_time)
+  req = logging_api.entries().list(
+      body={
+          'resourceNames': [f'projects/{job.project_id}'],
+          'filter': filter_str,
+          'orderBy': 'timestamp desc',
+          'pageSize': config.get('logging_page_size')
+      })
+  fetched_entries_count = 0
+  query_pages = 0
+  query_start_time = datetime.datetime.now()
+  while req is not None:
+    query_pages += 1
+    res = _ratelimited_execute(req, job.project_id)
+    for e in res.get('entries', []):
+      timestamp = e.get('timestamp')
+      if timestamp == last_timestamp and \
+          e.get('insertId') in last_timestamp_ids:
+        continue
+      if timestamp != last_timestamp:
+        last_timestamp = timestamp
+        last_timestamp_ids = set()
+      last_timestamp_ids.add(e.get('insertId'))
+      fetched_entries_count += 1
+      for f in pending_filters - failed_filters.keys():
+        predicate = job.predicates[f]
+        try:
+          matched = predicate is None or predicate(e)
+        except Exception as err:  # pylint: disable=broad-except
+          logging.warning(
+              'log query predicate failed (project: %s, query: %s): %r',
+              job.project_id, f.replace('\n', ' AND '), err)
+          failed_filters[f] = err
+          continue
+        if matched:
+          results[f].appendleft(e)
+          filter_counts[f] += 1
+
+    # Verify that we aren't above limits, exit otherwise.
+    if fetched_entries_count > max_entries * len(job.predicates):
+      logging.warning(
+          'maximum number of log entries (%d) reached (project: %s, query: %s).',
+          max_entries * len(job.predicates), job.project_id,
+          filter_str.replace('\n', ' AND '))
+      break
+    run_time = (datetime.datetime.now() - query_start_time).total_seconds()
+    if run_time >= config.get('logging_fetch_max_time_seconds'):
+      logging.warning(
+          'maximum query runtime for log query reached (project: %s, query: %s).',
+          job.project_id, filter_str.replace('\n', ' AND '))
+      break
+    req = logging_api.entries().list_next(req, res)
+    satisfied_filters = {
+        f for f in pending_filters if filter_counts[f] > max_entries
+    }
+    removed_filters = satisfied_filters | (pending_filters &
+                                           failed_filters.keys())
+    if req is not None and removed_filters:
+      for f in satisfied_filters:
+        logging.warning(
+            'maximum number of log entries (%d) reached (project: %s, query: %s).',
+            max_entries, job.project_id, f.replace('\n', ' AND '))
+      pending_filters -= removed_filters
+      if not pending_filters:
+        break
+      # Restart the query for the remaining pages, without the satisfied and
+      # failed filters.
+      filter_str = _realtime_job_filter_str(pending_filters, job.start_time,
+                                            job.end_time, last_timestamp)
+      logging.debug('rewriting log query (project: %s, query: %s)',
+                    job.project_id, filter_str.replace('\n', ' AND '))
+      req = logging_api.entries().list(
+          body={
+              'resourceNames': [f'projects/{job.project_id}'],
+              'filter': filter_str,
+              'orderBy': 'timestamp desc',
+              'pageSize': config.get('logging_page_size')
+          })
+    if req is not None:
+      logging.info('still fetching logs (project: %s, max wait: %ds)',
+                   job.project_id,
+                   config.get('logging_fetch_max_time_seconds') - run_time)
+
+  query_end_time = datetime.datetime.now()
+  logging.debug('logging query run time: %s, pages: %d, query: %s',
+                query_end_time - query_start_time, query_pages,
+                filter_str.replace('\n', ' AND '))
+  logging.debug('log entries per filter (project: %s): %s', job.project_id,
+                filter_counts)
+  return {f: failed_filters.get(f) or entries for f, entries in results.items()}
+
+
+_realtime_query_batch: contextvars.ContextVar[Optional[RealtimeQueryBatch]] = \
+    contextvars.ContextVar('realtime_query_batch', default=None)
+
+
+@contextlib.contextmanager
+def realtime_query_batch(batch: RealtimeQueryBatch):
+  """Use `batch` for the realtime queries of the current context, i.e. of
+  the runbook being executed and of the tasks it submits to the
+  executors."""
+  token = _realtime_query_batch.set(batch)
+  try:
+    yield batch
+  finally:
+    _realtime_query_batch.reset(token)
+
+
+def register_realtime_query(
+    project_id: str,
+    filter_str: str,
+    start_time: datetime.datetime,
+    end_time: datetime.datetime,
+    predicate: Optional[Callable[[Mapping[str, Any]], bool]] = None) -> None:
+  """Register a realtime_query() to be executed in advance by the
+  RealtimeQueryBatch of the current runbook. Does nothing if there is none.
+
+  Queries with a `predicate` are combined with the other queries of the same
+  project and time window: the predicate is called for every fetched entry to
+  select the entries returned by realtime_query() for `filter_str`, so it must
+  implement (at least) the same conditions as `filter_str`. Queries without
+  predicate are executed separately, in parallel with the other queries."""
+  batch = _realtime_query_batch.get()
+  if batch:
+    batch.register(project_id, filter_str, start_time, end_time, predicate)
+
+
 def execute_queries(executor: concurrent.futures.Executor):
   global jobs_todo
-  jobs_executing = jobs_todo
-  jobs_todo = {}
+  with _jobs_todo_lock:
+    jobs_executing = jobs_todo
+    jobs_todo = {}
   for job in jobs_executing.values():
     job.future = executor.submit(_execute_query_job, job)
 
@@ -16,10 +16,14 @@
 """Test code in logs.py."""
 
 import concurrent.futures
+import datetime
 import re
 import time
 from unittest import mock
 
+import pytest
+
+from gcpdiag import config
 from gcpdiag.queries import apis_stub, logs, logs_stub
 
 DUMMY_PROJECT_ID = 'gcpdiag-gke1-aaaa'
@@ -89,3 +93,208 @@ class TestLogs:
           'textPayload': 'test message',
           'receiveTimestamp': '2022-03-24T13:26:37.370862686Z'
       }) == '2022-03-24 06:26:37-07:00: test message'
+
+  def test_query_with_predicate(self):
+    """Verify that entries are dispatched to the queries at fetch time."""
+    all_query = logs.query(project_id=DUMMY_PROJECT_ID,
+                           resource_type='gce_instance',
+                           log_name='fake.log',
+                           filter_str='filter1')
+    first_query = logs.query(
+        project_id=DUMMY_PROJECT_ID,
+        resource_type='gce_instance',
+        log_name='fake.log',
+        filter_str='filter2',
+        predicate=lambda e: e['insertId'] == FIRST_INSERT_ID)
+    other_query = logs.query(
+        project_id=DUMMY_PROJECT_ID,
+        resource_type='gce_instance',
+        log_name='fake.log',
+        filter_str='filter3',
+        predicate=lambda e: e['insertId'] != FIRST_INSERT_ID)
+    with concurrent.futures.ThreadPoolExecutor(max_workers=1) as executor:
+      logs.execute_queries(executor)
+      all_entries = list(all_query.entries)
+      assert [e['insertId'] for e in first_query.entries] == [FIRST_INSERT_ID]
+      # entries are still sorted from the earliest to the latest
+      assert list(other_query.entries) == all_entries[1:]
+
+  def test_query_with_failing_predicate(self):
+    """Verify that a predicate raising an exception only fails its query."""
+    failing_query = logs.query(project_id=DUMMY_PROJECT_ID,
+                               resource_type='gce_instance',
+                               log_name='fake.log',
+                               filter_str='filter1',
+                               predicate=lambda e: e['unknown'])
+    query = logs.query(project_id=DUMMY_PROJECT_ID,
+                       resource_type='gce_instance',
+                       log_name='fake.log',
+                       filter_str='filter2',
+                       predicate=lambda e: e['insertId'] == FIRST_INSERT_ID)
+    with concurrent.futures.ThreadPoolExecutor(max_workers=1) as executor:
+      logs.execute_queries(executor)
+      assert [e['insertId'] for e in query.entries] == [FIRST_INSERT_ID]
+      with pytest.raises(KeyError):
+        list(failing_query.entries)
+
+  def test_query_with_predicate_spill(self):
+    """Verify that many matching entries are moved to temporary storage."""
+    all_query = logs.query(project_id=DUMMY_PROJECT_ID,
+                           resource_type='gce_instance',
+                           log_name='fake.log',
+                           filter_str='filter1')
+    query = logs.query(project_id=DUMMY_PROJECT_ID,
+                       resource_type='gce_instance',
+                       log_name='fake.log',
+                       filter_str='filter2',
+                       predicate=lambda e: True)
+    with mock.patch('gcpdiag.config.LOGGING_DEMUX_SPILL_ENTRIES', 2), \
+        concurrent.futures.ThreadPoolExecutor(max_workers=1) as executor:
+      logs.execute_queries(executor)
+      assert not isinstance(query.entries, list)
+      assert list(query.entries) == list(all_query.entries)
+
+  # pylint: disable=protected-access
+  def test_max_entries_per_filter(self):
+    """Verify that satisfied filters are removed from the query."""
+    first_query = logs.query(
+        project_id=DUMMY_PROJECT_ID,
+        resource_type='gce_instance',
+        log_name='fake.log',
+        filter_str='filter1',
+        predicate=lambda e: e['insertId'] == FIRST_INSERT_ID)
+    none_query = logs.query(project_id=DUMMY_PROJECT_ID,
+                            resource_type='gce_instance',
+                            log_name='fake.log',
+                            filter_str='filter2',
+                            predicate=lambda e: False)
+    # the stub returns the same page again, once
+    next_pages = [
+        apis_stub.RestCallStub(DUMMY_PROJECT_ID, 'logging-entries-1'), None
+    ]
+    with mock.patch.object(logs_stub.LoggingApiStub,
+                           'list_next',
+                           side_effect=lambda req, res: next_pages.pop(0)), \
+        mock.patch.dict(config._args,
+                        {'logging_fetch_max_entries_per_filter': 1}), \
+        concurrent.futures.ThreadPoolExecutor(max_workers=1) as executor:
+      logs.execute_queries(executor)
+      assert [e['insertId'] for e in first_query.entries] == [FIRST_INSERT_ID]
+      assert not none_query.entries
+    assert re.match(
+        r'timestamp>"[^"]*"\n'
+        r'timestamp<="[^"]*"\n'
+        r'resource.type="gce_instance"\n'
+        r'logName="fake.log"\n'
+        r'\(filter2\)', logs_stub.logging_body['filter'])
+
+  def test_realtime_query_batch(self):
+    """Verify that registered queries are combined and dispatched."""
+    start_time = datetime.datetime(2024, 1, 1, tzinfo=datetime.timezone.utc)
+    end_time = datetime.datetime(2024, 1, 2, tzinfo=datetime.timezone.utc)
+    batch = logs.RealtimeQueryBatch()
+    with logs.realtime_query_batch(batch), \
+        mock.patch.object(logs_stub.LoggingApiStub, 'list', autospec=True,
+                          side_effect=logs_stub.LoggingApiStub.list) as list_, \
+        concurrent.futures.ThreadPoolExecutor(max_workers=1) as executor:
+      logs.register_realtime_query(
+          DUMMY_PROJECT_ID,
+          'filter1',
+          start_time,
+          end_time,
+          predicate=lambda e: e['insertId'] == FIRST_INSERT_ID)
+      logs.register_realtime_query(
+          DUMMY_PROJECT_ID,
+          'filter2',
+          start_time,
+          end_time,
+          predicate=lambda e: e['insertId'] != FIRST_INSERT_ID)
+      logs.register_realtime_query(DUMMY_PROJECT_ID, 'filter3', start_time,
+                                   end_time)
+      batch.execute(executor)
+      all_entries = list(
+          batch.get(DUMMY_PROJECT_ID, 'filter3', start_time, end_time))
+      assert [
+          e['insertId']
+          for e in batch.get(DUMMY_PROJECT_ID, 'filter1', start_time, end_time)
+      ] == [FIRST_INSERT_ID]
+      # entries are still sorted from the earliest to the latest
+      assert list(batch.get(DUMMY_PROJECT_ID, 'filter2', start_time,
+                            end_time)) == all_entries[1:]
+      assert batch.get(DUMMY_PROJECT_ID, 'filter4', start_time,
+                       end_time) is None
+    # the queries with a predicate were combined
+    filters = sorted(kwargs['body']['filter'].split('\n')[0]
+                     for _, kwargs in list_.call_args_list)
+    assert filters == ['(filter1) OR (filter2)', 'filter3']
+
+  def test_realtime_query_batch_failing_predicate(self):
+    """Verify that a predicate raising an exception only fails its query."""
+    start_time = datetime.datetime(2024, 1, 1, tzinfo=datetime.timezone.utc)
+    end_time = datetime.datetime(2024, 1, 2, tzinfo=datetime.timezone.utc)
+    batch = logs.RealtimeQueryBatch()
+    with logs.realtime_query_batch(batch), \
+        concurrent.futures.ThreadPoolExecutor(max_workers=1) as executor:
+      logs.register_realtime_query(DUMMY_PROJECT_ID,
+                                   'filter1',
+                                   start_time,
+                                   end_time,
+                                   predicate=lambda e: e['unknown'])
+      logs.register_realtime_query(
+          DUMMY_PROJECT_ID,
+          'filter2',
+          start_time,
+          end_time,
+          predicate=lambda e: e['insertId'] == FIRST_INSERT_ID)
+      batch.execute(executor)
+      assert [
+          e['insertId']
+          for e in batch.get(DUMMY_PROJECT_ID, 'filter2', start_time, end_time)
+      ] == [FIRST_INSERT_ID]
+      with pytest.raises(KeyError):
+        batch.get(DUMMY_PROJECT_ID, 'filter1', start_time, end_time)
+
+  # pylint: disable=protected-access
+  def test_realtime_query_batch_max_entries(self):
+    """Verify that every combined query gets its own entries limit."""
+    start_time = datetime.datetime(2024, 1, 1, tzinfo=datetime.timezone.utc)
+    end_time = datetime.datetime(2024, 1, 2, tzinfo=datetime.timezone.utc)
+    batch = logs.RealtimeQueryBatch()
+    # the stub returns 7 entries per page: filter1 reaches the limit with the
+    # first page, which would have stopped a query with a shared limit.
+    with logs.realtime_query_batch(batch), \
+        mock.patch.object(logs_stub.LoggingApiStub,
+                          'list_next',
+                          side_effect=lambda req, res: req), \
+        mock.patch.object(logs, '_ratelimited_execute',
+                          wraps=logs._ratelimited_execute) as execute, \
+        mock.patch.dict(config._args, {'logging_fetch_max_entries': 4}), \
+        concurrent.futures.ThreadPoolExecutor(max_workers=1) as executor:
+      logs.register_realtime_query(DUMMY_PROJECT_ID,
+                                   'filter1',
+                                   start_time,
+                                   end_time,
+                                   predicate=lambda e: True)
+      logs.register_realtime_query(
+          DUMMY_PROJECT_ID,
+          'filter2',
+          start_time,
+          end_time,
+          predicate=lambda e: e['insertId'] == FIRST_INSERT_ID)
+      batch.execute(executor)
+      first_entries = list(
+          batch.get(DUMMY_PROJECT_ID, 'filter1', start_time, end_time))
+      assert len(first_entries) == 7
+      # filter2 still gets the entries of the second page, which is the same
+      # page again since the stub ignores the filter.
+      assert [
+          e['insertId']
+          for e in batch.get(DUMMY_PROJECT_ID, 'filter2', start_time, end_time)
+      ] == [FIRST_INSERT_ID, FIRST_INSERT_ID]
+    # the second page was fetched without the satisfied filter1
+    assert execute.call_count == 2
+    assert re.match(
+        r'filter2\n'
+        r'timestamp>"[^"]*"\n'
+        r'timestamp<"[^"]*"\n'
+        r'timestamp<="[^"]*"$', logs_stub.logging_body['filter'])
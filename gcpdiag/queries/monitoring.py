@@ -15,16 +15,32 @@
 # Lint as: python3
 """Queries related to Monitoring / Metrics / MQL."""
 
+import array
 import collections.abc
 import datetime
 import logging
+import math
+import re
+import sys
 import time
-from typing import Any, List, Mapping
+from typing import Any, Dict, List, Mapping, Optional, Sequence, Union
 
 import googleapiclient.errors
 
-from gcpdiag import config, utils
-from gcpdiag.queries import apis
+from gcpdiag import caching, config, utils
+from gcpdiag.queries import apis, apis_utils
+
+try:
+  import numpy as np
+except ImportError:
+  # NumPy is optional: without it, the TimeSeries statistics are computed in
+  # Python.
+  np = None
+
+# A column of values of a time series: array.array('d') for doubles,
+# array.array('q') for integers and booleans, or a list for strings and for
+# columns with values of different types.
+Column = Union[array.array, List[Any]]
 
 
 # see: https://cloud.google.com/monitoring/api/ref_v3/rest/v3/TypedValue
@@ -57,6 +73,159 @@ def period_aligned_now(period_seconds: int) -> str:
   return time.strftime('%Y/%m/%d-%H:%M:%S+00:00', time.gmtime(now))
 
 
+def _new_column(typed_value: Mapping[str, Any]) -> Column:
+  if 'doubleValue' in typed_value:
+    return array.array('d')
+  elif 'int64Value' in typed_value or 'boolValue' in typed_value:
+    return array.array('q')
+  else:
+    return []
+
+
+def _column_append(column: Column, value: Any) -> Column:
+  """Append value to column, converting the column to a list if the value
+  doesn't have the type of the array (e.g. a double in a column of integers),
+  so that all the values keep their type. Returns the column."""
+  if isinstance(column, array.array):
+    if isinstance(value, float) == (column.typecode == 'd'):
+      try:
+        column.append(value)
+        return column
+      except (TypeError, OverflowError):
+        pass
+    column = list(column)
+  column.append(value)
+  return column
+
+
+def _parse_timestamp(timestamp: str) -> float:
+  """Convert a timestamp like '2021-05-19T15:40:31.414435Z' to seconds since the
+  epoch."""
+  # datetime doesn't support nanoseconds, so the fraction is parsed separately.
+  date, _, fraction = timestamp.rstrip('Z').partition('.')
+  seconds = datetime.datetime.fromisoformat(date).replace(
+      tzinfo=datetime.timezone.utc).timestamp()
+  if fraction:
+    seconds += float('0.' + fraction)
+  return seconds
+
+
+def _percentile(values: Sequence[Any], percent: float) -> float:
+  """Percentile with linear interpolation (like numpy.percentile())."""
+  values = sorted(values)
+  position = (len(values) - 1) * percent / 100
+  lower = math.floor(position)
+  upper = min(lower + 1, len(values) - 1)
+  return values[lower] + (values[upper] - values[lower]) * (position - lower)
+
+
+class TimeSeries(collections.abc.Mapping):
+  """A time series of a TimeSeriesCollection, stored column by column.
+
+  The points are sorted chronologically and stored in one contiguous array per
+  value column (see Column), with an array of the end time of every point (in
+  seconds since the epoch). Use the statistics methods (max(), mean(), etc.)
+  to avoid converting all the points to Python objects: they use NumPy if it
+  is installed.
+
+  For compatibility, this is also a mapping with the 'labels', 'start_time',
+  'end_time' and 'values' fields described in TimeSeriesCollection. 'values'
+  is generated the first time that it is accessed.
+  """
+
+  _FIELDS = ('labels', 'start_time', 'end_time', 'values')
+
+  labels: Dict[str, str]
+  start_time: str
+  end_time: str
+  timestamps: array.array
+  columns: List[Column]
+
+  def __init__(self, labels: Dict[str, str], start_time: str, end_time: str,
+               timestamps: array.array, columns: List[Column]):
+    self.labels = labels
+    self.start_time = start_time
+    self.end_time = end_time
+    self.timestamps = timestamps
+    self.columns = columns
+    self._values: Optional[List[List[Any]]] = None
+
+  def __getitem__(self, field: str):
+    if field == 'values':
+      if self._values is None:
+        self._values = [list(point) for point in zip(*self.columns)]
+      return self._values
+    elif field in self._FIELDS:
+      return getattr(self, field)
+    raise KeyError(field)
+
+  def __iter__(self):
+    return iter(self._FIELDS)
+
+  def __len__(self):
+    return len(self._FIELDS)
+
+  def __repr__(self):
+    return repr(dict(self))
+
+  @property
+  def num_points(self) -> int:
+    return len(self.timestamps)
+
+  def column(self, column: int = 0):
+    """Return the values of a column, as a NumPy array if NumPy is installed
+    (the data is not copied)."""
+    values = self.columns[column]
+    if np is not None and isinstance(values, array.array):
+      return np.frombuffer(values,
+                           dtype=np.float64 if values.typecode == 'd' else
+                           np.int64)
+    return values
+
+  def max(self, column: int = 0):
+    values = self.column(column)
+    if np is not None and isinstance(values, np.ndarray):
+      return values.max().item()
+    return max(values)
+
+  def mean(self, column: int = 0) -> float:
+    values = self.column(column)
+    if np is not None and isinstance(values, np.ndarray):
+      return float(values.mean())
+    return math.fsum(values) / len(values)
+
+  def percentile(self, percent: float, column: int = 0) -> float:
+    """Return the percentile of the values (0 <= percent <= 100)."""
+    values = self.column(column)
+    if np is not None and isinstance(values, np.ndarray):
+      return float(np.percentile(values, percent))
+    return _percentile(values, percent)
+
+  def count_above(self, threshold: float, column: int = 0) -> int:
+    """Return the number of points with a value greater than threshold."""
+    values = self.column(column)
+    if np is not None and isinstance(values, np.ndarray):
+      return int(np.count_nonzero(values > threshold))
+    return sum(1 for v in values if v > threshold)
+
+  def threshold_crossings(self, threshold: float, column: int = 0) -> int:
+    """Return how many times the value went above threshold.
+
+    A series starting above the threshold counts as one crossing."""
+    values = self.column(column)
+    if np is not None and isinstance(values, np.ndarray):
+      above = values > threshold
+      return int(above[0]) + int(np.count_nonzero(above[1:] & ~above[:-1]))
+    crossings = 0
+    previous_above = False
+    for v in values:
+      above = v > threshold
+      if above and not previous_above:
+        crossings += 1
+      previous_above = above
+    return crossings
+
+
 class TimeSeriesCollection(collections.abc.Mapping):
   """A mapping that stores Cloud Monitoring time series data.
 
@@ -67,7 +236,8 @@ class TimeSeriesCollection(collections.abc.Mapping):
                  'resource.container_name:dnsmasq'})
 
   The frozenset is used as key to store the time series data. The data
-  is a dictionary with the following fields:
+  is a TimeSeries object, which stores the points column by column, and is
+  also a mapping with the following fields:
 
   - 'start_time': timestamp string (ISO format) for the earliest point
   - 'end_time': timestamp string (ISO format) for the latest point
@@ -107,33 +277,40 @@ class TimeSeriesCollection(collections.abc.Mapping):
           'pointData'][0]['values']:
         continue
 
-      # Use frozenset of label:value pairs as key to store the data
+      # Use frozenset of label:value pairs as key to store the data. Label
+      # names and values are interned, because they are repeated in many time
+      # series.
       labels_dict = {}
       if 'labelValues' in ts:
         for i, value in enumerate(ts['labelValues']):
           label_name = resource_data['timeSeriesDescriptor'][
               'labelDescriptors'][i]['key']
           if 'stringValue' in value:
-            labels_dict[label_name] = value['stringValue']
-        labels_frozenset = frozenset(f'{k}:{v}' for k, v in labels_dict.items())
+            labels_dict[sys.intern(label_name)] = sys.intern(
+                value['stringValue'])
+        labels_frozenset = frozenset(
+            sys.intern(f'{k}:{v}') for k, v in labels_dict.items())
       else:
         labels_frozenset = frozenset()
 
+      # Points are returned most recent first.
       ts_point_data = ts['pointData']
-      self._data[labels_frozenset] = {
-          'labels':
-              labels_dict,
-          'start_time':
-              ts_point_data[-1]['timeInterval']['startTime'],
-          'end_time':
-              ts_point_data[0]['timeInterval']['endTime'],
-          'values': [
-              _gcp_typed_values_to_python_list(ts_point_data[i]['values'])
-              for i in reversed(range(len(ts_point_data)))
-          ]
-      }
-
-  def __getitem__(self, labels):
+      timestamps = array.array('d')
+      columns = [_new_column(v) for v in ts_point_data[0]['values']]
+      for point in reversed(ts_point_data):
+        timestamps.append(_parse_timestamp(point['timeInterval']['endTime']))
+        for i, value in enumerate(
+            _gcp_typed_values_to_python_list(point['values'])):
+          columns[i] = _column_append(columns[i], value)
+
+      self._data[labels_frozenset] = TimeSeries(
+          labels=labels_dict,
+          start_time=ts_point_data[-1]['timeInterval']['startTime'],
+          end_time=ts_point_data[0]['timeInterval']['endTime'],
+          timestamps=timestamps,
+          columns=columns)
+
+  def __getitem__(self, labels) -> TimeSeries:
     """Returns the time series identified by labels (frozenset)."""
     return self._data[labels]
 
@@ -153,14 +330,65 @@ class TimeSeriesCollection(collections.abc.Mapping):
     return self._data.values()
 
 
+# MQL string literals, which must be kept as-is when normalizing queries.
+_MQL_STRING_RE = re.compile(r"""('(?:[^'\\]|\\.)*'|"(?:[^"\\]|\\.)*")""")
+# MQL date literals, e.g. d'2024/01/01-00:00:00+00:00' or d'2024/01/01 00:00'.
+_MQL_DATE_RE = re.compile(r"""\bd['"]\d{4}/""")
+
+
+def _normalize_query(query_str: str) -> str:
+  """Normalize the whitespace of a MQL query (outside of string literals)."""
+  parts = _MQL_STRING_RE.split(query_str)
+  for i in range(0, len(parts), 2):
+    parts[i] = re.sub(r'\s+', ' ', parts[i])
+  return ''.join(parts).strip()
+
+
+def _query_time_bucket(query_str: str) -> Optional[int]:
+  """Return the time period during which the results of a query can be reused.
+
+  Queries ending at a fixed date (e.g. with period_aligned_now()) always return
+  the same results, but queries relative to the current time don't."""
+  if _MQL_DATE_RE.search(query_str):
+    return None
+  return int(time.time() // config.MONITORING_QUERY_CACHE_SECONDS)
+
+
 def query(project_id: str, query_str: str) -> TimeSeriesCollection:
   """Do a monitoring query in the specified project.
 
   Note that the project can be either the project where the monitored resources
   are, or a workspace host project, in which case you will get results for all
   associated monitored projects.
+
+  Results are cached, so that the same query (ignoring whitespace differences)
+  is executed only once, and concurrent identical queries wait for the first
+  one to complete. The returned TimeSeriesCollection must not be modified.
+  """
+  return _query(project_id, _normalize_query(query_str),
+                _query_time_bucket(query_str))
+
+
+def query_per_resource(project_id: str, query_str: str,
+                       label: str) -> Dict[str, Mapping[str, Any]]:
+  """Do a monitoring query returning time series for many resources.
+
+  The query must group its results by `label` (e.g.
+  `group_by [resource.instance_id]`), and the time series are returned indexed
+  by the label value. Use this instead of doing one query per resource
+  filtering on this label: the query is done once for all the resources.
   """
+  return {
+      ts['labels'][label]: ts
+      for ts in query(project_id, query_str).values()
+      if label in ts['labels']
+  }
+
 
+@caching.cached_api_call(in_memory=True)
+def _query(project_id: str, query_str: str,
+           time_bucket: Optional[int]) -> TimeSeriesCollection:
+  del time_bucket  # only used as cache key
   time_series = TimeSeriesCollection()
 
   mon_api = apis.get_api('monitoring', 'v3', project_id)
@@ -175,7 +403,9 @@ def query(project_id: str, query_str: str) -> TimeSeriesCollection:
     start_time = datetime.datetime.now()
     while request:
       pages += 1
-      response = request.execute(num_retries=config.API_RETRIES)
+      response = apis_utils.execute(request,
+                                    service='monitoring',
+                                    project_id=project_id)
       time_series.add_api_response(response)
       request = mon_api.projects().timeSeries().query_next(
           previous_request=request, previous_response=response)
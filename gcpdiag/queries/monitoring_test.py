@@ -15,9 +15,11 @@
 # Lint as: python3
 """Test code in monitoring.py."""
 
+import concurrent.futures
+import threading
 from unittest import mock
 
-from gcpdiag.queries import apis_stub, monitoring
+from gcpdiag.queries import apis_stub, monitoring, monitoring_stub
 
 DUMMY_PROJECT_NAME = 'gcpdiag-gce1-aaaa'
 DUMMY_INSTANCE_NAME = 'gce1'
@@ -54,3 +56,157 @@ class Test:
     assert isinstance(value['values'][1][0], float)
     assert isinstance(value['values'][0][1], int)
     assert isinstance(value['values'][1][1], int)
+
+  def test_query_cached(self):
+    with mock.patch.object(monitoring_stub.MonitoringApiStub,
+                           'query',
+                           autospec=True,
+                           side_effect=monitoring_stub.MonitoringApiStub.query
+                          ) as query_mock:
+      ts_col1 = monitoring.query(DUMMY_PROJECT_NAME, 'fetch  gce_instance\n')
+      ts_col2 = monitoring.query(DUMMY_PROJECT_NAME, ' fetch gce_instance')
+      assert ts_col1 is ts_col2
+      assert query_mock.call_count == 1
+      assert query_mock.call_args[1]['body'] == {'query': 'fetch gce_instance'}
+
+  def test_query_coalesced(self):
+    started = threading.Event()
+    release = threading.Event()
+    orig_query = monitoring_stub.MonitoringApiStub.query
+
+    def slow_query(self, name, body):
+      started.set()
+      release.wait(10)
+      return orig_query(self, name, body)
+
+    with mock.patch.object(monitoring_stub.MonitoringApiStub,
+                           'query',
+                           autospec=True,
+                           side_effect=slow_query) as query_mock:
+      with concurrent.futures.ThreadPoolExecutor(max_workers=3) as executor:
+        futures = [
+            executor.submit(monitoring.query, DUMMY_PROJECT_NAME,
+                            'fetch gce_instance | every 1m') for _ in range(3)
+        ]
+        started.wait(10)
+        release.set()
+        results = [f.result() for f in futures]
+      assert query_mock.call_count == 1
+      assert results[0] is results[1] is results[2]
+
+  def test_query_per_resource(self):
+    ts_by_instance = monitoring.query_per_resource(
+        DUMMY_PROJECT_NAME, 'mocked query (this is ignored)',
+        'metric.instance_name')
+    assert ts_by_instance[DUMMY_INSTANCE_NAME]['labels'][
+        'resource.zone'] == DUMMY_ZONE
+
+  def test_normalize_query(self):
+    # pylint: disable=protected-access
+    assert monitoring._normalize_query(
+        "fetch gce_instance\n  | filter (metric.name == 'a  b')\n") == \
+        "fetch gce_instance | filter (metric.name == 'a  b')"
+
+  def test_query_time_bucket(self):
+    # pylint: disable=protected-access
+    assert monitoring._query_time_bucket(
+        "fetch gce_instance | within 1h, d'2024/01/01-00:00:00+00:00'") is None
+    assert monitoring._query_time_bucket(
+        "fetch gce_instance | within 1h, d'2024/01/01 00:00'") is None
+    # string literals ending with d are not dates
+    assert monitoring._query_time_bucket(
+        "fetch gce_instance | metric 'compute.googleapis.com/guest/disk/"
+        "bytes_used' | within 10m") is not None
+    with mock.patch('time.time', return_value=1000):
+      bucket = monitoring._query_time_bucket('fetch gce_instance | within 1h')
+    with mock.patch('time.time', return_value=1000 + 3600):
+      assert monitoring._query_time_bucket(
+          'fetch gce_instance | within 1h') != bucket
+
+
+def _api_response(values):
+  """Monitoring API response with one time series (most recent point first)."""
+  return {
+      'timeSeriesDescriptor': {
+          'labelDescriptors': [{
+              'key': 'resource.instance_id'
+          }]
+      },
+      'timeSeriesData': [{
+          'labelValues': [{
+              'stringValue': '123'
+          }],
+          'pointData': [{
+              'values': v,
+              'timeInterval': {
+                  'startTime': f'2024-01-01T00:0{i}:00Z',
+                  'endTime': f'2024-01-01T00:0{i}:00.500000000Z'
+              }
+          } for i, v in reversed(list(enumerate(values)))]
+      }]
+  }
+
+
+class TestTimeSeries:
+  """Test monitoring.TimeSeries."""
+
+  def _time_series(self, values):
+    ts_col = monitoring.TimeSeriesCollection()
+    ts_col.add_api_response(_api_response(values))
+    return ts_col[frozenset({'resource.instance_id:123'})]
+
+  def test_columns(self):
+    ts = self._time_series([[{
+        'doubleValue': 1.5
+    }, {
+        'int64Value': '10'
+    }], [{
+        'doubleValue': 3
+    }, {
+        'int64Value': '20'
+    }]])
+    assert ts.num_points == 2
+    assert ts.columns[0].typecode == 'd'
+    assert ts.columns[1].typecode == 'q'
+    assert list(ts.timestamps) == [1704067200.5, 1704067260.5]
+
+  def test_mapping(self):
+    ts = self._time_series([[{
+        'doubleValue': 1.5
+    }, {
+        'stringValue': 'a'
+    }], [{
+        'doubleValue': 3.0
+    }, {
+        'stringValue': 'b'
+    }]])
+    assert dict(ts) == {
+        'labels': {
+            'resource.instance_id': '123'
+        },
+        'start_time': '2024-01-01T00:00:00Z',
+        'end_time': '2024-01-01T00:01:00.500000000Z',
+        'values': [[1.5, 'a'], [3.0, 'b']],
+    }
+
+  def test_column_conversion(self):
+    ts = self._time_series([[{'int64Value': '1'}], [{'doubleValue': 2.5}]])
+    assert ts['values'] == [[1], [2.5]]
+    # the values keep their type
+    assert [type(v) for v, in ts['values']] == [int, float]
+    assert ts.max() == 2.5
+    ts = self._time_series([[{'doubleValue': 2.5}], [{'int64Value': '3'}]])
+    assert [type(v) for v, in ts['values']] == [float, int]
+    assert ts.mean() == 2.75
+
+  def test_statistics(self):
+    ts = self._time_series([[{
+        'doubleValue': v
+    }] for v in [5.0, 1.0, 7.0, 8.0, 2.0, 9.0]])
+    assert ts.max() == 9.0
+    assert ts.mean() == 32.0 / 6
+    assert ts.percentile(50) == 6.0
+    assert ts.percentile(100) == 9.0
+    assert ts.count_above(4.0) == 4
+    assert ts.threshold_crossings(4.0) == 3
+    assert ts.threshold_crossings(10.0) == 0
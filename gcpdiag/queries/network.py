@@ -13,12 +13,16 @@
 # limitations under the License.
 """Queries related to VPC Networks."""
 
+import abc
+import bisect
 import copy
 import dataclasses
+import functools
 import ipaddress
 import logging
 import re
-from typing import Any, Dict, FrozenSet, Iterable, List, Optional, Union
+from typing import (Any, Dict, FrozenSet, Iterable, List, Optional, Sequence,
+                    Tuple, Union)
 
 from gcpdiag import caching, config, models
 from gcpdiag.queries import apis, apis_utils, iam
@@ -546,6 +550,65 @@ def _vpc_allow_deny_match(protocol: str, port: Optional[int],
   return None
 
 
+# A port range compiled with _compile_port_range().
+_PortRange = Union[Tuple[int, int], str]
+
+
+def _compile_port_range(port_range: str) -> _PortRange:
+  """Parse a port range ('80' or '8000-9000') to a (first, last) tuple.
+
+  Invalid ranges are returned as-is, so that they raise ValueError only when
+  they are evaluated, like with _port_in_port_range()."""
+  try:
+    parts = [int(p) for p in port_range.split('-', 1)]
+  except (TypeError, ValueError):
+    return port_range
+  return (parts[0], parts[-1])
+
+
+def _port_in_compiled_ranges(port: int, port_ranges: Iterable[_PortRange]):
+  for p_range in port_ranges:
+    if isinstance(p_range, str):
+      if _port_in_port_range(port, p_range):
+        return True
+    elif p_range[0] <= port <= p_range[1]:
+      return True
+  return False
+
+
+@dataclasses.dataclass(frozen=True)
+class _CompiledL4Config:
+  """A protocol and port ranges, with the action of the rule if they match
+  (ports is None when all the ports match)."""
+  action: str
+  protocol: str
+  ports: Optional[Tuple[_PortRange, ...]]
+
+
+def _compile_l4_configs(action: str, protocol_key: str,
+                        l4_configs: Iterable[Dict[str, Any]]):
+  return [
+      _CompiledL4Config(
+          action, l4c[protocol_key],
+          tuple(_compile_port_range(p)
+                for p in l4c['ports']) if 'ports' in l4c else None)
+      for l4c in l4_configs
+  ]
+
+
+def _compiled_l4_match(protocol: str, port: Optional[int],
+                       l4_configs: Iterable[_CompiledL4Config]) -> Optional[str]:
+  """Same as _vpc_allow_deny_match(), but for compiled l4 configurations."""
+  for l4c in l4_configs:
+    if l4c.protocol not in (protocol, 'all'):
+      continue
+    if l4c.ports is None:
+      return l4c.action
+    if port is not None and _port_in_compiled_ranges(port, l4c.ports):
+      return l4c.action
+  return None
+
+
 @dataclasses.dataclass
 class FirewallCheckResult:
   """The result of a firewall connectivity check."""
@@ -570,6 +633,33 @@ class FirewallCheckResult:
       return f'vpc firewall rule: {self.vpc_firewall_rule_name}'
 
 
+@dataclasses.dataclass(frozen=True)
+class FirewallCheckQuery:
+  """A connection to check with EffectiveFirewalls.check_connectivity_*_batch().
+
+  The fields have the same meaning as the arguments of
+  EffectiveFirewalls.check_connectivity_ingress(). Queries are hashable, so
+  that duplicated queries in a batch are only evaluated once."""
+
+  src_ip: IPAddrOrNet
+  ip_protocol: str
+  port: Optional[int] = None
+  source_service_account: Optional[str] = None
+  source_tags: Optional[Sequence[str]] = None
+  target_service_account: Optional[str] = None
+  target_tags: Optional[Sequence[str]] = None
+
+  def __post_init__(self):
+    for field in ['source_tags', 'target_tags']:
+      tags = getattr(self, field)
+      if tags is None:
+        continue
+      if not isinstance(tags, (list, tuple)):
+        raise ValueError(f'Internal error: {field} must be a list')
+      # frozen dataclass: use object.__setattr__ to store the tags as a tuple.
+      object.__setattr__(self, field, tuple(tags))
+
+
 class FirewallRuleNotFoundError(Exception):
   rule_name: str
 
@@ -606,6 +696,274 @@ class VpcFirewallRule:
     return not self._resource_data['disabled']
 
 
+class _RulesBitsIndex:
+  """Inverted index from a key (e.g. a tag) to a set of rules.
+
+  Sets of rules are represented as int bitsets, where bit i is set for the
+  i-th rule in priority order."""
+
+  def __init__(self):
+    self._bits: Dict[Any, int] = {}
+
+  def add(self, key: Any, rule_bit: int):
+    self._bits[key] = self._bits.get(key, 0) | rule_bit
+
+  def get(self, keys: Iterable[Any]) -> int:
+    bits = 0
+    for key in keys:
+      bits |= self._bits.get(key, 0)
+    return bits
+
+
+class _RulesCidrIndex:
+  """Index of rules by IP network.
+
+  This is a binary trie of the rule networks, flattened by prefix length: the
+  networks containing an address or network are found with one dict lookup per
+  prefix length used by the rules, and the networks contained in a network with
+  a binary search in the sorted network addresses."""
+
+  def __init__(self):
+    # (ip version, prefix length) -> {network address >> host bits: rules}
+    self._networks: Dict[Tuple[int, int], Dict[int, int]] = {}
+    # ip version -> sorted network addresses, and rules with these addresses
+    self._addresses: Dict[int, List[int]] = {}
+    self._addresses_bits: Dict[int, List[int]] = {}
+
+  def add(self, net: IPv4NetOrIPv6Net, rule_bit: int):
+    host_bits = net.max_prefixlen - net.prefixlen
+    networks = self._networks.setdefault((net.version, net.prefixlen), {})
+    key = int(net.network_address) >> host_bits
+    networks[key] = networks.get(key, 0) | rule_bit
+
+    addresses = self._addresses.setdefault(net.version, [])
+    addresses_bits = self._addresses_bits.setdefault(net.version, [])
+    address = int(net.network_address)
+    i = bisect.bisect_left(addresses, address)
+    if i < len(addresses) and addresses[i] == address:
+      addresses_bits[i] |= rule_bit
+    else:
+      addresses.insert(i, address)
+      addresses_bits.insert(i, rule_bit)
+
+  def get(self, ip: IPAddrOrNet) -> int:
+    """Return the rules with a network overlapping with ip (an address or a
+    network)."""
+    if isinstance(ip, (ipaddress.IPv4Address, ipaddress.IPv6Address)):
+      ip = ipaddress.ip_network(ip)
+    bits = 0
+    first = int(ip.network_address)
+    # networks containing ip
+    for (version, prefixlen), networks in self._networks.items():
+      if version == ip.version and prefixlen <= ip.prefixlen:
+        bits |= networks.get(first >> (ip.max_prefixlen - prefixlen), 0)
+    # networks contained in ip
+    if ip.prefixlen < ip.max_prefixlen and ip.version in self._addresses:
+      addresses = self._addresses[ip.version]
+      last = int(ip.broadcast_address)
+      for i in range(bisect.bisect_left(addresses, first),
+                     bisect.bisect_right(addresses, last)):
+        bits |= self._addresses_bits[ip.version][i]
+    return bits
+
+
+@dataclasses.dataclass
+class _CompiledFirewallRule:
+  rule: Dict[str, Any]
+  l4_configs: List[_CompiledL4Config]
+
+
+class _FirewallRulesIndex(abc.ABC):
+  """Firewall rules of one direction, compiled to quickly find the rules
+  matching a connection.
+
+  The rules that can match a connection are the intersection of the rules
+  matching its protocol, IP address, service accounts and tags (see
+  candidates()). Only these candidates are then verified with the exact
+  matching logic (see match()), in priority order.
+  """
+
+  def __init__(self, rules: Iterable[Dict[str, Any]], direction: str):
+    self.direction = direction
+    self.rules: List[_CompiledFirewallRule] = []
+    self.protocols = _RulesBitsIndex()
+    self.ranges = _RulesCidrIndex()
+    self.target_service_accounts = _RulesBitsIndex()
+    # rules without target service accounts (i.e. matching any)
+    self.any_target_service_account = 0
+    for rule in rules:
+      self.add(rule)
+
+  @abc.abstractmethod
+  def add(self, rule: Dict[str, Any]):
+    """Compile a rule and add it to the index."""
+
+  def _add_rule(self, rule: Dict[str, Any], l4_configs: List[_CompiledL4Config],
+                ranges: Iterable[IPv4NetOrIPv6Net],
+                target_service_accounts: Optional[Iterable[str]]) -> int:
+    rule_bit = 1 << len(self.rules)
+    self.rules.append(_CompiledFirewallRule(rule, l4_configs))
+    for l4c in l4_configs:
+      self.protocols.add(l4c.protocol, rule_bit)
+    for net in ranges:
+      self.ranges.add(net, rule_bit)
+    if target_service_accounts is None:
+      self.any_target_service_account |= rule_bit
+    else:
+      for sa in target_service_accounts:
+        self.target_service_accounts.add(sa, rule_bit)
+    return rule_bit
+
+  def _target_service_account_candidates(self, query: FirewallCheckQuery):
+    bits = self.any_target_service_account
+    if query.target_service_account:
+      bits |= self.target_service_accounts.get([query.target_service_account])
+    return bits
+
+  @abc.abstractmethod
+  def candidates(self, query: FirewallCheckQuery) -> int:
+    """Return the bits of the rules that can match query."""
+
+  @abc.abstractmethod
+  def match(self, compiled_rule: _CompiledFirewallRule,
+            query: FirewallCheckQuery) -> Optional[str]:
+    """Return the action of a candidate rule if it matches query."""
+
+  def first_match(
+      self, query: FirewallCheckQuery
+  ) -> Optional[Tuple[Dict[str, Any], str]]:
+    """Return the first rule matching query, and its action."""
+    bits = self.candidates(query)
+    while bits:
+      lowest_bit = bits & -bits
+      bits ^= lowest_bit
+      compiled_rule = self.rules[lowest_bit.bit_length() - 1]
+      action = self.match(compiled_rule, query)
+      if action:
+        return compiled_rule.rule, action
+    return None
+
+
+class _FirewallPolicyRulesIndex(_FirewallRulesIndex):
+  """Compiled rules of a firewall policy (see _FirewallPolicy)."""
+
+  def _ranges_key(self):
+    return 'srcIpRanges' if self.direction == 'INGRESS' else 'destIpRanges'
+
+  def add(self, rule: Dict[str, Any]):
+    match = rule.get('match', {})
+    if rule.get('disabled'):
+      return
+    # Do not evaluate automatically created egress rules
+    if self.direction == 'EGRESS' and not match.get('destIpRanges'):
+      return
+    self._add_rule(
+        rule,
+        _compile_l4_configs(rule['action'], 'ipProtocol',
+                            match.get('layer4Configs', [])),
+        match.get(self._ranges_key(), []), rule.get('targetServiceAccounts'))
+
+  def candidates(self, query: FirewallCheckQuery) -> int:
+    bits = self.ranges.get(query.src_ip)
+    # protocols are only verified for connections with a port
+    if query.port is not None:
+      bits &= self.protocols.get([query.ip_protocol, 'all'])
+    return bits & self._target_service_account_candidates(query)
+
+  def match(self, compiled_rule: _CompiledFirewallRule,
+            query: FirewallCheckQuery) -> Optional[str]:
+    rule = compiled_rule.rule
+    ip_match_type = 'deny' if rule['action'] == 'deny' else 'allow'
+    if not _ip_match(query.src_ip, rule['match'][self._ranges_key()],
+                     ip_match_type):
+      return None
+    if query.port is not None and not _compiled_l4_match(
+        query.ip_protocol, query.port, compiled_rule.l4_configs):
+      return None
+    if 'targetServiceAccounts' in rule:
+      if query.target_service_account not in rule['targetServiceAccounts']:
+        return None
+    return rule['action']
+
+
+class _VpcFirewallRulesIndex(_FirewallRulesIndex):
+  """Compiled VPC firewall rules (see _VpcFirewall)."""
+
+  def __init__(self, rules: Iterable[Dict[str, Any]], direction: str):
+    self.source_service_accounts = _RulesBitsIndex()
+    self.source_tags = _RulesBitsIndex()
+    self.target_tags = _RulesBitsIndex()
+    # rules without target tags (i.e. matching any)
+    self.any_target_tag = 0
+    super().__init__(rules, direction)
+
+  def _ranges_key(self):
+    return 'sourceRanges' if self.direction == 'INGRESS' else 'destinationRanges'
+
+  def add(self, rule: Dict[str, Any]):
+    if rule.get('disabled'):
+      return
+    l4_configs = _compile_l4_configs('allow', 'IPProtocol', rule.get(
+        'allowed', [])) + _compile_l4_configs('deny', 'IPProtocol',
+                                              rule.get('denied', []))
+    rule_bit = self._add_rule(rule, l4_configs,
+                              rule.get(self._ranges_key(), []),
+                              rule.get('targetServiceAccounts'))
+    for sa in rule.get('sourceServiceAccounts', []):
+      self.source_service_accounts.add(sa, rule_bit)
+    for tag in rule.get('sourceTags', []):
+      self.source_tags.add(tag, rule_bit)
+    if 'targetTags' in rule:
+      for tag in rule['targetTags']:
+        self.target_tags.add(tag, rule_bit)
+    else:
+      self.any_target_tag |= rule_bit
+
+  def candidates(self, query: FirewallCheckQuery) -> int:
+    bits = self.protocols.get([query.ip_protocol, 'all'])
+    source_bits = self.ranges.get(query.src_ip)
+    if query.source_service_account:
+      source_bits |= self.source_service_accounts.get(
+          [query.source_service_account])
+    if query.source_tags:
+      source_bits |= self.source_tags.get(query.source_tags)
+    bits &= source_bits
+    bits &= self._target_service_account_candidates(query)
+    target_tags_bits = self.any_target_tag
+    if query.target_tags:
+      target_tags_bits |= self.target_tags.get(query.target_tags)
+    return bits & target_tags_bits
+
+  def match(self, compiled_rule: _CompiledFirewallRule,
+            query: FirewallCheckQuery) -> Optional[str]:
+    rule = compiled_rule.rule
+    action = _compiled_l4_match(query.ip_protocol, query.port,
+                                compiled_rule.l4_configs)
+    if not action:
+      return None
+    # source
+    if self._ranges_key() in rule and \
+        _ip_match(query.src_ip, rule[self._ranges_key()], action):
+      pass
+    elif query.source_service_account and \
+        query.source_service_account in rule.get('sourceServiceAccounts', {}):
+      pass
+    elif query.source_tags and \
+        set(query.source_tags) & rule.get('sourceTags', set()):
+      pass
+    else:
+      return None
+    # target
+    if 'targetServiceAccounts' in rule:
+      if query.target_service_account not in rule['targetServiceAccounts']:
+        return None
+    if 'targetTags' in rule:
+      if not query.target_tags or \
+          not set(query.target_tags) & rule['targetTags']:
+        return None
+    return action
+
+
 class _FirewallPolicy:
   """Represents a org/folder firewall policy."""
 
@@ -635,6 +993,36 @@ class _FirewallPolicy:
             [ipaddress.ip_network(net) for net in rule['match']['destIpRanges']]
       self._rules[rule['direction']].append(rule_decoded)
 
+  @functools.cached_property
+  def _rules_index(self) -> Dict[str, _FirewallPolicyRulesIndex]:
+    return {
+        direction: _FirewallPolicyRulesIndex(rules, direction)
+        for direction, rules in self._rules.items()
+    }
+
+  def check_connectivity(self, direction: str,
+                         query: FirewallCheckQuery) -> FirewallCheckResult:
+    """Same as check_connectivity_ingress() and check_connectivity_egress(),
+    but using the compiled rules."""
+    match = self._rules_index[direction].first_match(query)
+    if not match:
+      # It should never happen that no rule match, because there should
+      # be a low-priority 'goto_next' rule.
+      if direction == 'INGRESS':
+        logging.warning('unexpected no-match in firewall policy %s',
+                        self.short_name)
+      else:
+        logging.debug('unexpected no-match in firewall policy %s',
+                      self.short_name)
+      return FirewallCheckResult('goto_next')
+    rule, action = match
+    logging.debug('policy %s: %s -> %s/%s = %s', self.short_name, query.src_ip,
+                  query.port, query.ip_protocol, action)
+    return FirewallCheckResult(
+        action,
+        firewall_policy_name=self.short_name,
+        firewall_policy_rule_description=rule['description'])
+
   def check_connectivity_ingress(
       self,  #
       *,
@@ -755,6 +1143,31 @@ class _VpcFirewall:
         r_decoded['targetTags'] = set(r['targetTags'])
       self._rules[r['direction']].append(r_decoded)
 
+  @functools.cached_property
+  def _rules_index(self) -> Dict[str, _VpcFirewallRulesIndex]:
+    return {
+        direction: _VpcFirewallRulesIndex(rules, direction)
+        for direction, rules in self._rules.items()
+    }
+
+  def check_connectivity(self, direction: str,
+                         query: FirewallCheckQuery) -> FirewallCheckResult:
+    """Same as check_connectivity_ingress() and check_connectivity_egress(),
+    but using the compiled rules."""
+    match = self._rules_index[direction].first_match(query)
+    if not match:
+      # implied deny ingress, implied allow egress
+      action = 'deny' if direction == 'INGRESS' else 'allow'
+      logging.debug('vpc firewall: %s -> %s/%s = %s (implied rule)',
+                    query.src_ip, query.port, query.ip_protocol, action)
+      return FirewallCheckResult(action)
+    rule, action = match
+    logging.debug('vpc firewall: %s -> %s/%s = %s (%s)', query.src_ip,
+                  query.port, query.ip_protocol, action, rule['name'])
+    return FirewallCheckResult(action,
+                               vpc_firewall_rule_id=rule['id'],
+                               vpc_firewall_rule_name=rule['name'])
+
   def check_connectivity_ingress(
       self,
       *,
@@ -958,7 +1371,11 @@ class _VpcFirewall:
 class EffectiveFirewalls:
   """Effective firewall rules for a VPC network or Instance.
 
-  Includes org/folder firewall policies)."""
+  Includes org/folder firewall policies).
+
+  The rules are compiled to indexes the first time that connectivity is
+  checked, so that the checks don't need to scan all the rules. Use the
+  check_connectivity_*_batch() methods to check many connections at once."""
   _resource_data: dict
   _policies: List[_FirewallPolicy]
   _vpc_firewall: _VpcFirewall
@@ -971,6 +1388,65 @@ class EffectiveFirewalls:
         self._policies.append(_FirewallPolicy(policy))
     self._vpc_firewall = _VpcFirewall(resource_data.get('firewalls', {}))
 
+  def _check_connectivity(self, direction: str, query: FirewallCheckQuery,
+                          use_index: bool) -> FirewallCheckResult:
+    if query.ip_protocol != 'ICMP' and query.port is None:
+      raise ValueError('TCP and UDP must have port numbers')
+
+    if not use_index:
+      return self._scan_connectivity(direction, query)
+
+    # Firewall policies (organization, folders)
+    for p in self._policies:
+      result = p.check_connectivity(direction, query)
+      if result.action != 'goto_next':
+        return result
+
+    # VPC firewall rules
+    return self._vpc_firewall.check_connectivity(direction, query)
+
+  def _scan_connectivity(self, direction: str,
+                         query: FirewallCheckQuery) -> FirewallCheckResult:
+    """Check connectivity by evaluating all the rules one after the other."""
+    source_tags = list(
+        query.source_tags) if query.source_tags is not None else None
+    target_tags = list(
+        query.target_tags) if query.target_tags is not None else None
+
+    # Firewall policies (organization, folders)
+    for p in self._policies:
+      check_policy = p.check_connectivity_ingress if direction == 'INGRESS' \
+          else p.check_connectivity_egress
+      result = check_policy(
+          src_ip=query.src_ip,
+          ip_protocol=query.ip_protocol,
+          port=query.port,
+          #target_network=self._network,
+          target_service_account=query.target_service_account)
+      if result.action != 'goto_next':
+        return result
+
+    # VPC firewall rules
+    check_vpc = self._vpc_firewall.check_connectivity_ingress \
+        if direction == 'INGRESS' \
+        else self._vpc_firewall.check_connectivity_egress
+    return check_vpc(src_ip=query.src_ip,
+                     ip_protocol=query.ip_protocol,
+                     port=query.port,
+                     source_service_account=query.source_service_account,
+                     source_tags=source_tags,
+                     target_service_account=query.target_service_account,
+                     target_tags=target_tags)
+
+  def _check_connectivity_batch(
+      self, direction: str, queries: Iterable[FirewallCheckQuery],
+      use_index: bool) -> List[FirewallCheckResult]:
+    results: Dict[FirewallCheckQuery, FirewallCheckResult] = {}
+    for query in queries:
+      if query not in results:
+        results[query] = self._check_connectivity(direction, query, use_index)
+    return [results[query] for query in queries]
+
   def check_connectivity_ingress(
       self,  #
       *,
@@ -981,30 +1457,16 @@ class EffectiveFirewalls:
       source_tags: Optional[List[str]] = None,
       target_service_account: Optional[str] = None,
       target_tags: Optional[List[str]] = None) -> FirewallCheckResult:
-
-    if ip_protocol != 'ICMP' and port is None:
-      raise ValueError('TCP and UDP must have port numbers')
-
-    # Firewall policies (organization, folders)
-    for p in self._policies:
-      result = p.check_connectivity_ingress(
-          src_ip=src_ip,
-          ip_protocol=ip_protocol,
-          port=port,
-          #target_network=self._network,
-          target_service_account=target_service_account)
-      if result.action != 'goto_next':
-        return result
-
-    # VPC firewall rules
-    return self._vpc_firewall.check_connectivity_ingress(
-        src_ip=src_ip,
-        ip_protocol=ip_protocol,
-        port=port,
-        source_service_account=source_service_account,
-        source_tags=source_tags,
-        target_service_account=target_service_account,
-        target_tags=target_tags)
+    return self._check_connectivity(
+        'INGRESS',
+        FirewallCheckQuery(src_ip=src_ip,
+                           ip_protocol=ip_protocol,
+                           port=port,
+                           source_service_account=source_service_account,
+                           source_tags=source_tags,
+                           target_service_account=target_service_account,
+                           target_tags=target_tags),
+        use_index=True)
 
   def check_connectivity_egress(
       self,  #
@@ -1016,30 +1478,43 @@ class EffectiveFirewalls:
       source_tags: Optional[List[str]] = None,
       target_service_account: Optional[str] = None,
       target_tags: Optional[List[str]] = None) -> FirewallCheckResult:
+    return self._check_connectivity(
+        'EGRESS',
+        FirewallCheckQuery(src_ip=src_ip,
+                           ip_protocol=ip_protocol,
+                           port=port,
+                           source_service_account=source_service_account,
+                           source_tags=source_tags,
+                           target_service_account=target_service_account,
+                           target_tags=target_tags),
+        use_index=True)
+
+  def check_connectivity_ingress_batch(
+      self,
+      queries: Sequence[FirewallCheckQuery],
+      use_index: bool = True) -> List[FirewallCheckResult]:
+    """Check the ingress connectivity of many connections at once.
 
-    if ip_protocol != 'ICMP' and port is None:
-      raise ValueError('TCP and UDP must have port numbers')
+    Args:
+        queries (Sequence[FirewallCheckQuery]): connections to check.
+        use_index (bool, optional): use the compiled rules. If False, all the
+          rules are evaluated one after the other (this is slower and only
+          meant for testing). Defaults to True.
 
-    # Firewall policies (organization, folders)
-    for p in self._policies:
-      result = p.check_connectivity_egress(
-          src_ip=src_ip,
-          ip_protocol=ip_protocol,
-          port=port,
-          #target_network=self._network,
-          target_service_account=target_service_account)
-      if result.action != 'goto_next':
-        return result
+    Returns:
+        List[FirewallCheckResult]: the result of every query, in the same
+          order. Duplicated queries are evaluated only once.
+    """
+    return self._check_connectivity_batch('INGRESS', queries, use_index)
 
-    # VPC firewall rules
-    return self._vpc_firewall.check_connectivity_egress(
-        src_ip=src_ip,
-        ip_protocol=ip_protocol,
-        port=port,
-        source_service_account=source_service_account,
-        source_tags=source_tags,
-        target_service_account=target_service_account,
-        target_tags=target_tags)
+  def check_connectivity_egress_batch(
+      self,
+      queries: Sequence[FirewallCheckQuery],
+      use_index: bool = True) -> List[FirewallCheckResult]:
+    """Check the egress connectivity of many connections at once.
+
+    See check_connectivity_ingress_batch()."""
+    return self._check_connectivity_batch('EGRESS', queries, use_index)
 
   def get_vpc_ingress_rules(
       self,
@@ -1105,7 +1580,9 @@ class VPCEffectiveFirewalls(EffectiveFirewalls):
     self._network = network
 
 
-@caching.cached_api_call()
+# Kept in memory (and not copied from the cache at every call), so that the
+# compiled rules of EffectiveFirewalls are built only once.
+@caching.cached_api_call(in_memory=True)
 def _get_effective_firewalls(network: Network):
   compute = apis.get_api('compute', 'v1', network.project_id)
   request = compute.networks().getEffectiveFirewalls(project=network.project_id,
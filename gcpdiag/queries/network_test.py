@@ -17,6 +17,8 @@ import ipaddress
 import re
 from unittest import mock
 
+import pytest
+
 from gcpdiag.queries import apis_stub, network
 
 DUMMY_PROJECT_ID = 'gcpdiag-fw-policy-aaaa'
@@ -415,3 +417,89 @@ class TestNetwork:
 
       if address.name == 'address4':
         assert address.short_path == 'gcpdiag-vpc1-aaaa/address4'
+
+  def _firewall_queries(self):
+    ips = [
+        ipaddress.ip_address('10.0.0.1'),
+        ipaddress.ip_address('10.100.0.16'),
+        ipaddress.ip_address('10.102.0.1'),
+        ipaddress.ip_address('35.191.0.1'),
+        ipaddress.ip_address('2600:1901::1'),
+        ipaddress.ip_network('10.0.0.0/24'),
+        ipaddress.ip_network('10.0.0.0/8'),
+        ipaddress.ip_network('10.101.0.1/32'),
+        ipaddress.ip_network('10.100.0.16/29'),
+        ipaddress.ip_network('10.200.0.16/29'),
+        ipaddress.ip_network('0.0.0.0/0'),
+    ]
+    queries = []
+    for ip in ips:
+      for protocol, port in [('tcp', 21), ('tcp', 22), ('tcp', 1001), ('tcp', 1006),
+                             ('tcp', 2000), ('tcp', 2003), ('udp', 53),
+                             ('ICMP', None)]:
+        for tags in [None, ['foo'], ['bar', 'gke-gke1-8edbb9d4-node']]:
+          for sa in [None, DUMMY_SERVICE_ACCOUNT]:
+            queries.append(
+                network.FirewallCheckQuery(src_ip=ip,
+                                           ip_protocol=protocol,
+                                           port=port,
+                                           source_service_account=sa,
+                                           source_tags=tags,
+                                           target_service_account=sa,
+                                           target_tags=tags))
+    return queries
+
+  def test_batch_index_same_as_scan(self):
+    queries = self._firewall_queries()
+    for project_id in [DUMMY_PROJECT_ID, DUMMY_GCE_PROJECT_ID,
+                       DUMMY_GKE_PROJECT_ID]:
+      net = network.get_network(project_id=project_id,
+                                network_name=DUMMY_DEFAULT_NETWORK)
+      assert net.firewall.check_connectivity_ingress_batch(queries) == \
+          net.firewall.check_connectivity_ingress_batch(queries,
+                                                        use_index=False)
+      assert net.firewall.check_connectivity_egress_batch(queries) == \
+          net.firewall.check_connectivity_egress_batch(queries,
+                                                       use_index=False)
+
+  def test_batch(self):
+    net = network.get_network(project_id=DUMMY_PROJECT_ID,
+                              network_name=DUMMY_DEFAULT_NETWORK)
+    deny_query = network.FirewallCheckQuery(
+        src_ip=ipaddress.ip_address('10.0.0.1'), ip_protocol='tcp', port=21)
+    allow_query = network.FirewallCheckQuery(
+        src_ip=ipaddress.ip_network('10.100.0.16/29'),
+        ip_protocol='tcp',
+        port=1006)
+    results = net.firewall.check_connectivity_ingress_batch(
+        [deny_query, allow_query, deny_query])
+    assert [r.action for r in results] == ['deny', 'allow', 'deny']
+    assert results[1].matched_by_str == 'vpc firewall rule: fw-test-900'
+
+  def test_batch_missing_port(self):
+    net = network.get_network(project_id=DUMMY_PROJECT_ID,
+                              network_name=DUMMY_DEFAULT_NETWORK)
+    with pytest.raises(ValueError):
+      net.firewall.check_connectivity_ingress_batch([
+          network.FirewallCheckQuery(src_ip=ipaddress.ip_address('10.0.0.1'),
+                                     ip_protocol='tcp')
+      ])
+
+
+class TestRulesCidrIndex:
+  """Test network._RulesCidrIndex."""
+
+  def test_get(self):
+    # pylint: disable=protected-access
+    index = network._RulesCidrIndex()
+    index.add(ipaddress.ip_network('10.0.0.0/8'), 1)
+    index.add(ipaddress.ip_network('10.1.0.0/16'), 2)
+    index.add(ipaddress.ip_network('10.1.2.0/24'), 4)
+    index.add(ipaddress.ip_network('192.168.0.0/16'), 8)
+    index.add(ipaddress.ip_network('::/0'), 16)
+    assert index.get(ipaddress.ip_address('10.1.2.3')) == 1 | 2 | 4
+    assert index.get(ipaddress.ip_address('10.2.0.1')) == 1
+    assert index.get(ipaddress.ip_network('10.1.0.0/20')) == 1 | 2 | 4
+    assert index.get(ipaddress.ip_network('0.0.0.0/0')) == 1 | 2 | 4 | 8
+    assert index.get(ipaddress.ip_address('172.16.0.1')) == 0
+    assert index.get(ipaddress.ip_address('2600:1901::1')) == 16
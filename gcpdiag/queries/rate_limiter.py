@@ -0,0 +1,208 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Adaptive rate limiting of the API requests.
+
+Requests are limited with a token bucket per API and project. The rate of a
+bucket starts at the configured maximum. It is halved when the API returns a
+quota error (HTTP 429), and increased again progressively with every
+successful request (AIMD: additive increase, multiplicative decrease), so that
+concurrent requests stay close to the quota without causing retry storms.
+
+The buckets are shared by all the threads. Use get_rate_limiter() to get the
+RateLimiter of the process, and see apis_utils.execute() to execute requests
+with rate limiting. The statistics of the buckets (current rate, queueing
+delay) are printed with the cache statistics (--cache-stats).
+"""
+
+import threading
+import time
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from gcpdiag import config
+
+# Fraction of the maximum rate added to the rate after every successful
+# request.
+ADDITIVE_INCREASE_RATIO = 0.02
+# Factor applied to the rate after a quota error.
+MULTIPLICATIVE_DECREASE_FACTOR = 0.5
+# The rate is decreased at most once during this interval, so that many
+# concurrent requests failing at the same time decrease it only once.
+DECREASE_INTERVAL_SECONDS = 1.0
+
+
+class AdaptiveTokenBucket:
+  """Thread-safe token bucket with a rate adapted to the quota errors.
+
+  acquire() reserves a token and sleeps until it is available, so that
+  waiting requests are served in order.
+  """
+
+  def __init__(self,
+               max_rate: float,
+               burst: float,
+               min_rate: float,
+               clock: Callable[[], float] = time.monotonic,
+               sleep: Callable[[float], Any] = time.sleep):
+    self.max_rate = max_rate
+    self.min_rate = min(min_rate, max_rate)
+    self.burst = max(burst, 1)
+    self._clock = clock
+    self._sleep = sleep
+    self._lock = threading.Lock()
+    self._rate = max_rate
+    self._tokens = self.burst
+    self._last_refill = clock()
+    # no token is available before this time (Retry-After)
+    self._not_before = 0.0
+    self._last_decrease = float('-inf')
+    # statistics
+    self._requests = 0
+    self._throttled = 0
+    self._waiting = 0
+    self._total_delay = 0.0
+    self._max_delay = 0.0
+
+  @property
+  def rate(self) -> float:
+    """Current rate, in requests per second."""
+    return self._rate
+
+  def _refill(self, now: float):
+    self._tokens = min(self.burst,
+                       self._tokens + (now - self._last_refill) * self._rate)
+    self._last_refill = now
+
+  def acquire(self, count: int = 1) -> float:
+    """Wait until `count` requests can be done. Returns the time waited in
+    seconds.
+
+    The requests of a batch (see apis_utils.batch_execute_all()) are sent with
+    a single HTTP request: they are acquired at once, with a single wait until
+    a full burst of tokens is available. The tokens of the other requests of
+    the batch are charged after the wait, so the batch counts fully against
+    the rate, and the following requests wait for them.
+    """
+    with self._lock:
+      now = self._clock()
+      self._refill(now)
+      reserved = min(count, self.burst)
+      self._tokens -= reserved
+      delay = max(self._not_before - now, -self._tokens / self._rate, 0)
+      self._tokens -= count - reserved
+      self._requests += count
+      self._total_delay += delay
+      self._max_delay = max(self._max_delay, delay)
+      if delay > 0:
+        self._waiting += 1
+    if delay > 0:
+      try:
+        self._sleep(delay)
+      finally:
+        with self._lock:
+          self._waiting -= 1
+    return delay
+
+  def on_success(self):
+    with self._lock:
+      self._rate = min(self.max_rate,
+                       self._rate + self.max_rate * ADDITIVE_INCREASE_RATIO)
+
+  def on_throttled(self, retry_after: Optional[float] = None):
+    """Slow down after a quota error.
+
+    Args:
+      retry_after: number of seconds to wait before the next request, if
+        returned by the API (Retry-After header).
+    """
+    with self._lock:
+      now = self._clock()
+      self._throttled += 1
+      if retry_after:
+        self._not_before = max(self._not_before, now + retry_after)
+      if now - self._last_decrease < DECREASE_INTERVAL_SECONDS:
+        return
+      self._last_decrease = now
+      self._refill(now)
+      self._rate = max(self.min_rate,
+                       self._rate * MULTIPLICATIVE_DECREASE_FACTOR)
+      # don't let the remaining burst hit the quota again
+      self._tokens = min(self._tokens, 0)
+
+  def stats(self) -> Dict[str, Any]:
+    with self._lock:
+      return {
+          'rate': self._rate,
+          'max_rate': self.max_rate,
+          'requests': self._requests,
+          'throttled': self._throttled,
+          'waiting': self._waiting,
+          'avg_delay_seconds': (self._total_delay /
+                                self._requests) if self._requests else 0.0,
+          'max_delay_seconds': self._max_delay,
+      }
+
+
+def _limits(service: str) -> Tuple[float, float]:
+  """Return the maximum rate and burst of the requests to an API."""
+  if service == 'logging':
+    requests = config.get('logging_ratelimit_requests')
+    return requests / config.get('logging_ratelimit_period_seconds'), requests
+  return config.API_RATELIMIT_REQUESTS_PER_SECOND, config.API_RATELIMIT_BURST
+
+
+class RateLimiter:
+  """Token buckets for every API (e.g. 'logging') and project.
+
+  The limits of a bucket are read from the configuration when it is created,
+  i.e. with the first request to the API for a project, so that the command
+  line arguments and per-project configuration are taken into account.
+  """
+
+  def __init__(self,
+               clock: Callable[[], float] = time.monotonic,
+               sleep: Callable[[float], Any] = time.sleep):
+    self._clock = clock
+    self._sleep = sleep
+    self._lock = threading.Lock()
+    self._buckets: Dict[Tuple[str, str], AdaptiveTokenBucket] = {}
+
+  def get_bucket(self, service: str, project_id: str) -> AdaptiveTokenBucket:
+    with self._lock:
+      bucket = self._buckets.get((service, project_id))
+      if not bucket:
+        max_rate, burst = _limits(service)
+        bucket = AdaptiveTokenBucket(
+            max_rate=max_rate,
+            burst=burst,
+            min_rate=config.API_RATELIMIT_MIN_REQUESTS_PER_SECOND,
+            clock=self._clock,
+            sleep=self._sleep)
+        self._buckets[(service, project_id)] = bucket
+      return bucket
+
+  def stats(self) -> Dict[str, Dict[str, Any]]:
+    """Return the statistics of every bucket, by 'service/project'."""
+    with self._lock:
+      buckets = sorted(self._buckets.items())
+    return {
+        f'{service}/{project_id}': bucket.stats()
+        for (service, project_id), bucket in buckets
+    }
+
+
+_rate_limiter = RateLimiter()
+
+
+def get_rate_limiter() -> RateLimiter:
+  return _rate_limiter
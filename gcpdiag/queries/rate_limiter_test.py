@@ -0,0 +1,134 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Test code in rate_limiter.py."""
+
+from unittest import mock
+
+import pytest
+
+from gcpdiag import config
+from gcpdiag.queries import rate_limiter
+
+
+class FakeClock:
+  """Clock advanced by the sleep() calls."""
+
+  def __init__(self):
+    self.now = 1000.0
+    self.slept = []
+
+  def __call__(self):
+    return self.now
+
+  def sleep(self, seconds):
+    self.slept.append(seconds)
+    self.now += seconds
+
+
+def make_bucket(clock, max_rate=10, burst=2, min_rate=1):
+  return rate_limiter.AdaptiveTokenBucket(max_rate=max_rate,
+                                          burst=burst,
+                                          min_rate=min_rate,
+                                          clock=clock,
+                                          sleep=clock.sleep)
+
+
+class TestAdaptiveTokenBucket:
+  """Test rate_limiter.AdaptiveTokenBucket."""
+
+  def test_acquire(self):
+    clock = FakeClock()
+    bucket = make_bucket(clock)
+    # burst
+    assert bucket.acquire() == 0
+    assert bucket.acquire() == 0
+    # then 10 requests per second
+    assert bucket.acquire() == pytest.approx(0.1)
+    assert bucket.acquire() == pytest.approx(0.1)
+    assert clock.slept == pytest.approx([0.1, 0.1])
+    assert bucket.stats()['requests'] == 4
+
+  def test_acquire_batch(self):
+    clock = FakeClock()
+    bucket = make_bucket(clock, burst=10)
+    assert bucket.acquire(5) == 0
+    # a batch waits once, for at most a full burst
+    assert bucket.acquire(1000) == pytest.approx(0.5)
+    # but all its requests are charged: the next requests wait for them
+    assert bucket.acquire(1000) == pytest.approx(100.0)
+    assert bucket.acquire() == pytest.approx(99.1)
+    assert clock.slept == pytest.approx([0.5, 100.0, 99.1])
+    assert bucket.stats()['requests'] == 2006
+
+  def test_throttled(self):
+    clock = FakeClock()
+    bucket = make_bucket(clock)
+    bucket.on_throttled()
+    assert bucket.rate == 5
+    # concurrent errors decrease the rate only once
+    bucket.on_throttled()
+    assert bucket.rate == 5
+    assert bucket.acquire() == pytest.approx(0.2)
+    clock.now += rate_limiter.DECREASE_INTERVAL_SECONDS
+    bucket.on_throttled()
+    assert bucket.rate == 2.5
+    assert bucket.stats()['throttled'] == 3
+
+  def test_min_rate(self):
+    clock = FakeClock()
+    bucket = make_bucket(clock, min_rate=4)
+    for _ in range(3):
+      bucket.on_throttled()
+      clock.now += rate_limiter.DECREASE_INTERVAL_SECONDS
+    assert bucket.rate == 4
+
+  def test_retry_after(self):
+    clock = FakeClock()
+    bucket = make_bucket(clock, burst=10)
+    bucket.on_throttled(retry_after=5)
+    assert bucket.acquire() == 5
+
+  def test_additive_increase(self):
+    clock = FakeClock()
+    bucket = make_bucket(clock)
+    bucket.on_throttled()
+    for _ in range(10):
+      bucket.on_success()
+    assert bucket.rate == pytest.approx(5 + 10 * 10 *
+                                        rate_limiter.ADDITIVE_INCREASE_RATIO)
+    for _ in range(100):
+      bucket.on_success()
+    assert bucket.rate == 10
+
+
+class TestRateLimiter:
+  """Test rate_limiter.RateLimiter."""
+
+  def test_buckets(self):
+    limiter = rate_limiter.RateLimiter()
+    bucket = limiter.get_bucket('compute', 'p1')
+    assert limiter.get_bucket('compute', 'p1') is bucket
+    assert limiter.get_bucket('compute', 'p2') is not bucket
+    assert bucket.max_rate == config.API_RATELIMIT_REQUESTS_PER_SECOND
+    assert list(limiter.stats()) == ['compute/p1', 'compute/p2']
+
+  def test_logging_config(self):
+    limiter = rate_limiter.RateLimiter()
+    with mock.patch.object(config, 'get', {
+        'logging_ratelimit_requests': 120,
+        'logging_ratelimit_period_seconds': 60,
+    }.get):
+      bucket = limiter.get_bucket('logging', 'p1')
+    assert bucket.max_rate == 2
+    assert bucket.burst == 120
@@ -15,19 +15,22 @@
 
 import ast
 import builtins
+import concurrent.futures
+import contextvars
 import difflib
 import inspect
 import logging
 import os
 import re
-import sys
 import textwrap
+import threading
+import time
 import types
 from abc import abstractmethod
 from collections import OrderedDict
 from datetime import datetime, timedelta, timezone
 from enum import Enum
-from functools import cached_property
+from functools import cached_property, lru_cache
 from string import Formatter
 from typing import (Callable, Deque, Dict, List, Mapping, Optional, Set, Tuple,
                     final)
@@ -35,12 +38,20 @@ from typing import (Callable, Deque, Dict, List, Mapping, Optional, Set, Tuple,
 import googleapiclient.errors
 from jinja2 import TemplateNotFound
 
-from gcpdiag import caching, config, models, utils
+from gcpdiag import caching, config, executor, models, utils
 from gcpdiag.queries import crm
+from gcpdiag.queries import logs as logs_q
 from gcpdiag.runbook import constants, exceptions, flags, op, report, util
 
 RunbookRegistry: Dict[str, 'DiagnosticTree'] = {}
 StepRegistry: Dict[str, 'Step'] = {}
+# All Step classes, including the base classes, by class name.
+_steps_by_name: Dict[str, 'MetaStep'] = {}
+
+# Whether the investigation of the runbook executed in the current context is
+# finalized (see DiagnosticEngine.finalize).
+_finalize: contextvars.ContextVar[bool] = contextvars.ContextVar('finalize',
+                                                                 default=False)
 
 
 class MetaStep(type):
@@ -54,6 +65,7 @@ class MetaStep(type):
   def __new__(mcs, name, bases, namespace):
     """Register all steps into StepRegistry exluding base classes"""
     new_class = super().__new__(mcs, name, bases, namespace)
+    _steps_by_name[name] = new_class
     if name not in ('Step', 'Gateway', 'LintWrapper', 'StartStep', 'EndStep',
                     'CompositeStep') and bases[0] == Step:
       StepRegistry[new_class.id] = new_class
@@ -129,6 +141,17 @@ class Step(metaclass=MetaStep):
     """Executes the main diagnostic log for this step."""
     pass
 
+  def prefetch(self):
+    """Fetches the data needed by execute() in advance, to warm the caches.
+
+    Called concurrently for all the steps of the diagnostic tree as soon as
+    the parameters are validated, in the context of the runbook operator, so
+    op.get() can be used. There is no current step: results must not be
+    reported and the user must not be prompted. Errors are ignored, since
+    execute() does the same queries again.
+    """
+    pass
+
   def set_observations(self, prompt: models.Messages = None):
     # override existing messages
     if prompt:
@@ -511,6 +534,100 @@ class DiagnosticTree(metaclass=RunbookRule):
     return f'https://gcpdiag.dev/runbook/diagnostic-trees/{self.name}'
 
 
+class StepPrefetcher:
+  """Executes the prefetch() of the steps of a diagnostic tree in parallel.
+
+  Steps wait for their own prefetch before being executed (see wait()), and
+  the time spent in the prefetches that overlapped with the execution of the
+  previous steps is logged at the end of the runbook (see log_stats()). The
+  prefetches of the steps that weren't reached are cancelled with close(), so
+  that they don't keep the workers of the executor busy after the runbook.
+  """
+
+  def __init__(self, name: str):
+    self.name = name
+    self._futures: Dict[str, concurrent.futures.Future] = {}
+    self._durations: Dict[str, float] = {}
+    self._reached: Set[str] = set()
+    self._waited = 0.0
+    self._cancelled = 0
+
+  def start(self, step: Step) -> None:
+    """Submit the prefetch of all the steps reachable from `step`.
+
+    Must be called in the context of the operator of the runbook, which is
+    inherited by the prefetch tasks."""
+    visited: Set[str] = set()
+    stack = [step]
+    while stack:
+      current = stack.pop()
+      if current.execution_id in visited:
+        continue
+      visited.add(current.execution_id)
+      stack.extend(reversed(current.steps))
+      # only submit the steps that implement prefetch()
+      if type(current).prefetch is Step.prefetch:
+        continue
+      self._futures[current.execution_id] = executor.get_executor().submit(
+          self._prefetch, current)
+
+  def _prefetch(self, step: Step) -> None:
+    thread = threading.current_thread()
+    thread.name = f'prefetch:{step.execution_id}'
+    start = time.monotonic()
+    try:
+      step.prefetch()
+    except Exception as err:  # pylint: disable=broad-exception-caught
+      logging.debug('%s: %s while prefetching step: %s',
+                    type(err).__name__, err, step.execution_id)
+    finally:
+      self._durations[step.execution_id] = time.monotonic() - start
+
+  def wait(self, step: Step) -> None:
+    """Wait until the prefetch of a step is done."""
+    future = self._futures.get(step.execution_id)
+    if not future or step.execution_id in self._reached:
+      return
+    self._reached.add(step.execution_id)
+    if not future.done():
+      logging.debug('waiting for prefetch results (%s)', step.execution_id)
+      start = time.monotonic()
+      future.result()
+      self._waited += time.monotonic() - start
+
+  def stats(self) -> Dict[str, float]:
+    """Return the prefetch statistics of the steps reached so far."""
+    prefetch_seconds = sum(
+        self._durations.get(id_, 0.0) for id_ in self._reached)
+    return {
+        'prefetched': len(self._futures),
+        'reached': len(self._reached),
+        'prefetch_seconds': prefetch_seconds,
+        'waited_seconds': self._waited,
+        'overlap_seconds': max(prefetch_seconds - self._waited, 0.0),
+        'cancelled': self._cancelled,
+    }
+
+  def close(self) -> None:
+    """Cancel the prefetches of the steps that weren't reached, e.g. when the
+    runbook was finalized early. Prefetches that are already running can't be
+    cancelled, and finish in the background."""
+    for execution_id, future in self._futures.items():
+      if execution_id not in self._reached and future.cancel():
+        self._cancelled += 1
+
+  def log_stats(self) -> None:
+    if not self._futures:
+      return
+    stats = self.stats()
+    logging.info(
+        'runbook %s: prefetched %d steps, %d reached, %d cancelled: %.2fs of '
+        'queries, %.2fs waited, %.2fs overlapped', self.name,
+        stats['prefetched'], stats['reached'], stats['cancelled'],
+        stats['prefetch_seconds'], stats['waited_seconds'],
+        stats['overlap_seconds'])
+
+
 class Bundle:
   run_id: str
   steps: List[Step]
@@ -540,6 +657,18 @@ class DiagnosticEngine:
     # tuple in the format (DiagnosticTree/Bundle, user_provided_parameter)
     self.task_queue: Deque = Deque()
 
+  @property
+  def finalize(self) -> bool:
+    """Whether the investigation of the current runbook is finalized.
+
+    The flag is kept per context, so that runbooks executed concurrently
+    don't stop each other."""
+    return _finalize.get()
+
+  @finalize.setter
+  def finalize(self, value: bool):
+    _finalize.set(value)
+
   def add_task(self, new_task: Tuple):
     self.task_queue.appendleft(new_task)
 
@@ -759,19 +888,49 @@ class DiagnosticEngine:
           user_provided_param):
         caller_args[k] = cast_to_type(user_provided_param, dt_param['type'])
 
-  def run(self):
-    """Execute tasks (runbooks or bundles) present in the engines task queue"""
+  def run(self, max_workers: Optional[int] = None):
+    """Execute tasks (runbooks or bundles) present in the engines task queue
+
+    With --auto, up to `max_workers` tasks (default: max_concurrent_runbooks
+    configuration) are executed at the same time, each one in its own context
+    with its own operator (see op.operator_context) and its own report in the
+    report manager (by run_id). Interactive runbooks are always executed one
+    at a time, because they prompt the user.
+    """
     if not self.task_queue:
       logging.error('No tasks to execute. Did you call add_task()?')
       return
 
-    for task in self.task_queue:
-      if isinstance(task[0], Bundle):
-        self.run_bundle(task[0])
-        continue
+    if max_workers is None:
+      max_workers = config.get('max_concurrent_runbooks')
+    max_workers = min(max(1, max_workers), len(self.task_queue))
+    if max_workers > 1 and not config.get(flags.INTERACTIVE_MODE):
+      logging.debug('interactive mode: executing runbooks one at a time')
+      max_workers = 1
 
-      if isinstance(task[0], DiagnosticTree):
-        self.run_diagnostic_tree(tree=task[0], parameter=task[1])
+    if max_workers == 1:
+      for task in self.task_queue:
+        self.run_task(task)
+      return
+
+    with concurrent.futures.ThreadPoolExecutor(
+        max_workers=max_workers,
+        thread_name_prefix='gcpdiag-runbook') as pool:
+      futures = [
+          pool.submit(contextvars.copy_context().run, self.run_task, task)
+          for task in self.task_queue
+      ]
+      for future in futures:
+        future.result()
+
+  def run_task(self, task: Tuple) -> None:
+    """Execute a task (runbook or bundle) of the task queue"""
+    if isinstance(task[0], Bundle):
+      self.run_bundle(task[0])
+      return
+
+    if isinstance(task[0], DiagnosticTree):
+      self.run_diagnostic_tree(tree=task[0], parameter=task[1])
 
   def run_diagnostic_tree(self, tree: DiagnosticTree,
                           parameter: models.Parameter) -> None:
@@ -795,13 +954,24 @@ class DiagnosticEngine:
           timezone.utc).isoformat()
       if operator.tree:
         self.interface.rm.reports[tree.run_id].runbook_name = operator.tree.name
-      with op.operator_context(operator):
-        self.process_parameters(runbook=tree, caller_args=parameter)
-        tree.hook_build_tree()
-      self.finalize = False
-      self.find_path_dfs(step=tree.start,
-                         operator=operator,
-                         executed_steps=set())
+      prefetcher = StepPrefetcher(tree.name)
+      # log queries registered while the tree is built are executed together
+      with logs_q.realtime_query_batch(
+          logs_q.RealtimeQueryBatch()) as log_queries:
+        with op.operator_context(operator):
+          self.process_parameters(runbook=tree, caller_args=parameter)
+          tree.hook_build_tree()
+          log_queries.execute(executor.get_executor())
+          prefetcher.start(tree.start)
+        self.finalize = False
+        try:
+          self.find_path_dfs(step=tree.start,
+                             operator=operator,
+                             executed_steps=set(),
+                             prefetcher=prefetcher)
+        finally:
+          prefetcher.close()
+        prefetcher.log_stats()
 
     except (RuntimeError, exceptions.InvalidDiagnosticTree) as err:
       logging.warning('%s: %s while processing runbook rule: %s',
@@ -809,16 +979,22 @@ class DiagnosticEngine:
     self.interface.rm.reports[tree.run_id].run_end_time = datetime.now(
         timezone.utc).isoformat()
 
-  def find_path_dfs(self, step: Step, operator: op.Operator,
-                    executed_steps: Set):
+  def find_path_dfs(self,
+                    step: Step,
+                    operator: op.Operator,
+                    executed_steps: Set,
+                    prefetcher: Optional[StepPrefetcher] = None):
     """Depth-first search to traverse and execute steps in the diagnostic tree.
 
     Args:
       step: The current step to execute.
       operator: The operator used duing execution.
       executed_steps: A set of executed step IDs to avoid cycles.
+      prefetcher: Prefetch of the steps of the tree, if started.
     """
     if not self.finalize:
+      if prefetcher:
+        prefetcher.wait(step)
       operator.set_step(step)
       with op.operator_context(operator):
         outcome = self.run_step(step=step, operator=operator)
@@ -830,7 +1006,8 @@ class DiagnosticEngine:
         if child not in executed_steps:
           self.find_path_dfs(step=child,
                              operator=operator,
-                             executed_steps=executed_steps)
+                             executed_steps=executed_steps,
+                             prefetcher=prefetcher)
       return executed_steps
 
   def run_step(self, step: Step, operator: op.Operator):
@@ -1007,13 +1184,15 @@ class ExpandTreeFromAst(ast.NodeVisitor):
                   ast.Attribute) and node.func.attr in ('add_child', 'add_step',
                                                         'add_start', 'add_end'):
       child = None
+      # the nodes are cached (see _parse_source) and must not be modified
+      keywords = list(node.keywords)
       if len(node.args) == 1:
-        node.keywords.append(ast.keyword('step', node.args[0]))
+        keywords.append(ast.keyword('step', node.args[0]))
       if len(node.args) == 2:
-        node.keywords.append(ast.keyword('parent', node.args[0]))
-        node.keywords.append(ast.keyword('child', node.args[1]))
-      if node.keywords:
-        for kw in node.keywords:
+        keywords.append(ast.keyword('parent', node.args[0]))
+        keywords.append(ast.keyword('child', node.args[1]))
+      if keywords:
+        for kw in keywords:
           arg_name = kw.arg
           step = kw.value
           if arg_name == 'parent':
@@ -1076,12 +1255,47 @@ class ExpandTreeFromAst(ast.NodeVisitor):
     self.current_class = None
 
   def visit_ast_nodes(self, func):
-    source_code = inspect.getsource(func)
-    tree = ast.parse(textwrap.dedent(source_code))
-    self.generic_visit(tree)
+    self.generic_visit(_parse_source(getattr(func, '__func__', func)))
     return self.tree
 
 
+@lru_cache(maxsize=None)
+def _parse_module_definitions(filename: str) -> Dict[str, ast.AST]:
+  """Returns the class and function definitions of a source file, by
+  qualified name."""
+  with open(filename, encoding='utf-8') as f:
+    module = ast.parse(f.read(), filename)
+  definitions: Dict[str, ast.AST] = {}
+  nodes = [('', node) for node in module.body]
+  while nodes:
+    prefix, node = nodes.pop(0)
+    if isinstance(node, (ast.ClassDef, ast.FunctionDef, ast.AsyncFunctionDef)):
+      qualname = prefix + node.name
+      definitions.setdefault(qualname, node)
+      if isinstance(node, ast.ClassDef):
+        nodes.extend((qualname + '.', child) for child in node.body)
+  return definitions
+
+
+@lru_cache(maxsize=None)
+def _parse_source(obj) -> ast.Module:
+  """Returns the AST of the source code of a class or function.
+
+  The source file of a module is parsed once for all its classes (instead of
+  once per class with inspect.getsource()), and steps used in several trees or
+  several times in a tree are parsed once."""
+  try:
+    filename = inspect.getsourcefile(obj)
+  except TypeError:
+    filename = None
+  node = None
+  if filename:
+    node = _parse_module_definitions(filename).get(obj.__qualname__)
+  if node is None:
+    return ast.parse(textwrap.dedent(inspect.getsource(obj)))
+  return ast.Module(body=[node], type_ignores=[])
+
+
 def find_class_globally(class_name):
   try:
     if not isinstance(class_name, str) and isinstance(class_name, object):
@@ -1093,12 +1307,5 @@ def find_class_globally(class_name):
   if cls:
     return cls
 
-  # If not found, check each imported module
-  for _, module in sys.modules.items():
-    try:
-      cls = getattr(module, class_name, None)
-      if cls and inspect.isclass(cls) and issubclass(cls, Step):
-        return cls
-    except AttributeError:
-      continue
-  return None
+  # If not found, check the steps defined in all modules
+  return _steps_by_name.get(class_name)
@@ -14,6 +14,7 @@
 """gcpdiag runbook command."""
 
 import argparse
+import atexit
 import importlib
 import logging
 import os
@@ -25,7 +26,7 @@ from typing import List
 
 import yaml
 
-from gcpdiag import config, hooks, models, runbook
+from gcpdiag import caching, config, hooks, models, runbook
 from gcpdiag.queries import apis, kubectl
 from gcpdiag.runbook.exceptions import DiagnosticTreeNotFound
 from gcpdiag.runbook.output import api_output, base_output, terminal_output
@@ -203,6 +204,14 @@ def _init_runbook_args_parser():
                       type=str,
                       help='What interface as one of [cli, api] (default: cli)')
 
+  parser.add_argument(
+      '--max-concurrent-runbooks',
+      metavar='N',
+      type=int,
+      help=('How many runbooks or bundles are executed at the same time, with'
+            ' --auto (default:'
+            f" {config.get('max_concurrent_runbooks')})"))
+
   parser.add_argument('--universe-domain',
                       type=str,
                       default=config.get('universe_domain'),
@@ -213,6 +222,30 @@ def _init_runbook_args_parser():
                       default=config.get('reason'),
                       help='The reason for running gcpdiag')
 
+  parser.add_argument(
+      '--cache-stats',
+      metavar='FILE',
+      nargs='?',
+      const='-',
+      help=('Print API cache and rate limiting statistics as JSON at exit, or'
+            ' write them to FILE (default: not printed)'))
+
+  parser.add_argument(
+      '--record',
+      metavar='FILE',
+      help=('Record all the API requests and responses to FILE, to be used'
+            ' later with --replay'))
+
+  parser.add_argument(
+      '--replay',
+      metavar='FILE',
+      help=('Answer the API requests with the responses recorded in FILE'
+            ' (see --record), without network access'))
+
+  parser.add_argument('--api-endpoint',
+                      metavar='URL',
+                      help=argparse.SUPPRESS)
+
   return parser
 
 
@@ -320,6 +353,8 @@ def run_and_get_report(argv=None, credentials: str = None) -> dict:
 
   # Initialize configuration
   _init_config(args)
+  if args.interface == runbook.constants.CLI and config.get('cache_stats'):
+    atexit.register(caching.dump_cache_stats, config.get('cache_stats'))
 
   # Initialize Repository, and Tests.
 
@@ -363,6 +398,8 @@ def run_and_get_report(argv=None, credentials: str = None) -> dict:
     hooks.post_runbook_hook(metrics)
 
   if args.interface == runbook.constants.CLI:
+    if config.get('verbose'):
+      apis.log_http_connection_stats()
     output_.display_footer(dt_engine.interface.rm)
     # Clean up the kubeconfig file generated for gcpdiag
     kubectl.clean_up()
@@ -16,7 +16,7 @@
 import logging
 import math
 from datetime import datetime
-from typing import Any, List, Set
+from typing import Any, List, Optional, Set
 
 from boltons.iterutils import get_path
 
@@ -28,6 +28,14 @@ from gcpdiag.runbook.gce import constants, flags, util
 UTILIZATION_THRESHOLD = 0.95
 
 
+def _within_str() -> str:
+  """Returns the MQL `within` clause of the runbook start and end time."""
+  start_formatted_string = op.get(
+      flags.START_TIME).strftime('%Y/%m/%d %H:%M:%S')
+  end_formatted_string = op.get(flags.END_TIME).strftime('%Y/%m/%d %H:%M:%S')
+  return f'within d\'{start_formatted_string}\', d\'{end_formatted_string}\''
+
+
 class HighVmMemoryUtilization(runbook.Step):
   """Diagnoses high memory utilization issues in a Compute Engine VM.
 
@@ -45,37 +53,20 @@ class HighVmMemoryUtilization(runbook.Step):
 
   # Typcial Memory exhaustion logs in serial console.
 
-  def execute(self):
-    """Verify VM memory utilization is within optimal levels."""
-
-    start_formatted_string = op.get(
-        flags.START_TIME).strftime('%Y/%m/%d %H:%M:%S')
-    end_formatted_string = op.get(flags.END_TIME).strftime('%Y/%m/%d %H:%M:%S')
-    within_str = f'within d\'{start_formatted_string}\', d\'{end_formatted_string}\''
-
-    mark_no_ops_agent = False
-
-    vm = gce.get_instance(
-        project_id=self.project_id,
-        zone=self.zone,
-        instance_name=self.instance_name,
-    )
-
-    mem_usage_metrics = None
-
+  def _memory_query(self, vm: gce.Instance) -> Optional[str]:
+    """Returns the query of the memory usage above the threshold, if the VM
+    exports memory metrics."""
     if util.ops_agent_installed(self.project_id, vm.id):
-      mem_usage_metrics = monitoring.query(
-          self.project_id, """
+      return """
           fetch gce_instance
             | metric 'agent.googleapis.com/memory/percent_used'
             | filter (resource.instance_id == '{}')
             | group_by [resource.instance_id], 3m, [percent_used: mean(value.percent_used)]
             | filter (cast_units(percent_used,"")/100) >= {}
             | {}
-          """.format(vm.id, UTILIZATION_THRESHOLD, within_str))
-    elif 'e2' in vm.machine_type():
-      mem_usage_metrics = monitoring.query(
-          self.project_id, """
+          """.format(vm.id, UTILIZATION_THRESHOLD, _within_str())
+    if 'e2' in vm.machine_type():
+      return """
               fetch gce_instance
                 | {{ metric 'compute.googleapis.com/instance/memory/balloon/ram_used'
                 ; metric 'compute.googleapis.com/instance/memory/balloon/ram_size' }}
@@ -85,7 +76,35 @@ class HighVmMemoryUtilization(runbook.Step):
                 | group_by [resource.instance_id], 3m, [ram_left: mean(val())]
                 | filter ram_left >= {}
                 | {}
-              """.format(vm.id, UTILIZATION_THRESHOLD, within_str))
+              """.format(vm.id, UTILIZATION_THRESHOLD, _within_str())
+    return None
+
+  def prefetch(self):
+    vm = gce.get_instance(
+        project_id=self.project_id,
+        zone=self.zone,
+        instance_name=self.instance_name,
+    )
+    query = self._memory_query(vm)
+    if query:
+      monitoring.query(self.project_id, query)
+
+  def execute(self):
+    """Verify VM memory utilization is within optimal levels."""
+
+    mark_no_ops_agent = False
+
+    vm = gce.get_instance(
+        project_id=self.project_id,
+        zone=self.zone,
+        instance_name=self.instance_name,
+    )
+
+    mem_usage_metrics = None
+
+    query = self._memory_query(vm)
+    if query:
+      mem_usage_metrics = monitoring.query(self.project_id, query)
     else:
       mark_no_ops_agent = True
       op.info(
@@ -132,14 +151,33 @@ class HighVmDiskUtilization(runbook.Step):
   instance_name: str
   serial_console_file: str = ''
 
+  def _disk_query(self, vm: gce.Instance) -> Optional[str]:
+    """Returns the query of the disk usage above the threshold, if the Ops
+    Agent exports disk metrics."""
+    if util.ops_agent_installed(self.project_id, vm.id):
+      return """
+          fetch gce_instance
+            | metric 'agent.googleapis.com/disk/percent_used'
+            | filter (resource.instance_id == '{}' && metric.device !~ '/dev/loop.*' && metric.state == 'used')
+            | group_by [resource.instance_id], 3m, [percent_used: mean(value.percent_used)]
+            | filter (cast_units(percent_used,"")/100) >= {}
+            | {}
+          """.format(vm.id, UTILIZATION_THRESHOLD, _within_str())
+    return None
+
+  def prefetch(self):
+    vm = gce.get_instance(
+        project_id=self.project_id,
+        zone=self.zone,
+        instance_name=self.instance_name,
+    )
+    query = self._disk_query(vm)
+    if query:
+      monitoring.query(self.project_id, query)
+
   def execute(self):
     """Verify VM's Boot disk space utilization is within optimal levels."""
 
-    start_formatted_string = op.get(
-        flags.START_TIME).strftime('%Y/%m/%d %H:%M:%S')
-    end_formatted_string = op.get(flags.END_TIME).strftime('%Y/%m/%d %H:%M:%S')
-    within_str = f'within d\'{start_formatted_string}\', d\'{end_formatted_string}\''
-
     mark_no_ops_agent = False
 
     vm = gce.get_instance(
@@ -150,16 +188,9 @@ class HighVmDiskUtilization(runbook.Step):
 
     disk_usage_metrics = None
 
-    if util.ops_agent_installed(self.project_id, vm.id):
-      disk_usage_metrics = monitoring.query(
-          self.project_id, """
-          fetch gce_instance
-            | metric 'agent.googleapis.com/disk/percent_used'
-            | filter (resource.instance_id == '{}' && metric.device !~ '/dev/loop.*' && metric.state == 'used')
-            | group_by [resource.instance_id], 3m, [percent_used: mean(value.percent_used)]
-            | filter (cast_units(percent_used,"")/100) >= {}
-            | {}
-          """.format(vm.id, UTILIZATION_THRESHOLD, within_str))
+    query = self._disk_query(vm)
+    if query:
+      disk_usage_metrics = monitoring.query(self.project_id, query)
       op.add_metadata('Disk Utilization Threshold (fraction of 1)',
                       UTILIZATION_THRESHOLD)
     else:
@@ -204,42 +235,44 @@ class HighVmCpuUtilization(runbook.Step):
   zone: str
   instance_name: str
 
-  def execute(self):
-    """Verify VM CPU utilization is within optimal levels"""
-
-    start_formatted_string = op.get(
-        flags.START_TIME).strftime('%Y/%m/%d %H:%M:%S')
-    end_formatted_string = op.get(flags.END_TIME).strftime('%Y/%m/%d %H:%M:%S')
-    within_str = f'within d\'{start_formatted_string}\', d\'{end_formatted_string}\''
-
-    vm = gce.get_instance(
-        project_id=self.project_id,
-        zone=self.zone,
-        instance_name=self.instance_name,
-    )
-    cpu_usage_metrics = None
-
+  def _cpu_query(self, vm: gce.Instance) -> str:
+    """Returns the query of the CPU utilization above the threshold."""
     if util.ops_agent_installed(self.project_id, vm.id):
-      cpu_usage_metrics = monitoring.query(
-          self.project_id, """
+      return """
           fetch gce_instance
             | metric 'agent.googleapis.com/cpu/utilization'
             | filter (resource.instance_id == '{}')
             | group_by [resource.instance_id], 3m, [value_utilization_mean: mean(value.utilization)]
             | filter (cast_units(value_utilization_mean,"")/100) >= {}
             | {}
-          """.format(vm.id, UTILIZATION_THRESHOLD, within_str))
-    else:
-      # use CPU utilization visible to the hypervisor
-      cpu_usage_metrics = monitoring.query(
-          self.project_id, """
+          """.format(vm.id, UTILIZATION_THRESHOLD, _within_str())
+    # use CPU utilization visible to the hypervisor
+    return """
             fetch gce_instance
               | metric 'compute.googleapis.com/instance/cpu/utilization'
               | filter (resource.instance_id == '{}')
               | group_by [resource.instance_id], 3m, [value_utilization_max: max(value.utilization)]
               | filter value_utilization_max >= {}
               | {}
-            """.format(vm.id, UTILIZATION_THRESHOLD, within_str))
+            """.format(vm.id, UTILIZATION_THRESHOLD, _within_str())
+
+  def prefetch(self):
+    vm = gce.get_instance(
+        project_id=self.project_id,
+        zone=self.zone,
+        instance_name=self.instance_name,
+    )
+    monitoring.query(self.project_id, self._cpu_query(vm))
+
+  def execute(self):
+    """Verify VM CPU utilization is within optimal levels"""
+
+    vm = gce.get_instance(
+        project_id=self.project_id,
+        zone=self.zone,
+        instance_name=self.instance_name,
+    )
+    cpu_usage_metrics = monitoring.query(self.project_id, self._cpu_query(vm))
     # Get Performance issues corrected.
     if cpu_usage_metrics:
       op.add_failed(vm,
@@ -13,6 +13,7 @@
 # limitations under the License.
 """GKE Image pull failures runbook"""
 
+import re
 from datetime import datetime
 
 from boltons.iterutils import get_path
@@ -23,6 +24,68 @@ from gcpdiag.runbook import op
 from gcpdiag.runbook.gke import flags
 
 
+def image_pull_conditions(messages):
+  """Returns the conditions of the query of the pod events with all the
+  `messages`, as (operator, field path, value) tuples.
+
+  Both the logging query (image_pull_filter_list()) and the Python-side
+  predicate of the query (image_pull_predicate()) are built from them.
+  """
+  conditions = [
+      ('log_id', ('logName',), 'events'),
+      ('=', ('resource', 'type'), 'k8s_pod'),
+  ]
+  conditions.extend(
+      (':', ('jsonPayload', 'message'), message) for message in messages)
+  cluster_location = op.get(flags.LOCATION)
+  cluster_name = op.get(flags.NAME)
+  if cluster_location and cluster_name:
+    conditions.append(('=', ('resource', 'labels', 'location'),
+                       cluster_location))
+    conditions.append(('=', ('resource', 'labels', 'cluster_name'),
+                       cluster_name))
+  return conditions
+
+
+def image_pull_filter_list(messages):
+  """Returns the filter of the pod events with all the `messages`."""
+  filter_list = []
+  for operator, path, value in image_pull_conditions(messages):
+    if operator == 'log_id':
+      filter_list.append(f'log_id("{value}")')
+    else:
+      filter_list.append(f'{".".join(path)}{operator}"{value}"')
+  return filter_list
+
+
+def image_pull_predicate(messages):
+  """Returns a function evaluating image_pull_filter_list() on a log entry."""
+  checks = []
+  for operator, path, value in image_pull_conditions(messages):
+    if operator == 'log_id':
+      suffix = f'/logs/{value}'
+      checks.append((path, lambda v, suffix=suffix: str(v).endswith(suffix)))
+    elif operator == '=':
+      checks.append((path, lambda v, value=value: v == value))
+    else:
+      # the ":" operator of the logging query language is a case-insensitive
+      # substring match, and "*" matches any characters.
+      pattern = re.compile(
+          '.*'.join(re.escape(part) for part in value.split('*')),
+          re.IGNORECASE)
+      checks.append((path, lambda v, pattern=pattern: bool(
+          pattern.search(str(v)))))
+
+  def predicate(log_entry):
+    for path, check in checks:
+      value = get_path(log_entry, path, default=None)
+      if value is None or not check(value):
+        return False
+    return True
+
+  return predicate
+
+
 def local_realtime_query(filter_list):
   filter_str = '\n'.join(filter_list)
   result = logs.realtime_query(project_id=op.get(flags.PROJECT_ID),
@@ -32,6 +95,17 @@ def local_realtime_query(filter_list):
   return result
 
 
+def local_register_query(messages):
+  """Registers the query of a step, to be executed with the queries of the
+  other steps in a single logging API query."""
+  logs.register_realtime_query(
+      project_id=op.get(flags.PROJECT_ID),
+      start_time=op.get(flags.START_TIME),
+      end_time=op.get(flags.END_TIME),
+      filter_str='\n'.join(image_pull_filter_list(messages)),
+      predicate=image_pull_predicate(messages))
+
+
 class ImagePull(runbook.DiagnosticTree):
   """Analysis and Resolution of Image Pull Failures on GKE clusters.
 
@@ -105,6 +179,11 @@ class ImagePull(runbook.DiagnosticTree):
                   child=image_connection_timeout)
     self.add_step(parent=image_connection_timeout,
                   child=image_not_found_insufficient_scope)
+    # Fetch the log entries of all the steps together
+    for step in (image_not_found, image_forbidden, image_dns_issue,
+                 image_connection_timeout_restricted_private,
+                 image_connection_timeout, image_not_found_insufficient_scope):
+      local_register_query(step.messages)
     # Ending runbook
     self.add_end(ImagePullEnd())
 
@@ -189,25 +268,15 @@ class ImagePullStart(runbook.StartStep):
 class ImageNotFound(runbook.Step):
   """Check for Image not found log entries"""
   template = 'imagepull::image_not_found'
+  messages = ('Failed to pull image', 'not found')
 
   def execute(self):
     """Check for "Failed to pull image.*not found" log entries."""
     project = op.get(flags.PROJECT_ID)
     project_path = crm.get_project(project)
-    cluster_location = op.get(flags.LOCATION)
-    cluster_name = op.get(flags.NAME)
     start_time = op.get(flags.START_TIME)
     end_time = op.get(flags.END_TIME)
-    filter_list = [
-        'log_id("events")',
-        'resource.type="k8s_pod"',
-        'jsonPayload.message:"Failed to pull image"',
-        'jsonPayload.message:"not found"',
-    ]
-
-    if cluster_location and cluster_name:
-      filter_list.append(f'resource.labels.location="{cluster_location}"')
-      filter_list.append(f'resource.labels.cluster_name="{cluster_name}"')
+    filter_list = image_pull_filter_list(self.messages)
 
     log_entries = local_realtime_query(filter_list)
 
@@ -231,24 +300,15 @@ class ImageNotFound(runbook.Step):
 class ImageForbidden(runbook.Step):
   """Image cannot be pulled, insufficiente permissions"""
   template = 'imagepull::image_forbidden'
+  messages = ('Failed to pull image', '403 Forbidden')
 
   def execute(self):
     """Check for "Failed to pull image.*403 Forbidden" log entries."""
     project = op.get(flags.PROJECT_ID)
     project_path = crm.get_project(project)
-    cluster_location = op.get(flags.LOCATION)
-    cluster_name = op.get(flags.NAME)
     start_time = op.get(flags.START_TIME)
     end_time = op.get(flags.END_TIME)
-    filter_list = [
-        'log_id("events")',
-        'resource.type="k8s_pod"',
-        'jsonPayload.message:"Failed to pull image"',
-        'jsonPayload.message:"403 Forbidden"',
-    ]
-    if cluster_location and cluster_name:
-      filter_list.append(f'resource.labels.location="{cluster_location}"')
-      filter_list.append(f'resource.labels.cluster_name="{cluster_name}"')
+    filter_list = image_pull_filter_list(self.messages)
 
     log_entries = local_realtime_query(filter_list)
 
@@ -272,25 +332,15 @@ class ImageForbidden(runbook.Step):
 class ImageDnsIssue(runbook.Step):
   """Node DNS sever cannot resolve the IP of the repository"""
   template = 'imagepull::image_dns_issue'
+  messages = ('Failed to pull image', 'lookup', 'server misbehaving')
 
   def execute(self):
     """Check for "Failed to pull image.*lookup.*server misbehaving" log entries."""
     project = op.get(flags.PROJECT_ID)
     project_path = crm.get_project(project)
-    cluster_location = op.get(flags.LOCATION)
-    cluster_name = op.get(flags.NAME)
     start_time = op.get(flags.START_TIME)
     end_time = op.get(flags.END_TIME)
-    filter_list = [
-        'log_id("events")',
-        'resource.type="k8s_pod"',
-        'jsonPayload.message:"Failed to pull image"',
-        'jsonPayload.message:"lookup"',
-        'jsonPayload.message:"server misbehaving"',
-    ]
-    if cluster_location and cluster_name:
-      filter_list.append(f'resource.labels.location="{cluster_location}"')
-      filter_list.append(f'resource.labels.cluster_name="{cluster_name}"')
+    filter_list = image_pull_filter_list(self.messages)
 
     log_entries = local_realtime_query(filter_list)
 
@@ -314,6 +364,8 @@ class ImageDnsIssue(runbook.Step):
 class ImageConnectionTimeoutRestrictedPrivate(runbook.Step):
   """The connection to restricted.googleapis.com or private.googleapis.com is timing out"""
   template = 'imagepull::image_connection_timeout_restricted_private'
+  messages = ('Failed to pull image', 'dial tcp',
+              '199.36.153.*:443: i/o timeout')
 
   def execute(self):
     """
@@ -321,20 +373,9 @@ class ImageConnectionTimeoutRestrictedPrivate(runbook.Step):
     """
     project = op.get(flags.PROJECT_ID)
     project_path = crm.get_project(project)
-    cluster_location = op.get(flags.LOCATION)
-    cluster_name = op.get(flags.NAME)
     start_time = op.get(flags.START_TIME)
     end_time = op.get(flags.END_TIME)
-    filter_list = [
-        'log_id("events")',
-        'resource.type="k8s_pod"',
-        'jsonPayload.message:"Failed to pull image"',
-        'jsonPayload.message:"dial tcp"',
-        'jsonPayload.message:"199.36.153.*:443: i/o timeout"',
-    ]
-    if cluster_location and cluster_name:
-      filter_list.append(f'resource.labels.location="{cluster_location}"')
-      filter_list.append(f'resource.labels.cluster_name="{cluster_name}"')
+    filter_list = image_pull_filter_list(self.messages)
 
     log_entries = local_realtime_query(filter_list)
 
@@ -358,6 +399,7 @@ class ImageConnectionTimeoutRestrictedPrivate(runbook.Step):
 class ImageConnectionTimeout(runbook.Step):
   """The connection to Google APIs is timing out"""
   template = 'imagepull::image_connection_timeout'
+  messages = ('Failed to pull image', 'dial tcp', 'i/o timeout')
 
   def execute(self):
     """
@@ -365,20 +407,9 @@ class ImageConnectionTimeout(runbook.Step):
     """
     project = op.get(flags.PROJECT_ID)
     project_path = crm.get_project(project)
-    cluster_location = op.get(flags.LOCATION)
-    cluster_name = op.get(flags.NAME)
     start_time = op.get(flags.START_TIME)
     end_time = op.get(flags.END_TIME)
-    filter_list = [
-        'log_id("events")',
-        'resource.type="k8s_pod"',
-        'jsonPayload.message:"Failed to pull image"',
-        'jsonPayload.message:"dial tcp"',
-        'jsonPayload.message:"i/o timeout"',
-    ]
-    if cluster_location and cluster_name:
-      filter_list.append(f'resource.labels.location="{cluster_location}"')
-      filter_list.append(f'resource.labels.cluster_name="{cluster_name}"')
+    filter_list = image_pull_filter_list(self.messages)
 
     log_entries = local_realtime_query(filter_list)
 
@@ -402,6 +433,7 @@ class ImageConnectionTimeout(runbook.Step):
 class ImageNotFoundInsufficientScope(runbook.Step):
   """Check for Image not found log entries with insufficient_scope server message"""
   template = 'imagepull::image_not_found_insufficient_scope'
+  messages = ('Failed to pull image', 'insufficient_scope')
 
   def execute(self):
     """
@@ -409,20 +441,9 @@ class ImageNotFoundInsufficientScope(runbook.Step):
     """
     project = op.get(flags.PROJECT_ID)
     project_path = crm.get_project(project)
-    cluster_location = op.get(flags.LOCATION)
-    cluster_name = op.get(flags.NAME)
     start_time = op.get(flags.START_TIME)
     end_time = op.get(flags.END_TIME)
-    filter_list = [
-        'log_id("events")',
-        'resource.type="k8s_pod"',
-        'jsonPayload.message:"Failed to pull image"',
-        'jsonPayload.message:"insufficient_scope"',
-    ]
-
-    if cluster_location and cluster_name:
-      filter_list.append(f'resource.labels.location="{cluster_location}"')
-      filter_list.append(f'resource.labels.cluster_name="{cluster_name}"')
+    filter_list = image_pull_filter_list(self.messages)
 
     log_entries = local_realtime_query(filter_list)
     if log_entries:
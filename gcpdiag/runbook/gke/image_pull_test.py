@@ -13,8 +13,12 @@
 # limitations under the License.
 """Test class for gke/Image_pull"""
 
+import copy
+from unittest import mock
+
 from gcpdiag import config
-from gcpdiag.runbook import gke, snapshot_test_base
+from gcpdiag.runbook import gke, op, snapshot_test_base
+from gcpdiag.runbook.gke import flags, image_pull
 
 
 class Test(snapshot_test_base.RulesSnapshotTestBase):
@@ -29,3 +33,59 @@ class Test(snapshot_test_base.RulesSnapshotTestBase):
       'start_time': '2024-08-12T01:00:00Z',
       'end_time': '2024-08-12T23:00:00Z'
   }]
+
+
+PARAMETERS = {flags.LOCATION: 'europe-west10', flags.NAME: 'gcp-cluster'}
+MESSAGES = ('Failed to pull image', 'dial tcp', '199.36.153.*:443: i/o timeout')
+EVENT = {
+    'logName': 'projects/gcpdiag-gke-cluster-autoscaler-rrrr/logs/events',
+    'resource': {
+        'type': 'k8s_pod',
+        'labels': {
+            'location': 'europe-west10',
+            'cluster_name': 'gcp-cluster',
+        }
+    },
+    'jsonPayload': {
+        'message': ('failed to pull image "app:v1": dial tcp '
+                    '199.36.153.8:443: I/O timeout')
+    },
+}
+# An event not matched by every line of the filter, because of a change of
+# the field of that line.
+MISMATCHES = {
+    'log_id("events")': (('logName',),
+                         'projects/gcpdiag-gke-cluster-autoscaler-rrrr/logs/'
+                         'cloudaudit.googleapis.com%2Factivity'),
+    'resource.type="k8s_pod"': (('resource', 'type'), 'k8s_container'),
+    'jsonPayload.message:"Failed to pull image"':
+        (('jsonPayload', 'message'), 'dial tcp 199.36.153.8:443: i/o timeout'),
+    'jsonPayload.message:"dial tcp"':
+        (('jsonPayload', 'message'),
+         'Failed to pull image "app:v1": 199.36.153.8:443: i/o timeout'),
+    'jsonPayload.message:"199.36.153.*:443: i/o timeout"':
+        (('jsonPayload', 'message'),
+         'Failed to pull image "app:v1": dial tcp 10.0.0.1:443: i/o timeout'),
+    'resource.labels.location="europe-west10"':
+        (('resource', 'labels', 'location'), 'europe-west4'),
+    'resource.labels.cluster_name="gcp-cluster"':
+        (('resource', 'labels', 'cluster_name'), 'other-cluster'),
+}
+
+
+@mock.patch.object(op, 'get', new=lambda key, default=None: PARAMETERS.get(key))
+def test_image_pull_predicate():
+  """Verify that the predicate of the query evaluates its filter."""
+  filter_list = image_pull.image_pull_filter_list(MESSAGES)
+  assert sorted(filter_list) == sorted(MISMATCHES)
+  predicate = image_pull.image_pull_predicate(MESSAGES)
+  assert predicate(EVENT)
+  for filter_line, (path, value) in MISMATCHES.items():
+    event = copy.deepcopy(EVENT)
+    parent = event
+    for key in path[:-1]:
+      parent = parent[key]
+    parent[path[-1]] = value
+    assert not predicate(event), filter_line
+    del parent[path[-1]]
+    assert not predicate(event), filter_line
@@ -13,6 +13,7 @@
 # limitations under the License.
 """Operator Module"""
 
+import contextvars
 from contextlib import contextmanager
 from typing import Any, Optional, Tuple
 
@@ -20,8 +21,23 @@ from gcpdiag import models
 from gcpdiag.runbook.constants import *  # pylint: disable=unused-wildcard-import, wildcard-import
 from gcpdiag.runbook.report import InteractionInterface
 
-context: models.Context
-operator: 'Operator'
+# The operator of the runbook executed in the current context. Every runbook
+# (or bundle) executed concurrently by the DiagnosticEngine runs in its own
+# context, so that the steps always use the operator of their own runbook.
+# It is available as `op.operator`, and its context as `op.context`.
+_operator: contextvars.ContextVar[
+    Optional['Operator']] = contextvars.ContextVar('operator', default=None)
+
+
+def __getattr__(name: str) -> Any:
+  """Return the operator and context of the current context (PEP 562)."""
+  if name == 'operator':
+    return _operator.get()
+  if name == 'context':
+    current = _operator.get()
+    # Operator is a dict: don't test its truth value
+    return current.context if current is not None else None
+  raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
 
 
 class Operator(dict):
@@ -66,15 +82,25 @@ class Operator(dict):
 
 @contextmanager
 def operator_context(new_operator):
-  """Temporarily sets the global context and operator in op.py module"""
-  global context, operator
-  # Set up the new context and operator for a step
-  context, operator = new_operator.context, new_operator
+  """Temporarily sets the context and operator in op.py module, for the
+  current context only"""
+  token = _operator.set(new_operator)
   try:
     yield
   finally:
-    operator = None
-    context = None
+    _operator.reset(token)
+
+
+def _get_operator() -> 'Operator':
+  current = _operator.get()
+  if current is None:
+    raise RuntimeError('no runbook operator set in the current context')
+  return current
+
+
+def set_operator(new_operator: Optional['Operator']):
+  """Sets the operator of the current context, e.g. in tests"""
+  _operator.set(new_operator)
 
 
 # pylint: disable=protected-access
@@ -98,6 +124,7 @@ def prep_msg(key, **kwargs):
       str: The parsed message from the linked Jinja template.
 
 """
+  operator = _get_operator()
   # set default template variables
   if 'start_time' not in kwargs:
     kwargs['start_time'] = operator.parameters['start_time']
@@ -126,6 +153,7 @@ def get(key, default=None):
     Usage:
       value = op.get('parameter_name')
     """
+  operator = _get_operator()
   return operator.parameters.get(key, default)
 
 
@@ -143,6 +171,7 @@ def put(key, value):
     Usage:
         operator.put('parameter_name', 'value')
   """
+  operator = _get_operator()
   operator.parameters[key] = value
 
 
@@ -174,6 +203,7 @@ def prompt(message: str,
                 options={'y': 'Yes, all remaining interfaces', 'n': 'No Proceed'}
             )
     """
+  operator = _get_operator()
   return operator.interface.prompt(message=message,
                                    kind=kind,
                                    options=options,
@@ -182,6 +212,7 @@ def prompt(message: str,
 
 def info(message: str, step_type='INFO') -> None:
   """Send an informational message to the user"""
+  operator = _get_operator()
   operator.interface.info(message, step_type)
   operator.interface.rm.add_step_info_metadata(
       run_id=operator.run_id,
@@ -192,6 +223,7 @@ def info(message: str, step_type='INFO') -> None:
 def prep_rca(resource: Optional[models.Resource], template, suffix,
              kwarg) -> None:
   """Parses a log form and complex Jinja templates for root cause analysis (RCA)."""
+  operator = _get_operator()
   return operator.interface.prepare_rca(run_id=operator.run_id,
                                         resource=resource,
                                         template=template,
@@ -202,6 +234,7 @@ def prep_rca(resource: Optional[models.Resource], template, suffix,
 
 def add_skipped(resource: Optional[models.Resource], reason: str) -> None:
   """Sends a skip message for a step to the user and store it in the report"""
+  operator = _get_operator()
   operator.interface.add_skipped(run_id=operator.run_id,
                                  resource=resource,
                                  reason=reason,
@@ -210,6 +243,7 @@ def add_skipped(resource: Optional[models.Resource], reason: str) -> None:
 
 def add_ok(resource: models.Resource, reason: str) -> None:
   """Sends a success message for a step to the user and store it in the report"""
+  operator = _get_operator()
   operator.interface.add_ok(run_id=operator.run_id,
                             resource=resource,
                             reason=reason,
@@ -218,6 +252,7 @@ def add_ok(resource: models.Resource, reason: str) -> None:
 
 def add_failed(resource: models.Resource, reason: str, remediation: str) -> Any:
   """Sends a failure message for a step to the user and store it in the report"""
+  operator = _get_operator()
   return operator.interface.add_failed(
       run_id=operator.run_id,
       resource=resource,
@@ -231,6 +266,7 @@ def add_uncertain(resource: models.Resource,
                   remediation: str = None,
                   human_task_msg: str = '') -> Any:
   """Sends an inconclusive message for a step to the user and store it in the report"""
+  operator = _get_operator()
   return operator.interface.add_uncertain(
       run_id=operator.run_id,
       resource=resource,
@@ -251,6 +287,7 @@ def get_step_outcome(execution_id) -> Tuple[Any, dict]:
     a dict of totals by status representing outcome of resource evaluations
     or empty dict if the step hasn't been executed.
   """
+  operator = _get_operator()
   step_result = operator.interface.rm.reports[operator.run_id].results.get(
       execution_id)
   if not step_result:
@@ -289,6 +326,7 @@ def step_unexecuted(execution_id) -> bool:
 
 
 def add_metadata(key, value):
+  operator = _get_operator()
   operator.interface.rm.add_step_metadata(
       run_id=operator.run_id,
       step_execution_id=operator.step.execution_id,
@@ -297,12 +335,14 @@ def add_metadata(key, value):
 
 
 def get_metadata(key, step_execution_id=None):
+  operator = _get_operator()
   step_execution_id = step_execution_id or operator.step.execution_id
   return operator.interface.rm.get_step_metadata(
       run_id=operator.run_id, step_execution_id=step_execution_id, key=key)
 
 
 def get_all_metadata(step_execution_id=None):
+  operator = _get_operator()
   step_execution_id = step_execution_id or operator.step.execution_id
   return operator.interface.rm.get_all_step_metadata(
       run_id=operator.run_id, step_execution_id=step_execution_id)
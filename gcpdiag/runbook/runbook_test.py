@@ -13,11 +13,14 @@
 # limitations under the License.
 """Test code in runbook module"""
 
+import concurrent.futures
+import threading
 import unittest
 from datetime import datetime, timedelta, timezone
 from unittest.mock import Mock, patch
 
-from gcpdiag import models, runbook
+from gcpdiag import config, models, runbook
+from gcpdiag.runbook import op as runbook_op
 from gcpdiag.runbook.constants import StepType
 from gcpdiag.runbook.gcp import flags
 from gcpdiag.runbook.op import Operator
@@ -42,6 +45,68 @@ class LegacyParamHandler(runbook.DiagnosticTree):
       del parameters['deprecated_param']
 
 
+class ConcurrentStep(runbook.Step):
+  """Step waiting for another bundle to run at the same time"""
+  parameters: dict = {}
+  barrier = threading.Barrier(2, timeout=10)
+  seen: dict = {}
+
+  def execute(self):
+    """Concurrent step"""
+    self.barrier.wait()
+    self.seen[runbook_op.get('bundle_name')] = runbook_op.operator.run_id
+
+
+class PrefetchStep(runbook.Step):
+  """Step recording the operator and thread of its prefetch"""
+  parameters: dict = {}
+  fail = False
+
+  def prefetch(self):
+    self.prefetch_operator = runbook_op.operator
+    self.prefetch_thread = threading.current_thread()
+    if self.fail:
+      raise RuntimeError('prefetch failed')
+
+
+class BlockingPrefetchStep(runbook.Step):
+  """Step whose prefetch waits until it is released"""
+  parameters: dict = {}
+
+  def __init__(self, *args, **kwargs):
+    super().__init__(*args, **kwargs)
+    self.started = threading.Event()
+    self.release = threading.Event()
+
+  def prefetch(self):
+    self.started.set()
+    self.release.wait(timeout=10)
+
+
+class AstChildStep(runbook.Step):
+  """Step added by another step"""
+
+
+class AstStep(runbook.Step):
+  """Step adding a child step"""
+
+  def execute(self):
+    """Ast step"""
+    self.add_child(AstChildStep())
+
+
+class AstTree(runbook.DiagnosticTree):
+  """Tree expanded from its source code"""
+  parameters: dict = {}
+
+  def build_tree(self):
+    start = runbook.StartStep()
+    self.add_start(start)
+    step = AstStep()
+    self.add_step(parent=start, child=step)
+    self.add_end(runbook.EndStep())
+
+
 class TestDiagnosticEngine(unittest.TestCase):
   """Test Diagnostic Engine"""
 
@@ -143,6 +208,59 @@ class TestDiagnosticEngine(unittest.TestCase):
     self.assertIn(last_step, visited)
     self.assertEqual(mock_run_step.call_count, 3)
 
+  @patch('gcpdiag.runbook.DiagnosticEngine.run_step')
+  def test_find_path_dfs_prefetch(self, mock_run_step):
+    op = Operator(interface=None)
+    op.create_context(p={}, project_id='')
+    start = runbook.StartStep()
+    first = PrefetchStep(parent=start)
+    failing = PrefetchStep(parent=first, fail=True)
+    runbook.Step(parent=failing)
+    last = PrefetchStep(parent=failing)
+    prefetcher = runbook.StepPrefetcher('test/prefetch')
+    with runbook_op.operator_context(op):
+      prefetcher.start(start)
+    # the prefetch of every step is done when it is executed
+    prefetched = []
+    mock_run_step.side_effect = lambda step, operator: prefetched.append(
+        hasattr(step, 'prefetch_thread'))
+
+    self.de.find_path_dfs(operator=op,
+                          step=start,
+                          executed_steps=set(),
+                          prefetcher=prefetcher)
+
+    self.assertEqual(prefetched, [False, True, True, False, True])
+    for step in (first, failing, last):
+      self.assertIs(step.prefetch_operator, op)
+      self.assertIsNot(step.prefetch_thread, threading.current_thread())
+    stats = prefetcher.stats()
+    self.assertEqual(stats['prefetched'], 3)
+    self.assertEqual(stats['reached'], 3)
+    self.assertGreaterEqual(stats['overlap_seconds'], 0)
+
+  def test_prefetcher_close(self):
+    op = Operator(interface=None)
+    op.create_context(p={}, project_id='')
+    start = runbook.StartStep()
+    first = BlockingPrefetchStep(parent=start)
+    second = PrefetchStep(parent=first)
+    prefetcher = runbook.StepPrefetcher('test/prefetch-close')
+    # a single worker, busy with the prefetch of the first step
+    pool = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+    try:
+      with patch('gcpdiag.executor.get_executor', return_value=pool), \
+          runbook_op.operator_context(op):
+        prefetcher.start(start)
+      self.assertTrue(first.started.wait(timeout=10))
+      # the runbook is finalized before the steps are reached
+      prefetcher.close()
+      first.release.set()
+    finally:
+      pool.shutdown(wait=True)
+    self.assertFalse(hasattr(second, 'prefetch_thread'))
+    self.assertEqual(prefetcher.stats()['cancelled'], 1)
+
   @patch('gcpdiag.runbook.DiagnosticEngine.run_step')
   def test_run_bundle_operation(self, mock_run_step):
     bundle = Mock(run_id='1', runbook_name='test')
@@ -161,6 +279,40 @@ class TestDiagnosticEngine(unittest.TestCase):
     assert mock_run_bundle.called
     assert mock_run_diagnostic_tree.called
 
+  @patch('gcpdiag.runbook.DiagnosticEngine.run_bundle')
+  @patch('gcpdiag.runbook.DiagnosticEngine.run_diagnostic_tree')
+  def test_run_parallel_interactive(self, mock_run_diagnostic_tree,
+                                    mock_run_bundle):
+    # interactive runbooks are executed one at a time
+    config.init({'auto': False, 'interface': 'cli'})
+    threads = set()
+    mock_run_bundle.side_effect = lambda *args, **kwargs: threads.add(
+        threading.current_thread())
+    mock_run_diagnostic_tree.side_effect = mock_run_bundle.side_effect
+    self.de.run(max_workers=2)
+    self.assertEqual(threads, {threading.current_thread()})
+
+  def test_run_parallel(self):
+    config.init({'auto': True, 'interface': 'cli'})
+    operator = runbook_op.operator
+    de = runbook.DiagnosticEngine()
+    bundles = []
+    for name in ('one', 'two'):
+      bundle = de.load_steps(parameter={'bundle_name': name},
+                             steps_to_run=[ConcurrentStep.id])
+      de.add_task((bundle, bundle.parameter))
+      bundles.append(bundle)
+    de.run(max_workers=2)
+    # each bundle saw its own operator, and has its own report
+    self.assertEqual(ConcurrentStep.seen, {
+        'one': bundles[0].run_id,
+        'two': bundles[1].run_id
+    })
+    for bundle in bundles:
+      report = de.interface.rm.reports[bundle.run_id]
+      self.assertEqual(len(report.results), 1)
+    self.assertIs(runbook_op.operator, operator)
+
   @patch('gcpdiag.runbook.DiagnosticEngine.run_step')
   def test_run_bundles(self, mock_run_step):
     bundle = runbook.Bundle()
@@ -198,6 +350,31 @@ class TestDiagnosticEngine(unittest.TestCase):
                   str(context.exception))
 
 
+class TestExpandTreeFromAst(unittest.TestCase):
+  """Test the expansion of diagnostic trees from the source code"""
+
+  def _expand(self):
+    builder = runbook.ExpandTreeFromAst(AstTree)
+    tree = builder.visit_ast_nodes(AstTree.build_tree)
+    steps = []
+    step = tree.start
+    while step:
+      steps.append(type(step))
+      step = step.steps[0] if step.steps else None
+    return steps
+
+  def test_expand_tree(self):
+    expected = [runbook.StartStep, AstStep, AstChildStep]
+    self.assertEqual(self._expand(), expected)
+    # the cached syntax trees give the same result
+    self.assertEqual(self._expand(), expected)
+
+  def test_find_class_globally(self):
+    self.assertIs(runbook.find_class_globally('AstChildStep'), AstChildStep)
+    self.assertIs(runbook.find_class_globally('StartStep'), runbook.StartStep)
+    self.assertIsNone(runbook.find_class_globally('NoSuchStep'))
+
+
 class TestSetDefaultParameters(unittest.TestCase):
   """Test for Setting default date parameters"""
 
@@ -13,19 +13,15 @@
 # limitations under the License.
 """Search command to look up gcpdiag rules"""
 import argparse
-import heapq
 import json
 import logging
-from typing import Any, Dict, Iterable, List, Tuple
+from typing import Any, Dict
 
 from blessings import Terminal
 
-from gcpdiag import config, lint, runbook
-from gcpdiag.lint import LintRule
-from gcpdiag.lint import command as lint_command
-from gcpdiag.runbook import DiagnosticTree
-from gcpdiag.runbook import command as runbook_command
+from gcpdiag import config
 from gcpdiag.runbook.output import terminal_output
+from gcpdiag.search import index
 
 
 def _init_search_args_parser() -> argparse.ArgumentParser:
@@ -61,7 +57,9 @@ def _init_search_args_parser() -> argparse.ArgumentParser:
                       type=str,
                       default=[],
                       action='append',
-                      help='Search only rules in these products')
+                      help=('Search only rules in these products. Lint rules '
+                            'can also be selected with rule patterns, e.g. '
+                            'gke/WARN/* (see gcpdiag lint --include)'))
 
   parser.add_argument('-f',
                       '--format',
@@ -72,23 +70,6 @@ def _init_search_args_parser() -> argparse.ArgumentParser:
   return parser
 
 
-def _load_lint_rules(args) -> Iterable[LintRule]:
-  """Load and return all lint rules from the repository."""
-  #pylint:disable=protected-access
-  product_patterns = lint_command._parse_rule_patterns(args.product)
-  repo = lint.LintRuleRepository(load_extended=True, include=product_patterns)
-  #pylint:disable=protected-access
-  lint_command._load_repository_rules(repo)
-  return repo.rules_to_run
-
-
-def _load_runbook_rules() -> Dict[str, DiagnosticTree]:
-  """Load and return all runbook rules. """
-  #pylint:disable=protected-access
-  runbook_command._load_runbook_rules(runbook.__name__)
-  return runbook.RunbookRegistry
-
-
 def run(argv=None):
   """Run the search command and return the report."""
   # Initialize argument parser
@@ -109,102 +90,21 @@ def run(argv=None):
   _search_rules(args)
 
 
-def _rank_runbook_rules(rules: Dict,
-                        args) -> List[Tuple[int, str, DiagnosticTree]]:
-  """Rank runbook rules based on the keywords and return a sorted list."""
-  ranked_rules: List[Tuple[int, str, DiagnosticTree]] = []
-  keywords = args.search
-  keywords = [kw.lower() for kw in keywords]
-
-  for name, obj in rules.items():
-    rule = obj(None)
-    if args.product and rule.product not in args.product:
-      continue
-    rule_name = rule.id.lower()
-    description = rule.__doc__.lower()
-    kw_count = sum(rule.keywords.count(kw) for kw in keywords) if hasattr(
-        rule, 'keywords') else 0
-    name_count = sum(rule_name.count(keyword) for keyword in keywords)
-    description_count = sum(description.count(keyword) for keyword in keywords)
-    score = (kw_count * 3) + (name_count * 2) + description_count
-
-    if score > 0:
-      # Use negative score to achieve a max-heap
-      heapq.heappush(ranked_rules, (-score, name, rule))
-
-  return [
-      heapq.heappop(ranked_rules)
-      for _ in range(min(len(ranked_rules), args.limit_per_type))
-  ]
-
-
-def _rank_lint_rules(rules: Iterable[LintRule],
-                     args) -> List[Tuple[int, str, LintRule]]:
-  """Rank lint rules based on the keywords and return a sorted list
-
-  """
-  ranked_rules: List[Tuple[int, str, LintRule]] = []
-  keywords = args.search
-  keywords = [kw.lower() for kw in keywords]
-
-  for rule in rules:
-    name = f'{rule.product}/{rule.rule_class}/{rule.rule_id}'.lower()
-    short_desc = rule.short_desc.lower()
-    long_desc = rule.long_desc.lower()
-    kw_count = sum(rule.keywords.count(keyword)
-                   for keyword in keywords) if rule.keywords else 0
-    short_desc_count = sum(short_desc.count(keyword) for keyword in keywords)
-    long_desc_count = sum(long_desc.count(keyword) for keyword in keywords)
-    score = (kw_count * 3) + (short_desc_count + long_desc_count) * 2
-
-    if score > 0:
-      # Use negative score to achieve a max-heap
-      heapq.heappush(ranked_rules, (-score, name, rule))
-
-  return [
-      heapq.heappop(ranked_rules)
-      for _ in range(min(len(ranked_rules), args.limit_per_type))
-  ]
-
-
 def _search_rules(args) -> None:
   """Search and display rules based on the search arguments."""
-  matched_lint_rules = []
-  matched_runbook_rules = []
-
-  # Load the gcpdiag rules
-  lint_rules = _load_lint_rules(args) if 'lint' in args.rule_type else []
-  runbook_rules = _load_runbook_rules() if 'runbook' in args.rule_type else {}
-
-  if 'lint' in args.rule_type:
-    matched_lint_rules = _rank_lint_rules(lint_rules, args)
-  if 'runbook' in args.rule_type:
-    matched_runbook_rules = _rank_runbook_rules(runbook_rules, args)
-
+  search_index = index.get_index()
   all_rules: Dict[str, Any] = {}
-  if matched_lint_rules:
-    all_rules['lint'] = [{
-        'id': r[1],
-        'type': 'lint',
-        'description': r[2].short_desc,
-        'full_description': r[2].__doc__,
-        'doc_url': r[2].doc_url
-    } for r in matched_lint_rules]
-  if matched_runbook_rules:
-    all_rules['runbook'] = []
-    for r in matched_runbook_rules:
-      # Make the type serializable
-      for value in r[2].parameters.values():
-        value['type'] = value['type'].__name__
-
-      all_rules['runbook'].append({
-          'id': r[1],
-          'type': 'runbook',
-          'description': r[2].short_desc,
-          'full_description': r[2].__doc__,
-          'doc_url': r[2].doc_url,
-          'parameters': r[2].parameters
-      })
+  for rule_type in ['lint', 'runbook']:
+    if rule_type not in args.rule_type:
+      continue
+    matched_rules = search_index.search(args.search,
+                                        rule_type,
+                                        products=args.product,
+                                        limit=args.limit_per_type)
+    if matched_rules:
+      all_rules[rule_type] = [{
+          k: v for k, v in doc.items() if k not in index.INTERNAL_KEYS
+      } for _, doc in matched_rules]
 
   if args.format == 'json':
     print(json.dumps(all_rules, indent=2))
@@ -12,13 +12,12 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 """ Test gcpdiag search command"""
+import json
 import unittest
-from argparse import Namespace
 from unittest import mock
 
-from gcpdiag.lint import LintRule
-from gcpdiag.runbook import DiagnosticTree
 from gcpdiag.search import command as search_cmd
+from gcpdiag.search import index
 
 
 class TestGcpdiagSearchCommand(unittest.TestCase):
@@ -80,12 +79,10 @@ class TestGcpdiagSearchCommand(unittest.TestCase):
     self.assertEqual(args.product, ['prod'])
     self.assertEqual(args.format, 'json')
 
-  @mock.patch('gcpdiag.search.command._load_lint_rules')
-  @mock.patch('gcpdiag.search.command._load_runbook_rules')
-  def test_search_rules(self, mock_load_runbook_rules, mock_load_lint_rules):
+  @mock.patch('gcpdiag.search.index.get_index')
+  def test_search_rules(self, mock_get_index):
     """Test case for search rules functionality."""
-    mock_load_lint_rules.return_value = []
-    mock_load_runbook_rules.return_value = {}
+    mock_get_index.return_value.search.return_value = []
 
     args = self.parser.parse_args([
         'test-keyword', 'public', '--limit-per-type', '2', '--rule-type',
@@ -94,17 +91,28 @@ class TestGcpdiagSearchCommand(unittest.TestCase):
 
     search_cmd._search_rules(args)
 
-    mock_load_lint_rules.assert_not_called()
-    mock_load_runbook_rules.assert_called_once()
+    mock_get_index.return_value.search.assert_called_once_with(
+        ['test-keyword', 'public'], 'runbook', products=['prod'], limit=2)
 
   @mock.patch('gcpdiag.search.command._print')
-  @mock.patch('gcpdiag.search.command._rank_runbook_rules')
-  @mock.patch('gcpdiag.search.command._rank_lint_rules')
-  def test_search_rules_output(self, mock_rank_lint_rules,
-                               mock_rank_runbook_rules, mock_print):
+  @mock.patch('gcpdiag.search.index.get_index')
+  def test_search_rules_output(self, mock_get_index, mock_print):
     """Test case for search rules output functionality."""
-    mock_rank_lint_rules.return_value = []
-    mock_rank_runbook_rules.return_value = []
+    mock_get_index.return_value = index.SearchIndex([{
+        'type': 'runbook',
+        'id': 'prod/rule1',
+        'product': 'prod',
+        'description': 'Test rule',
+        'full_description': 'Test rule for public issues',
+        'doc_url': 'https://gcpdiag.dev/runbook/diagnostic-trees/prod/rule1',
+        'parameters': {},
+        'fields': {
+            'name': 'prod/rule1',
+            'keywords': 'public',
+            'short_desc': 'Test rule',
+            'long_desc': 'Test rule for public issues',
+        },
+    }])
 
     args = self.parser.parse_args([
         'test-keyword', 'public', '--limit-per-type', '2', '--rule-type',
@@ -113,103 +121,53 @@ class TestGcpdiagSearchCommand(unittest.TestCase):
 
     search_cmd._search_rules(args)
 
-    mock_print.assert_called_once_with({})
+    mock_print.assert_called_once_with({
+        'runbook': [{
+            'type': 'runbook',
+            'id': 'prod/rule1',
+            'description': 'Test rule',
+            'full_description': 'Test rule for public issues',
+            'doc_url':
+                'https://gcpdiag.dev/runbook/diagnostic-trees/prod/rule1',
+            'parameters': {},
+        }]
+    })
 
-
-class TestRankingFunctions(unittest.TestCase):
-  """Unit tests for ranking functions in gcpdiag search command."""
-
-  # pylint: disable=protected-access
-
-  class TestDT1(DiagnosticTree):
-    id = 'rule1'
-    product = 'prod'
-    __doc__ = 'This is a test rule for test-issue'
-    keywords = ['issue-kw', 'public']
-
-  class TestDT2(DiagnosticTree):
-    id = 'rule2'
-    product = 'prod'
-    __doc__ = 'Another test rule for issue-kw2'
-    keywords = ['issue-kw2', 'engine']
-
-  class TestDT3(DiagnosticTree):
-    id = 'rule3'
-    product = 'another-prod'
-    __doc__ = 'Another test rule for storage'
-    keywords = ['storage']
-
-  def setUp(self):
-    self.runbook_rules = {
-        'rule1': self.TestDT1,
-        'rule2': self.TestDT2,
-        'rule3': self.TestDT3
-    }
-
-    self.lint_rules = [
-        LintRule(product='prod',
-                 rule_class='class1',
-                 rule_id='rule1',
-                 short_desc='Test lint rule for SSH',
-                 long_desc='Detailed desc about SSH and issue-kw2',
-                 keywords=['issue-kw', 'issue-kw2', 'lint']),
-        LintRule(product='prod',
-                 rule_class='class2',
-                 rule_id='rule2',
-                 short_desc='Another lint rule for engine',
-                 long_desc='Detailed desc about engine',
-                 keywords=['engine']),
-        LintRule(product='another-prod',
-                 rule_class='class1',
-                 rule_id='rule3',
-                 short_desc='Rule for storage',
-                 long_desc='Detailed desc about storage',
-                 keywords=['storage', 'public']),
-    ]
-
-  def test_rank_runbook_rules_max_heap(self):
-    """Test case for ensuring max-heap behavior in runbook rules ranking."""
-    args = Namespace(search=['test'], limit_per_type=2, product=['search'])
-    ranked_rules = search_cmd._rank_runbook_rules(self.runbook_rules, args)
-
-    self.assertEqual(len(ranked_rules), 2)
-    # Ensure the highest score is first
-    self.assertTrue(-ranked_rules[0][0] >= -ranked_rules[1][0])
-
-  def test_rank_runbook_rules_frequency(self):
-    """Test case for ensuring correct frequency calculation in runbook rules ranking."""
-    args = Namespace(search=['issue-kw', 'public'],
-                     limit_per_type=2,
-                     product=['search'])
-    ranked_rules = search_cmd._rank_runbook_rules(self.runbook_rules, args)
-
-    self.assertEqual(len(ranked_rules), 2)
-    score, name, _ = ranked_rules[0]
-    self.assertEqual(name, 'rule1')
-    self.assertEqual(-score, 6)  # 3 for keyword 'issue-kw' and 3 for 'public'
-
-  def test_rank_lint_rules_frequency(self):
-    """Test case for ensuring correct frequency calculation in lint rules ranking."""
-    args = Namespace(search=['issue-kw', 'issue-kw2'],
-                     limit_per_type=2,
-                     product=['prod'])
-    ranked_rules = search_cmd._rank_lint_rules(self.lint_rules, args)
-
-    self.assertEqual(len(ranked_rules), 1)
-    score, name, _ = ranked_rules[0]
-    self.assertEqual(name, 'prod/class1/rule1')
+  @mock.patch('gcpdiag.search.command._print')
+  @mock.patch('gcpdiag.search.index.get_index')
+  def test_search_rules_output_lint(self, mock_get_index, mock_print):
+    """Test case for the output of lint rules, without the index keys."""
+    mock_get_index.return_value = index.SearchIndex([{
+        'type': 'lint',
+        'id': 'prod/err/2024_001',
+        'product': 'prod',
+        'rule_class': 'ERR',
+        'rule_id': '2024_001',
+        'description': 'Test rule',
+        'full_description': 'Test rule for public issues',
+        'doc_url': 'https://gcpdiag.dev/rules/prod/ERR/2024_001',
+        'fields': {
+            'name': 'prod/ERR/2024_001',
+            'keywords': 'public',
+            'short_desc': 'Test rule',
+            'long_desc': 'Test rule for public issues',
+        },
+    }])
+
+    args = self.parser.parse_args(
+        ['public', '--rule-type', 'lint', '--format', 'json'])
+
+    with mock.patch('builtins.print') as mock_builtin_print:
+      search_cmd._search_rules(args)
+
+    mock_print.assert_not_called()
     self.assertEqual(
-        -score, 10
-    )  # 3 for keyword 'issue-kw', 'issue-kw2' and 2 for 'issue-kw2' in description
-
-  def test_rank_lint_rules_max_heap(self):
-    """Test case for ensuring max-heap behavior in lint rules ranking."""
-    args = Namespace(search=['lint', 'rule'],
-                     limit_per_type=3,
-                     product=['prod', 'another-prod'])
-    ranked_rules = search_cmd._rank_lint_rules(self.lint_rules, args)
-
-    self.assertEqual(len(ranked_rules), 3)
-    # Ensure the highest score is first
-    self.assertTrue(-ranked_rules[0][0] >= -ranked_rules[1][0])
-    self.assertTrue(-ranked_rules[1][0] >= -ranked_rules[2][0])
+        json.loads(mock_builtin_print.call_args[0][0]), {
+            'lint': [{
+                'type': 'lint',
+                'id': 'prod/err/2024_001',
+                'description': 'Test rule',
+                'full_description': 'Test rule for public issues',
+                'doc_url': 'https://gcpdiag.dev/rules/prod/ERR/2024_001',
+            }]
+        })
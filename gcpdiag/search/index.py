@@ -0,0 +1,270 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Search index of the gcpdiag lint rules and runbooks.
+
+The index contains the tokenized names, descriptions and keywords of all
+rules, as an inverted index, and everything needed to display the search
+results, so that `gcpdiag search` doesn't need to import the rule modules.
+Results are ranked with BM25, and search terms also match words starting with
+them.
+
+The index is generated at packaging time with:
+
+  python -m gcpdiag.search.index
+
+If it is missing or out of date (the rule modules were modified since it was
+generated), it is rebuilt and saved in the gcpdiag cache directory.
+"""
+
+import bisect
+import collections
+import json
+import logging
+import math
+import pathlib
+import re
+import sys
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from gcpdiag import config, lint, runbook
+from gcpdiag.lint import manifest
+
+INDEX_VERSION = 2
+INDEX_PATH = pathlib.Path(__file__).parent / 'search_index.json'
+
+# Weight of every field of the rules in the term frequencies.
+FIELD_WEIGHTS = {
+    'keywords': 3,
+    'name': 2,
+    'short_desc': 2,
+    'long_desc': 1,
+}
+# Weight of a word that starts with a search term (instead of being equal).
+PREFIX_MATCH_WEIGHT = 0.5
+# BM25 parameters
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+# Keys of the documents that are only used by the index, and not part of the
+# search results.
+INTERNAL_KEYS = ('product', 'rule_class', 'rule_id', 'fields')
+
+_GCPDIAG_DIR = pathlib.Path(__file__).parent.parent
+
+
+def tokenize(text: str) -> List[str]:
+  return re.findall(r'[a-z0-9]+', text.lower())
+
+
+def _source_files() -> Dict[str, float]:
+  """Modification times of the files the index is generated from."""
+  paths = list((_GCPDIAG_DIR / 'lint').glob('*/*.py')) + list(
+      (_GCPDIAG_DIR / 'runbook').glob('**/*.py'))
+  return {
+      str(p.relative_to(_GCPDIAG_DIR)): p.stat().st_mtime
+      for p in sorted(paths)
+      if not p.name.endswith('_test.py')
+  }
+
+
+def _lint_documents() -> Iterable[Dict[str, Any]]:
+  for entry in manifest.build_manifest()['modules'].values():
+    rule = lint.LintRule(product=entry['product'],
+                         rule_class=lint.LintRuleClass(entry['rule_class']),
+                         rule_id=entry['rule_id'],
+                         short_desc=entry['short_desc'],
+                         long_desc=entry['long_desc'],
+                         keywords=entry['keywords'])
+    yield {
+        'type': 'lint',
+        'id': str(rule).lower(),
+        'product': rule.product,
+        'rule_class': rule.rule_class.value,
+        'rule_id': rule.rule_id,
+        'description': rule.short_desc,
+        'full_description': '\n\n'.join(
+            d for d in [rule.short_desc, rule.long_desc] if d),
+        'doc_url': rule.doc_url,
+        'fields': {
+            'name': str(rule),
+            'keywords': ' '.join(rule.keywords),
+            'short_desc': rule.short_desc,
+            'long_desc': rule.long_desc,
+        },
+    }
+
+
+def _runbook_documents() -> Iterable[Dict[str, Any]]:
+  # pylint: disable=import-outside-toplevel
+  from gcpdiag.runbook import command as runbook_command
+
+  #pylint:disable=protected-access
+  runbook_command._load_runbook_rules(runbook.__name__)
+  for name, runbook_class in sorted(runbook.RunbookRegistry.items()):
+    rule = runbook_class(None)
+    parameters = {}
+    for param_name, param in rule.parameters.items():
+      parameters[param_name] = dict(param)
+      # Make the type serializable
+      if 'type' in param:
+        parameters[param_name]['type'] = param['type'].__name__
+    yield {
+        'type': 'runbook',
+        'id': name,
+        'product': rule.product,
+        'description': rule.short_desc,
+        'full_description': rule.__doc__,
+        'doc_url': rule.doc_url,
+        'parameters': parameters,
+        'fields': {
+            'name': rule.id,
+            'keywords': ' '.join(getattr(rule, 'keywords', [])),
+            'short_desc': rule.short_desc,
+            'long_desc': rule.__doc__,
+        },
+    }
+
+
+class SearchIndex:
+  """Inverted index of rule documents, with BM25 ranking."""
+
+  def __init__(self, documents: List[Dict[str, Any]]):
+    self.documents = documents
+    self.doc_lengths: List[float] = []
+    # term -> {document index -> weighted term frequency}
+    self.postings: Dict[str, Dict[int, float]] = collections.defaultdict(dict)
+    for i, doc in enumerate(documents):
+      length = 0.0
+      for field, text in doc['fields'].items():
+        weight = FIELD_WEIGHTS[field]
+        for term in tokenize(text):
+          self.postings[term][i] = self.postings[term].get(i, 0) + weight
+          length += weight
+      self.doc_lengths.append(length)
+    self.avg_doc_length = (sum(self.doc_lengths) /
+                           len(self.doc_lengths)) if self.doc_lengths else 0
+    self.terms = sorted(self.postings)
+
+  def _matching_terms(self, token: str) -> Iterable[Tuple[str, float]]:
+    """Yield the indexed terms matching a search token, with their weight."""
+    i = bisect.bisect_left(self.terms, token)
+    while i < len(self.terms) and self.terms[i].startswith(token):
+      term = self.terms[i]
+      yield term, 1.0 if term == token else PREFIX_MATCH_WEIGHT
+      i += 1
+
+  def _idf(self, term: str) -> float:
+    df = len(self.postings[term])
+    n = len(self.documents)
+    return math.log(1 + (n - df + 0.5) / (df + 0.5))
+
+  def search(self,
+             search_terms: Iterable[str],
+             rule_type: str,
+             products: Optional[Iterable[str]] = None,
+             limit: int = 10) -> List[Tuple[float, Dict[str, Any]]]:
+    """Return the best matching documents of `rule_type`, best first.
+
+    `products` (-p/--product) are rule patterns for lint rules (e.g. `gke` or
+    `gke/WARN/*`, see lint.LintRulesPattern), and product names for runbooks.
+    """
+    allowed = None
+    if products:
+      products = list(products)
+      lint_patterns = [lint.LintRulesPattern(p) for p in products
+                      ] if rule_type == 'lint' else []
+      allowed = {
+          i for i, doc in enumerate(self.documents)
+          if doc['type'] == rule_type and
+          _match_products(doc, products, lint_patterns)
+      }
+    scores: Dict[int, float] = collections.defaultdict(float)
+    for token in {t for s in search_terms for t in tokenize(s)}:
+      for term, term_weight in self._matching_terms(token):
+        idf = self._idf(term)
+        for i, tf in self.postings[term].items():
+          doc = self.documents[i]
+          if doc['type'] != rule_type:
+            continue
+          if allowed is not None and i not in allowed:
+            continue
+          norm = 1 - BM25_B + BM25_B * self.doc_lengths[i] / self.avg_doc_length
+          scores[i] += term_weight * idf * tf * (BM25_K1 + 1) / (tf +
+                                                                  BM25_K1 * norm)
+    ranked = sorted(scores.items(),
+                    key=lambda s: (-s[1], self.documents[s[0]]['id']))
+    return [(score, self.documents[i]) for i, score in ranked[:limit]]
+
+
+def _match_products(doc: Dict[str, Any], products: List[str],
+                    lint_patterns: List[lint.LintRulesPattern]) -> bool:
+  if doc['type'] == 'lint':
+    rule = lint.LintRule(product=doc['product'],
+                         rule_class=lint.LintRuleClass(doc['rule_class']),
+                         rule_id=doc['rule_id'],
+                         short_desc=doc['description'],
+                         long_desc='',
+                         keywords=[])
+    return any(p.match_rule(rule) for p in lint_patterns)
+  return doc['product'] in products
+
+
+def build_index_data() -> Dict[str, Any]:
+  return {
+      'version': INDEX_VERSION,
+      'sources': _source_files(),
+      'documents': list(_lint_documents()) + list(_runbook_documents()),
+  }
+
+
+def write_index(path: pathlib.Path = INDEX_PATH,
+                data: Optional[Dict[str, Any]] = None) -> None:
+  with open(path, 'w', encoding='utf-8') as f:
+    json.dump(data or build_index_data(), f, default=str)
+
+
+def _load_index_data(path: pathlib.Path) -> Optional[Dict[str, Any]]:
+  try:
+    with open(path, encoding='utf-8') as f:
+      data = json.load(f)
+  except (OSError, ValueError):
+    return None
+  if data.get('version') != INDEX_VERSION:
+    return None
+  if not getattr(sys, 'frozen', False) and data.get(
+      'sources') != _source_files():
+    logging.debug('search index %s is out of date', path)
+    return None
+  return data
+
+
+def get_index() -> SearchIndex:
+  """Return the search index, rebuilding it if it is missing or stale."""
+  cache_path = pathlib.Path(config.get_cache_dir()) / 'search_index.json'
+  for path in [INDEX_PATH, cache_path]:
+    data = _load_index_data(path)
+    if data:
+      return SearchIndex(data['documents'])
+  logging.debug('building search index')
+  data = build_index_data()
+  try:
+    cache_path.parent.mkdir(parents=True, exist_ok=True)
+    write_index(cache_path, data)
+  except OSError as err:
+    logging.warning("can't save search index: %s", err)
+  return SearchIndex(data['documents'])
+
+
+if __name__ == '__main__':
+  write_index()
@@ -0,0 +1,129 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Test code in index.py."""
+
+import json
+import pathlib
+import tempfile
+import unittest
+
+from gcpdiag.search import index
+
+
+def _doc(rule_type, rule_id, product, short_desc, long_desc, keywords):
+  doc = {
+      'type': rule_type,
+      'id': rule_id,
+      'product': product,
+      'description': short_desc,
+      'full_description': long_desc,
+      'doc_url': f'https://gcpdiag.dev/{rule_id}',
+      'fields': {
+          'name': rule_id,
+          'keywords': ' '.join(keywords),
+          'short_desc': short_desc,
+          'long_desc': long_desc,
+      },
+  }
+  if rule_type == 'lint':
+    _, doc['rule_class'], doc['rule_id'] = rule_id.split('/')
+  return doc
+
+
+class SearchIndexTest(unittest.TestCase):
+  """Test the BM25 ranking of the search index."""
+
+  def setUp(self):
+    self.index = index.SearchIndex([
+        _doc('lint', 'prod/ERR/rule1', 'prod', 'Test lint rule for SSH',
+             'Detailed desc about SSH and issue-kw2',
+             ['issue-kw', 'issue-kw2', 'lint']),
+        _doc('lint', 'prod/WARN/rule2', 'prod',
+             'Another lint rule for engine', 'Detailed desc about engine',
+             ['engine']),
+        _doc('lint', 'another-prod/ERR/rule3', 'another-prod',
+             'Rule for storage', 'Detailed desc about storage',
+             ['storage', 'public']),
+        _doc('runbook', 'prod/rule1', 'prod', 'Test runbook',
+             'This is a test rule for test-issue', ['issue-kw', 'public']),
+    ])
+
+  def test_tokenize(self):
+    self.assertEqual(index.tokenize('GCE SSH/RDP issue-kw2'),
+                     ['gce', 'ssh', 'rdp', 'issue', 'kw2'])
+
+  def test_search_ranking(self):
+    results = self.index.search(['ssh'], 'lint')
+    self.assertEqual([d['id'] for _, d in results], ['prod/ERR/rule1'])
+
+    results = self.index.search(['storage', 'public'], 'lint')
+    self.assertEqual(results[0][1]['id'], 'another-prod/ERR/rule3')
+    scores = [s for s, _ in self.index.search(['rule', 'lint'], 'lint')]
+    self.assertEqual(len(scores), 3)
+    self.assertEqual(scores, sorted(scores, reverse=True))
+
+  def test_search_rule_type(self):
+    results = self.index.search(['public'], 'runbook')
+    self.assertEqual([d['id'] for _, d in results], ['prod/rule1'])
+
+  def test_search_product_and_limit(self):
+    results = self.index.search(['desc'], 'lint', products=['prod'])
+    self.assertEqual({d['product'] for _, d in results}, {'prod'})
+    self.assertEqual(len(self.index.search(['desc'], 'lint', limit=1)), 1)
+
+  def test_search_rule_patterns(self):
+    results = self.index.search(['desc'], 'lint', products=['prod/ERR'])
+    self.assertEqual([d['id'] for _, d in results], ['prod/ERR/rule1'])
+    results = self.index.search(['desc'], 'lint', products=['*/ERR/*'])
+    self.assertEqual({d['id'] for _, d in results},
+                     {'prod/ERR/rule1', 'another-prod/ERR/rule3'})
+    results = self.index.search(['desc'], 'lint', products=['WARN'])
+    self.assertEqual([d['id'] for _, d in results], ['prod/WARN/rule2'])
+    # runbooks are selected by product name only
+    self.assertEqual(
+        self.index.search(['public'], 'runbook', products=['prod/ERR']), [])
+    self.assertEqual(
+        len(self.index.search(['public'], 'runbook', products=['prod'])), 1)
+
+  def test_search_prefix(self):
+    exact = self.index.search(['engine'], 'lint')
+    prefix = self.index.search(['eng'], 'lint')
+    self.assertEqual([d['id'] for _, d in prefix], ['prod/WARN/rule2'])
+    self.assertLess(prefix[0][0], exact[0][0])
+
+  def test_no_match(self):
+    self.assertEqual(self.index.search(['nonexistent'], 'lint'), [])
+
+
+class IndexFileTest(unittest.TestCase):
+  """Test generating and loading the index file."""
+
+  def test_write_and_load(self):
+    with tempfile.TemporaryDirectory() as tmpdir:
+      path = pathlib.Path(tmpdir) / 'search_index.json'
+      # pylint: disable=protected-access
+      self.assertIsNone(index._load_index_data(path))
+      index.write_index(path)
+      data = index._load_index_data(path)
+      ids = {d['id'] for d in data['documents']}
+      self.assertIn('gke/err/2021_001', ids)
+      self.assertIn('gce/ssh', ids)
+
+      # a modified rule module makes the index out of date
+      with open(path, encoding='utf-8') as f:
+        data = json.load(f)
+      data['sources']['lint/gke/err_2021_001_logging_perm.py'] -= 1
+      with open(path, 'w', encoding='utf-8') as f:
+        json.dump(data, f)
+      self.assertIsNone(index._load_index_data(path))
@@ -21,6 +21,16 @@ for root, dirs, files in os.walk("gcpdiag/runbook"):
       path = os.path.join(root, f)
       a.datas.append((path, path, 'DATA'))
 
+# add the lint rules manifest (generated with: make rules-manifest)
+if os.path.exists("gcpdiag/lint/rules_manifest.json"):
+  a.datas.append(("gcpdiag/lint/rules_manifest.json",
+                  "gcpdiag/lint/rules_manifest.json", 'DATA'))
+
+# add the search index (generated with: make search-index)
+if os.path.exists("gcpdiag/search/search_index.json"):
+  a.datas.append(("gcpdiag/search/search_index.json",
+                  "gcpdiag/search/search_index.json", 'DATA'))
+
 pyz = PYZ(a.pure, a.zipped_data,
              cipher=block_cipher)
 exe = EXE(pyz,